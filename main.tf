@@ -85,6 +85,7 @@ module "lambda_function" {
   private_subnet_ids        = module.vpc.private_subnet_ids
   app_security_group_id     = module.security_group.app_security_group_id
   # secret_key                = var.secret_key
+  session_signing_keys      = var.session_signing_keys
   # image_uri                 = var.image_uri
   # Layers
   # libreoffice_layer_arn     = var.libreoffice_layer_arn # Ensure this is set to the correct ARN for your region and runtime
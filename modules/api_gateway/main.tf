@@ -12,6 +12,9 @@ resource "aws_api_gateway_rest_api" "main_api" {
   name        = var.api_name
   description = "API Gateway for the PDF Converter application"
 
+  # Lets compressed static assets, PDFs and uploads pass through the Lambda proxy as binary.
+  binary_media_types = ["*/*"]
+
   tags = {
     Name = var.api_name
   }
@@ -58,6 +58,12 @@ resource "aws_iam_role_policy" "lambda_s3_access" {
           "arn:aws:s3:::${var.s3_bucket_name}/*"
         ]
       },
+      {
+        # Lets HeadObject report a missing key as 404 instead of 403 (download existence check).
+        Effect   = "Allow",
+        Action   = ["s3:ListBucket"],
+        Resource = "arn:aws:s3:::${var.s3_bucket_name}"
+      },
       {
         Effect = "Allow",
         Action = [
@@ -167,6 +173,8 @@ resource "aws_lambda_function" "pdf_converter_app" {
       # SERCRET_KEY = var.secret_key
       API_GATEWAY_BASE_PATH = "/prod"
       LIBREOFFICE_PATH = "/mnt/libreoffice/program/soffice.bin"
+      # "kid:secret" pairs; the first signs new session cookies (see sessions.py)
+      SESSION_SIGNING_KEYS = var.session_signing_keys
       # Add any other environment variables your app needs
     }
   }
@@ -174,4 +182,15 @@ resource "aws_lambda_function" "pdf_converter_app" {
   tags = {
     Name = var.function_name
   }
-}
\ No newline at end of file
+}
+# 4. Schema migrations
+# Applies pending database migrations (pdf_converter_FastAPI_app/migrations.py) once per
+# deployed package, so cold starts never run DDL.
+resource "aws_lambda_invocation" "migrate" {
+  function_name = aws_lambda_function.pdf_converter_app.function_name
+  input         = jsonencode({ action = "migrate" })
+
+  triggers = {
+    source_code_hash = var.source_code_hash_app
+  }
+}
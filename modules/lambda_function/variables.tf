@@ -49,6 +49,12 @@ variable "db_password" {
   sensitive   = true # Mark as sensitive to prevent logging in plaintext
 }
 
+variable "session_signing_keys" {
+  description = "Comma-separated kid:secret pairs used to sign session cookies; the first one signs."
+  type        = string
+  sensitive   = true
+}
+
 variable "db_port" {
   description = "The port for the database."
   type        = string
@@ -0,0 +1,225 @@
+# assets.py
+import os
+import sys
+import hashlib
+import logging
+import tempfile
+import mimetypes
+import threading
+import jinja2
+from starlette.responses import HTMLResponse, Response
+from compression import SUPPORTED_ENCODINGS, choose_encoding, compress, is_compressible
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(APP_DIR, "templates")
+STATIC_DIR = os.getenv("STATIC_DIR", os.path.join(APP_DIR, "static"))
+STATIC_URL_PREFIX = "/static"
+# Fingerprinted URLs change whenever the file does, so browsers may keep them for a year.
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+STATIC_COMPRESS_MIN_SIZE = int(os.getenv("STATIC_COMPRESS_MIN_SIZE", "1024"))
+# Compiled templates are read from the directory shipped with the package (built by
+# `python assets.py build`) and written to a writable one; /tmp lives as long as the
+# Lambda execution environment, so a re-initialised runtime skips compiling too.
+TEMPLATE_BYTECODE_DIR = os.getenv("TEMPLATE_BYTECODE_DIR", os.path.join(TEMPLATES_DIR, ".bytecode"))
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR",
+                                        os.path.join(tempfile.gettempdir(), "jinja_bytecode"))
+# Templates only change on deploy; skip Jinja's per-render mtime check unless developing locally.
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "false").lower() == "true"
+
+
+# -------------------- Template Bytecode Cache --------------------
+class LayeredBytecodeCache(jinja2.BytecodeCache):
+    """
+    Jinja bytecode cache over a read-only directory and a writable one. Entries are keyed
+    by template name only, so bytecode compiled in the build directory is found under
+    /var/task; Jinja still checks the source checksum and Python version before using it.
+    """
+
+    def __init__(self, read_only_dir: str = TEMPLATE_BYTECODE_DIR, writable_dir: str = TEMPLATE_BYTECODE_CACHE_DIR):
+        self.read_only_dir = read_only_dir
+        self.writable_dir = writable_dir
+
+    def get_cache_key(self, name: str, filename: str | None = None) -> str:
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()
+
+    def _path(self, directory: str, bucket) -> str:
+        return os.path.join(directory, f"__jinja2_{bucket.key}.cache")
+
+    def load_bytecode(self, bucket):
+        for directory in (self.read_only_dir, self.writable_dir):
+            try:
+                with open(self._path(directory, bucket), "rb") as f:
+                    bucket.load_bytecode(f)
+            except OSError:
+                continue
+            if bucket.code is not None:
+                return
+
+    def dump_bytecode(self, bucket):
+        path = self._path(self.writable_dir, bucket)
+        try:
+            os.makedirs(self.writable_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.writable_dir, delete=False) as f:
+                bucket.write_bytecode(f)
+            os.replace(f.name, path)
+        except OSError as e:
+            logger.warning(f"Could not write template bytecode to {path}: {e}")
+
+
+def configure_templates(templates, static_assets: "StaticAssets"):
+    """Installs the bytecode cache and the asset_url() template global on a Jinja2Templates."""
+    env = templates.env
+    env.bytecode_cache = LayeredBytecodeCache()
+    env.auto_reload = TEMPLATE_AUTO_RELOAD
+    env.globals["asset_url"] = static_assets.url
+
+
+# -------------------- Static Assets --------------------
+class StaticAsset:
+    def __init__(self, name: str, data: bytes, content_type: str):
+        self.name = name
+        self.content_type = content_type
+        self.fingerprint = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        self.fingerprinted_name = f"{stem}.{self.fingerprint}{ext}"
+        # encoding -> body; identity is always present.
+        self.variants = {"identity": data}
+        if len(data) >= STATIC_COMPRESS_MIN_SIZE and is_compressible(content_type):
+            for encoding in SUPPORTED_ENCODINGS:
+                compressed = compress(data, encoding, best=True)
+                if len(compressed) < len(data):
+                    self.variants[encoding] = compressed
+
+
+class StaticAssets:
+    """
+    Files under STATIC_DIR, loaded on first use and kept in memory with their
+    compressed variants. Templates link to fingerprinted URLs via
+    asset_url(); those are served with a long immutable Cache-Control, while
+    un-fingerprinted or outdated URLs are served with no-cache.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR, url_prefix: str = STATIC_URL_PREFIX):
+        self.directory = os.path.abspath(directory)
+        self.url_prefix = url_prefix
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> StaticAsset | None:
+        with self._lock:
+            if name in self._assets:
+                return self._assets[name]
+        path = os.path.abspath(os.path.join(self.directory, name))
+        if not path.startswith(self.directory + os.sep) or not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        asset = StaticAsset(name, data, content_type)
+        with self._lock:
+            return self._assets.setdefault(name, asset)
+
+    def url(self, name: str) -> str:
+        """Fingerprinted URL path of a static file (without the root_path)."""
+        asset = self.get(name)
+        if asset is None:
+            logger.error(f"Static asset not found: {name}")
+            return f"{self.url_prefix}/{name}"
+        return f"{self.url_prefix}/{asset.fingerprinted_name}"
+
+    def _resolve(self, requested: str) -> tuple[StaticAsset | None, bool]:
+        """Returns the asset for a requested path and whether the URL carried its current fingerprint."""
+        stem, ext = os.path.splitext(requested)
+        base, dot, fingerprint = stem.rpartition(".")
+        if dot and len(fingerprint) == 12:
+            asset = self.get(base + ext)
+            if asset is not None:
+                return asset, asset.fingerprint == fingerprint
+        return self.get(requested), False
+
+    def response(self, requested: str, accept_encoding: str | None = None,
+                 if_none_match: str | None = None) -> Response | None:
+        """Builds the response for GET /static/<requested>, or None if there is no such file."""
+        asset, current = self._resolve(requested)
+        if asset is None:
+            return None
+        encoding = choose_encoding(accept_encoding, [e for e in SUPPORTED_ENCODINGS if e in asset.variants])
+        etag = f'"{asset.fingerprint}"' if encoding == "identity" else f'"{asset.fingerprint}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={STATIC_MAX_AGE}, immutable" if current else "public, no-cache",
+        }
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], media_type=asset.content_type, headers=headers)
+
+
+# -------------------- Static Page Cache --------------------
+class StaticPageCache:
+    """
+    Rendered HTML of pages whose only input is root_path (the login, register and
+    forgot-password forms without messages), rendered once per (template, root_path).
+    Compressed variants are made on first request for each encoding and kept, so the
+    compression middleware never recompresses these pages; browsers revalidate with ETag / 304.
+    """
+
+    def __init__(self, env: jinja2.Environment):
+        self.env = env
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def _variant(self, template_name: str, root_path: str, encoding: str) -> tuple[bytes, str]:
+        key = (template_name, root_path)
+        with self._lock:
+            page = self._pages.get(key)
+            variant = page.get(encoding) if page else None
+        if variant is not None:
+            return variant
+        if page is None:
+            body = self.env.get_template(template_name).render(root_path=root_path).encode("utf-8")
+            page = {"identity": (body, hashlib.sha256(body).hexdigest()[:16])}
+        body, digest = page["identity"]
+        if encoding != "identity":
+            variant = (compress(body, encoding, best=True), digest)
+        with self._lock:
+            page = self._pages.setdefault(key, page)
+            return page.setdefault(encoding, variant or page["identity"])
+
+    def response(self, template_name: str, root_path: str, if_none_match: str | None = None,
+                 accept_encoding: str | None = None) -> Response:
+        encoding = choose_encoding(accept_encoding)
+        body, digest = self._variant(template_name, root_path, encoding)
+        etag = f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return HTMLResponse(body, headers=headers)
+
+
+# -------------------- Build Step --------------------
+def build_bytecode(templates_dir: str = TEMPLATES_DIR, output_dir: str = TEMPLATE_BYTECODE_DIR) -> list[str]:
+    """Compiles every template into output_dir, to be shipped with the Lambda package."""
+    cache = LayeredBytecodeCache(read_only_dir=output_dir, writable_dir=output_dir)
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(templates_dir), bytecode_cache=cache)
+    names = [name for name in env.list_templates() if name.endswith(".html")]
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        sys.exit("usage: python assets.py build")
+    compiled = build_bytecode()
+    print(f"Compiled {len(compiled)} templates into {TEMPLATE_BYTECODE_DIR}")
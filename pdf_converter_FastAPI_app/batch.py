@@ -0,0 +1,86 @@
+# batch.py
+import os
+import logging
+import zipfile
+from formats import EXTENSIONS
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+MAX_BATCH_UPLOAD_SIZE = int(os.getenv("MAX_BATCH_UPLOAD_SIZE", str(500 * 1024 * 1024)))
+# Documents handed to one converter call; the CLI backend converts them in one soffice.bin run.
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "10"))
+# Converter calls running at the same time for one batch.
+BATCH_CONVERT_CONCURRENCY = int(os.getenv("BATCH_CONVERT_CONCURRENCY", "2"))
+# ZIP members are only extracted with a known extension; their format is then detected from the content.
+SUPPORTED_EXTENSIONS = tuple(EXTENSIONS)
+
+
+class BatchError(Exception):
+    """Raised when a batch upload as a whole is unusable (bad ZIP, too many files)."""
+
+
+def is_supported(filename: str) -> bool:
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def chunked(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def extract_documents(zip_path: str, dest_dir: str, max_member_size: int) -> list[tuple[str, str | None, str | None]]:
+    """
+    Extracts supported documents from a ZIP archive into dest_dir.
+    Returns (original name, extracted path or None, error or None) per document member;
+    member paths are never used on disk, so archives cannot write outside dest_dir.
+    """
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile as e:
+        raise BatchError(f"Invalid ZIP archive: {e}") from e
+
+    with archive:
+        members = [m for m in archive.infolist() if not m.is_dir() and not os.path.basename(m.filename).startswith(".")]
+        if len(members) > MAX_BATCH_FILES:
+            raise BatchError(f"ZIP archive contains more than {MAX_BATCH_FILES} files.")
+        documents = []
+        for index, member in enumerate(members):
+            name = os.path.basename(member.filename)
+            if not is_supported(name):
+                documents.append((name, None, "Unsupported file type."))
+                continue
+            if member.file_size > max_member_size:
+                documents.append((name, None, "File exceeds the maximum upload size."))
+                continue
+            path = os.path.join(dest_dir, f"zip_{index}{os.path.splitext(name)[1].lower()}")
+            with archive.open(member) as source, open(path, "wb") as target:
+                # file_size comes from the archive header, so cap what is actually written too.
+                written = 0
+                while chunk := source.read(1024 * 1024):
+                    written += len(chunk)
+                    if written > max_member_size:
+                        break
+                    target.write(chunk)
+            if written > max_member_size:
+                os.remove(path)
+                documents.append((name, None, "File exceeds the maximum upload size."))
+                continue
+            documents.append((name, path, None))
+        return documents
+
+
+def build_zip(entries: list[tuple[str, str]], zip_path: str):
+    """Writes (archive name, file path) entries into a new ZIP; PDFs are stored, not recompressed."""
+    used = set()
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, path in entries:
+            stem, ext = os.path.splitext(arcname)
+            candidate, counter = arcname, 1
+            while candidate in used:
+                candidate = f"{stem} ({counter}){ext}"
+                counter += 1
+            used.add(candidate)
+            archive.write(path, candidate)
@@ -0,0 +1,76 @@
+# benchmarks/compression.py
+"""
+Bytes on the wire and CPU time per request, per endpoint and Accept-Encoding.
+
+Run from pdf_converter_FastAPI_app/:
+    python benchmarks/compression.py --requests 200
+
+Requests go through the ASGI app in-process with a session cookie, so the numbers
+are the app's own cost: "wire" is the response body as sent (compressed if the
+client accepts it), "cpu" is process time per request including rendering (and
+the test client's own decompression, which a browser would do instead).
+"/" and "/register" come from the pre-compressed page cache; "/?error=..." is
+rendered and compressed on every request by the middleware.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+ENCODINGS = ["identity", "gzip", "br"]
+
+
+async def measure(client, path: str, encoding: str, requests: int) -> tuple[int, int, float]:
+    headers = {"Accept-Encoding": encoding}
+    response = await client.get(path, headers=headers)
+    assert response.status_code == 200, (path, response.status_code)
+    started = time.process_time()
+    for _ in range(requests):
+        await client.get(path, headers=headers)
+    cpu = (time.process_time() - started) / requests
+    return response.num_bytes_downloaded, len(response.content), cpu
+
+
+async def main_async(args):
+    import httpx
+    import main
+    import sessions
+
+    for i in range(50):
+        main.conversion_log.record(f"bench-{i:04d}", "bench", filename=f"quarterly-report-{i}.docx",
+                                   status="completed", input_size=48213 + i, output_size=91877 + i, page_count=12,
+                                   timings={"receive": 0.012, "convert": 1.734, "upload": 0.211})
+    main.conversion_log.flush()
+
+    endpoints = ["/", "/register", "/?error=Invalid%20username%20or%20password", "/dashboard",
+                 "/conversions?limit=50", "/conversions?limit=5", "/auth/stats",
+                 main.static_assets.url("css/dashboard.css")]
+    transport = httpx.ASGITransport(app=main.app)
+    cookies = {sessions.SESSION_COOKIE_NAME: sessions.issue_session("bench")}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        print(f"{'endpoint':<46}" + "".join(f"{e:>24}" for e in ENCODINGS))
+        for path in endpoints:
+            row = f"{path[:45]:<46}"
+            for encoding in ENCODINGS:
+                wire, size, cpu = await measure(client, path, encoding, args.requests)
+                row += f"{wire:>8} B/{size:>6} {cpu * 1e6:>6.0f}us"
+            print(row)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and encoding")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("CONVERTER_BACKEND", "fake")
+    os.environ.setdefault("CONVERSION_LOG_BACKEND", "memory")
+    asyncio.run(main_async(args))
@@ -0,0 +1,75 @@
+# benchmarks/db_login_latency.py
+"""
+Login latency with and without the PostgreSQL connection pool.
+
+Needs a reachable PostgreSQL configured through DB_HOST, DB_NAME, DB_USER,
+DB_PASSWORD and DB_PORT. Run from pdf_converter_FastAPI_app/:
+    python benchmarks/db_login_latency.py --iterations 200
+
+Reports verify_user() (one query plus a PBKDF2 check) and get_user_by_username()
+(query only, where connection setup dominates) for both modes, plus the
+database round-trips each call costs so query regressions show up as a count.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+USERNAME = "bench_login_user"
+EMAIL = "bench_login_user@example.com"
+PASSWORD = "Bench-Passw0rd!"
+
+
+def measure(func, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(label: str, samples: list[float]):
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<40} p50={statistics.median(samples) * 1000:8.2f} ms  p99={p99 * 1000:8.2f} ms")
+
+
+def round_trips(database, func) -> int:
+    before = database.db_round_trip_count()
+    func()
+    return database.db_round_trip_count() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    import database
+
+    if database.get_user_by_username(USERNAME) is None:
+        success, message = database.create_user(USERNAME, EMAIL, PASSWORD)
+        if not success:
+            sys.exit(f"Could not create benchmark user: {message}")
+
+    for pooled in (False, True):
+        database.DB_POOL_ENABLED = pooled
+        mode = "pool" if pooled else "no pool"
+        # One warm-up call so the pooled run does not include creating the pool.
+        assert database.verify_user(USERNAME, PASSWORD), "benchmark user failed to log in"
+        report(f"verify_user ({mode})", measure(lambda: database.verify_user(USERNAME, PASSWORD), args.iterations))
+        report(f"get_user_by_username ({mode})", measure(lambda: database.get_user_by_username(USERNAME), args.iterations))
+
+    # Pool health checks and rollbacks on release are not included; run with the pool warm.
+    print(f"round-trips per verify_user:          {round_trips(database, lambda: database.verify_user(USERNAME, PASSWORD))}")
+    print(f"round-trips per update_user_password: "
+          f"{round_trips(database, lambda: database.update_user_password(EMAIL, PASSWORD))}")
+
+
+if __name__ == "__main__":
+    main()
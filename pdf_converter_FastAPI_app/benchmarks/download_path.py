@@ -0,0 +1,129 @@
+# benchmarks/download_path.py
+"""
+Microbenchmark of GET /download/{file_id}: presigning on every request vs. the cached
+presigned URLs and HEAD existence check in downloads.py.
+
+Run from pdf_converter_FastAPI_app/:
+    python benchmarks/download_path.py --requests 2000 --files 20
+
+URLs are signed by a real boto3 S3 client with dummy credentials (signing is local);
+head_object is a stand-in that sleeps for --head-latency seconds, and one file in
+ten is "missing". Each mode reports the direct cost of one lookup and the latency of
+the whole request through the ASGI app.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+import statistics
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+BUCKET = "bench-bucket"
+
+
+class HeadLatencyS3Client:
+    """Real presigning; head_object sleeps like a network round-trip and 404s for missing keys."""
+
+    def __init__(self, latency: float, missing: set):
+        import boto3
+        self._client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="AKIDBENCH",
+                                    aws_secret_access_key="bench-secret")
+        self.latency = latency
+        self.missing = missing
+
+    def generate_presigned_url(self, *args, **kwargs):
+        return self._client.generate_presigned_url(*args, **kwargs)
+
+    def head_object(self, Bucket, Key):
+        from botocore.exceptions import ClientError
+        time.sleep(self.latency)
+        if Key in self.missing:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": 1024}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def modes():
+    from downloads import PresignedUrlCache
+    # max_entries=0 stores nothing, i.e. every request signs (and HEADs) again.
+    return {
+        "sign every request (no HEAD)": lambda: PresignedUrlCache(check_exists=False, max_entries=0),
+        "sign + HEAD every request": lambda: PresignedUrlCache(check_exists=True, max_entries=0),
+        "cached URL + cached HEAD": lambda: PresignedUrlCache(check_exists=True),
+    }
+
+
+async def run_mode(client, main, make_cache, file_ids: list[str], requests: int) -> tuple[list, list]:
+    main.download_urls = make_cache()
+    picks = [random.choice(file_ids) for _ in range(requests)]
+
+    direct = []
+    for file_id in picks:
+        started = time.perf_counter()
+        main.download_urls.get(main.s3_client, BUCKET, f"converted_pdfs/{file_id}.pdf")
+        direct.append(time.perf_counter() - started)
+
+    main.download_urls = make_cache()
+    end_to_end = []
+    for file_id in picks:
+        started = time.perf_counter()
+        response = await client.get(f"/download/{file_id}")
+        end_to_end.append(time.perf_counter() - started)
+        assert response.status_code in (303, 404), response.status_code
+    return direct, end_to_end
+
+
+async def main_async(args):
+    import httpx
+    import main
+    import sessions
+
+    file_ids = [str(uuid.uuid4()) for _ in range(args.files)]
+    missing = {f"converted_pdfs/{file_id}.pdf" for file_id in file_ids[::10]}
+    main.S3_BUCKET_NAME = BUCKET
+    # One warning per 404 would dominate the output.
+    main.logger.setLevel(logging.ERROR)
+    main.s3_client = HeadLatencyS3Client(args.head_latency, missing)
+    # Downloads are only served to the user who converted the file.
+    for file_id in file_ids:
+        main.conversion_log.record(file_id, "bench", status="completed")
+
+    transport = httpx.ASGITransport(app=main.app)
+    cookies = {sessions.SESSION_COOKIE_NAME: sessions.issue_session("bench")}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        for name, make_cache in modes().items():
+            direct, end_to_end = await run_mode(client, main, make_cache, file_ids, args.requests)
+            print(f"{name:<30} lookup p50={statistics.median(direct) * 1e6:7.1f} us "
+                  f"mean={statistics.mean(direct) * 1e6:7.1f} us  "
+                  f"request p50={statistics.median(end_to_end) * 1000:6.2f} ms "
+                  f"p99={percentile(end_to_end, 99) * 1000:6.2f} ms  "
+                  f"({len(end_to_end) / sum(end_to_end):7.0f} req/s)")
+        print(f"cache stats: {main.download_urls.stats()}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=20, help="distinct file_ids requested")
+    parser.add_argument("--head-latency", type=float, default=0.005, help="seconds per HEAD request")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("CONVERTER_BACKEND", "fake")
+    os.environ.setdefault("CONVERSION_LOG_BACKEND", "memory")
+    random.seed(1575)
+    asyncio.run(main_async(args))
@@ -0,0 +1,120 @@
+# benchmarks/event_loop_latency.py
+"""
+Load test: p50/p99 latency of GET / while conversions run concurrently.
+
+Run from pdf_converter_FastAPI_app/:
+    python benchmarks/event_loop_latency.py --conversions 8 --requests 200
+
+S3 is replaced by an in-memory stand-in with a fixed per-call delay and the
+"cli" converter runs a shell stand-in for xvfb-run/soffice.bin that sleeps, so
+any blocking call on the event loop shows up directly in the GET / numbers.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+FAKE_SOFFICE = """#!/bin/sh
+# Arguments: <soffice> --headless --nologo --convert-to pdf <input> --outdir <dir>
+sleep "${FAKE_CONVERTER_DELAY:-0.5}"
+input="$6"; outdir="$8"
+name=$(basename "$input"); printf '%%PDF-1.4\\n%%%%EOF\\n' > "$outdir/${name%.*}.pdf"
+"""
+
+
+class SlowS3Client:
+    """Blocking S3 stand-in: every call sleeps like a real network round-trip."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def upload_file(self, filename, bucket, key):
+        time.sleep(self.latency)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://example.invalid/{Params['Key']}"
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def measure_get(client, count: int) -> list[float]:
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get("/")
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    return latencies
+
+
+async def convert_forever(client, stop: asyncio.Event, done: list):
+    while not stop.is_set():
+        # Unique content so the conversion cache never short-circuits the run.
+        payload = uuid.uuid4().bytes * 256
+        response = await client.post("/convert", files={"file": ("bench.docx", payload)})
+        assert response.json()["status"] == "completed", response.text
+        done.append(1)
+
+
+async def main_async(args):
+    import httpx
+    import main
+    import sessions
+
+    main.s3_client = SlowS3Client(args.s3_latency)
+    transport = httpx.ASGITransport(app=main.app)
+    # /convert requires a signed session.
+    cookies = {sessions.SESSION_COOKIE_NAME: sessions.issue_session("bench")}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        idle = await measure_get(client, args.requests)
+
+        stop, done = asyncio.Event(), []
+        workers = [asyncio.create_task(convert_forever(client, stop, done)) for _ in range(args.conversions)]
+        await asyncio.sleep(0.2)
+        loaded = await measure_get(client, args.requests)
+        stop.set()
+        await asyncio.gather(*workers)
+
+    for label, samples in (("idle", idle), (f"{args.conversions} concurrent conversions", loaded)):
+        print(f"GET / {label:>28}: p50={statistics.median(samples) * 1000:7.2f} ms  "
+              f"p99={percentile(samples, 99) * 1000:7.2f} ms  max={max(samples) * 1000:7.2f} ms")
+    print(f"conversions completed during the loaded run: {len(done)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversions", type=int, default=8, help="concurrent /convert clients")
+    parser.add_argument("--requests", type=int, default=200, help="GET / samples per phase")
+    parser.add_argument("--convert-delay", type=float, default=0.5, help="seconds per fake conversion")
+    parser.add_argument("--s3-latency", type=float, default=0.05, help="seconds per fake S3 call")
+    parser.add_argument("--backend", default="cli", choices=["cli", "fake"])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    fake_dir = tempfile.mkdtemp(prefix="bench_soffice_")
+    fake_soffice = os.path.join(fake_dir, "xvfb-run")
+    with open(fake_soffice, "w") as f:
+        f.write(FAKE_SOFFICE)
+    os.chmod(fake_soffice, 0o755)
+    os.environ.update({
+        "CONVERTER_BACKEND": args.backend,
+        "XVFB_RUN_PATH": fake_soffice,
+        "LIBREOFFICE_PATH": "soffice.bin",
+        "FAKE_CONVERTER_DELAY": str(args.convert_delay),
+        "S3_BUCKET_NAME": os.getenv("S3_BUCKET_NAME", "benchmark-bucket"),
+        "AWS_DEFAULT_REGION": os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+    })
+    asyncio.run(main_async(args))
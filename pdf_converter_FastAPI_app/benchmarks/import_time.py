@@ -0,0 +1,61 @@
+# benchmarks/import_time.py
+"""
+Cold-start cost of `import main`, measured in fresh interpreters.
+
+By default the database is a local socket that accepts connections and never
+answers, the way a slow RDS instance looks from a cold Lambda, so any database
+work done at import shows up as waiting on the connect timeout. Run from pdf_converter_FastAPI_app/:
+    python benchmarks/import_time.py --runs 5
+    python benchmarks/import_time.py --app-dir /path/to/older/checkout/pdf_converter_FastAPI_app
+
+Run it against a checkout from before and after a change to compare.
+"""
+import os
+import sys
+import socket
+import argparse
+import statistics
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def silent_database() -> socket.socket:
+    """Listens on a free local port; the kernel completes handshakes, nobody ever replies."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(64)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--db-host", help="measure against a real database instead of the silent one")
+    parser.add_argument("--db-port", default="5432")
+    parser.add_argument("--connect-timeout", default="3")
+    args = parser.parse_args()
+
+    if args.db_host is None:
+        server = silent_database()
+        args.db_host, args.db_port = server.getsockname()[0], str(server.getsockname()[1])
+    env = dict(os.environ, DB_HOST=args.db_host, DB_PORT=args.db_port, DB_CONNECT_TIMEOUT=args.connect_timeout,
+               AWS_DEFAULT_REGION=os.getenv("AWS_DEFAULT_REGION", "us-east-1"), PYTHONPATH=args.app_dir)
+    samples = []
+    for _ in range(args.runs):
+        # The first run also compiles bytecode; the median hides that.
+        result = subprocess.run([sys.executable, "-c", SNIPPET], cwd=args.app_dir, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            sys.exit(f"import main failed:\n{result.stderr}")
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+
+    print(f"import main ({args.app_dir}): median={statistics.median(samples) * 1000:.0f} ms  "
+          f"min={min(samples) * 1000:.0f} ms  max={max(samples) * 1000:.0f} ms  runs={args.runs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# benchmarks/local_s3.py
+"""
+In-memory S3-compatible server for running the app and benchmarks offline.
+
+    python benchmarks/local_s3.py --port 9000
+    S3_ENDPOINT_URL=http://127.0.0.1:9000 S3_BUCKET_NAME=bench uvicorn main:app
+
+Covers the calls the app makes through boto3 with path-style addressing: bucket
+create/head, put/get/head/delete/copy object (Range, If-None-Match, If-Modified-Since,
+aws-chunked bodies), multipart uploads and presigned GETs. Signatures are not
+checked. Objects live in memory, so a long run needs RAM for everything uploaded;
+MinIO (see benchmarks/docker-compose.yml) is the persistent alternative.
+"""
+import re
+import sys
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+S3_XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class S3Object:
+    __slots__ = ("data", "etag", "modified", "content_type")
+
+    def __init__(self, data: bytes, content_type: str, etag: str | None = None):
+        self.data = data
+        self.etag = etag or f'"{hashlib.md5(data).hexdigest()}"'
+        # Whole seconds, like Last-Modified.
+        self.modified = int(time.time())
+        self.content_type = content_type
+
+
+class Store:
+    def __init__(self):
+        self.buckets = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """Strips aws-chunked framing: '<hex size>[;chunk-signature=...]\\r\\n<data>\\r\\n' ... '0\\r\\n<trailers>'."""
+    out, pos = bytearray(), 0
+    while True:
+        line_end = body.index(b"\r\n", pos)
+        size = int(body[pos:line_end].split(b";")[0], 16)
+        if size == 0:
+            return bytes(out)
+        out += body[line_end + 2:line_end + 2 + size]
+        pos = line_end + 2 + size + 2
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    store: Store = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- plumbing ----
+    def _target(self):
+        parts = urlsplit(self.path)
+        bucket, _, key = parts.path.lstrip("/").partition("/")
+        return unquote(bucket), unquote(key), parse_qs(parts.query, keep_blank_values=True)
+
+    def _body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "aws-chunked" in (self.headers.get("Content-Encoding") or "") or \
+                (self.headers.get("x-amz-content-sha256") or "").startswith("STREAMING-"):
+            body = _decode_aws_chunked(body)
+        return body
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None, head_only: bool = False):
+        """`head_only` responses carry the headers of a GET; pass their Content-Length in `headers`."""
+        headers = {"Content-Length": str(len(body)), **(headers or {})}
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and not head_only:
+            self.wfile.write(body)
+
+    def _xml(self, status: int, root: str, fields: dict):
+        inner = "".join(f"<{name}>{escape(str(value))}</{name}>" for name, value in fields.items())
+        body = f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{S3_XMLNS}">{inner}</{root}>'.encode()
+        self._send(status, body, {"Content-Type": "application/xml"})
+
+    def _error(self, status: int, code: str, message: str = ""):
+        if self.command == "HEAD":
+            self._send(status)
+            return
+        inner = f"<Code>{code}</Code><Message>{escape(message or code)}</Message>"
+        self._send(status, f'<?xml version="1.0" encoding="UTF-8"?><Error>{inner}</Error>'.encode(),
+                   {"Content-Type": "application/xml"})
+
+    def _object(self, bucket: str, key: str) -> S3Object | None:
+        with self.store.lock:
+            return self.store.buckets.get(bucket, {}).get(key)
+
+    def _object_headers(self, obj: S3Object) -> dict:
+        return {"ETag": obj.etag, "Last-Modified": formatdate(obj.modified, usegmt=True),
+                "Content-Type": obj.content_type, "Accept-Ranges": "bytes"}
+
+    # ---- verbs ----
+    def do_PUT(self):
+        bucket, key, query = self._target()
+        body = self._body()
+        if not key:
+            with self.store.lock:
+                self.store.buckets.setdefault(bucket, {})
+            self._send(200, headers={"Location": f"/{bucket}"})
+            return
+        copy_source = self.headers.get("x-amz-copy-source")
+        if copy_source:
+            self._copy(bucket, key, copy_source)
+            return
+        obj = S3Object(body, self.headers.get("Content-Type") or "binary/octet-stream")
+        with self.store.lock:
+            if "uploadId" in query:
+                upload = self.store.uploads.get(query["uploadId"][0])
+                if upload is not None:
+                    upload["parts"][int(query["partNumber"][0])] = obj
+                missing = None if upload is not None else "NoSuchUpload"
+            elif bucket in self.store.buckets:
+                self.store.buckets[bucket][key] = obj
+                missing = None
+            else:
+                missing = "NoSuchBucket"
+        if missing:
+            self._error(404, missing)
+        else:
+            self._send(200, headers={"ETag": obj.etag})
+
+    def _copy(self, bucket: str, key: str, copy_source: str):
+        source_bucket, _, source_key = unquote(copy_source.split("?")[0]).lstrip("/").partition("/")
+        source = self._object(source_bucket, source_key)
+        if source is None:
+            self._error(404, "NoSuchKey")
+            return
+        obj = S3Object(source.data, source.content_type, source.etag)
+        with self.store.lock:
+            if bucket not in self.store.buckets:
+                missing = "NoSuchBucket"
+            else:
+                self.store.buckets[bucket][key] = obj
+                missing = None
+        if missing:
+            self._error(404, missing)
+        else:
+            self._xml(200, "CopyObjectResult", {"ETag": obj.etag,
+                                                "LastModified": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(obj.modified))})
+
+    def do_POST(self):
+        bucket, key, query = self._target()
+        body = self._body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self.store.lock:
+                self.store.uploads[upload_id] = {"bucket": bucket, "key": key, "parts": {},
+                                                 "content_type": self.headers.get("Content-Type") or "binary/octet-stream"}
+            self._xml(200, "InitiateMultipartUploadResult", {"Bucket": bucket, "Key": key, "UploadId": upload_id})
+            return
+        if "uploadId" in query:
+            numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+            with self.store.lock:
+                upload = self.store.uploads.pop(query["uploadId"][0], None)
+                if upload is None or any(n not in upload["parts"] for n in numbers):
+                    upload = None
+                else:
+                    parts = [upload["parts"][n] for n in numbers]
+                    digest = hashlib.md5(b"".join(bytes.fromhex(p.etag.strip('"')) for p in parts)).hexdigest()
+                    obj = S3Object(b"".join(p.data for p in parts), upload["content_type"], f'"{digest}-{len(parts)}"')
+                    self.store.buckets.setdefault(bucket, {})[key] = obj
+            if upload is None:
+                self._error(404, "NoSuchUpload")
+                return
+            self._xml(200, "CompleteMultipartUploadResult", {"Bucket": bucket, "Key": key, "ETag": obj.etag})
+            return
+        self._error(400, "InvalidRequest", "Unsupported POST.")
+
+    def do_DELETE(self):
+        bucket, key, query = self._target()
+        with self.store.lock:
+            if "uploadId" in query:
+                self.store.uploads.pop(query["uploadId"][0], None)
+            else:
+                self.store.buckets.get(bucket, {}).pop(key, None)
+        self._send(204)
+
+    def do_HEAD(self):
+        self.do_GET(head_only=True)
+
+    def do_GET(self, head_only: bool = False):
+        bucket, key, _ = self._target()
+        if not key:
+            if bucket in self.store.buckets:
+                self._send(200, head_only=head_only)
+            else:
+                self._error(404, "NoSuchBucket")
+            return
+        obj = self._object(bucket, key)
+        if obj is None:
+            self._error(404, "NoSuchKey", "The specified key does not exist.")
+            return
+        headers = self._object_headers(obj)
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_none_match:
+            if obj.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+                self._send(304, headers=headers)
+                return
+        elif if_modified_since:
+            try:
+                if obj.modified <= parsedate_to_datetime(if_modified_since).timestamp():
+                    self._send(304, headers=headers)
+                    return
+            except (TypeError, ValueError):
+                pass
+        data, status = obj.data, 200
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range") or "")
+        if match and (match.group(1) or match.group(2)):
+            size = len(obj.data)
+            if match.group(1):
+                first = int(match.group(1))
+                last = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                first, last = max(size - int(match.group(2)), 0), size - 1
+            if first >= size or first > last:
+                self._error(416, "InvalidRange", "The requested range is not satisfiable")
+                return
+            data, status = obj.data[first:last + 1], 206
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+        if head_only:
+            headers["Content-Length"] = str(len(data))
+            self._send(status, headers=headers, head_only=True)
+        else:
+            self._send(status, data, headers)
+
+
+def serve(host: str, port: int) -> ThreadingHTTPServer:
+    handler = type("BoundS3Handler", (S3Handler,), {"store": Store()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = serve(args.host, args.port)
+    print(f"Local S3 listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
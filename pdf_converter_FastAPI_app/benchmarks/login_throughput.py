@@ -0,0 +1,138 @@
+# benchmarks/login_throughput.py
+"""
+Login throughput at 1/4/16 concurrent clients, plus GET / latency during the burst.
+
+Run from pdf_converter_FastAPI_app/:
+    python benchmarks/login_throughput.py --duration 5
+    PASSWORD_HASH_MAX_CONCURRENCY=1 python benchmarks/login_throughput.py
+
+The users table is replaced by an in-memory stand-in with a fixed per-query delay,
+so the numbers show hashing cost and how it is scheduled, not database speed.
+Logins post to POST / through the ASGI app, exactly like the login form. The login
+rate limits and verified-login cache are switched off unless --with-guard is given,
+so every request pays for a full verification.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+USERNAME = "bench_login_user"
+PASSWORD = "Bench-Passw0rd!"
+
+
+class InMemoryCursor:
+    def __init__(self, users: dict, latency: float):
+        self.users = users
+        self.latency = latency
+        self._row = None
+
+    def execute(self, query, params=None):
+        time.sleep(self.latency)
+        self._row = (self.users[params[0]],) if params and params[0] in self.users else None
+
+    def fetchone(self):
+        return self._row
+
+
+class InMemoryConnection:
+    """Answers the password lookup in database.verify_user from a dict."""
+
+    def __init__(self, users: dict, latency: float):
+        self.users = users
+        self.latency = latency
+
+    def cursor(self):
+        return InMemoryCursor(self.users, self.latency)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def login_forever(client, stop: asyncio.Event, latencies: list, rejected: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post("/", data={"username": USERNAME, "password": PASSWORD})
+        if response.status_code == 429:
+            rejected.append(1)
+            # A rejected attempt never leaves the event loop; yield so the run can end.
+            await asyncio.sleep(0.01)
+            continue
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 303, response.status_code
+
+
+async def probe_forever(client, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+async def run_level(client, clients: int, duration: float) -> tuple[list, list, list]:
+    stop, logins, probes, rejected = asyncio.Event(), [], [], []
+    tasks = [asyncio.create_task(login_forever(client, stop, logins, rejected)) for _ in range(clients)]
+    tasks.append(asyncio.create_task(probe_forever(client, stop, probes)))
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return logins, probes, rejected
+
+
+async def main_async(args):
+    import httpx
+    import main
+    import utils
+    import database
+
+    users = {USERNAME: utils.hash_password(PASSWORD)}
+    database.get_db_connection = lambda: InMemoryConnection(users, args.db_latency)
+    database.release_db_connection = lambda conn: None
+
+    print(f"cpu_count={os.cpu_count()}  PASSWORD_HASH_MAX_CONCURRENCY={utils.PASSWORD_HASH_MAX_CONCURRENCY}  "
+          f"AUTH_WORKERS={utils.AUTH_WORKERS}  rounds={utils.PASSWORD_HASH_ROUNDS}")
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for clients in args.clients:
+            logins, probes, rejected = await run_level(client, clients, args.duration)
+            print(f"{clients:>3} clients: {len(logins) / args.duration:7.1f} logins/s  "
+                  f"login p50={statistics.median(logins) * 1000:7.1f} ms p99={percentile(logins, 99) * 1000:7.1f} ms  "
+                  f"GET / p99={percentile(probes, 99) * 1000:6.1f} ms  rejected={len(rejected)}")
+        if args.with_guard:
+            print(f"auth stats: {(await client.get('/auth/stats')).json()}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=5, help="seconds per concurrency level")
+    parser.add_argument("--with-guard", action="store_true", help="keep login rate limits and cache enabled")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="seconds per fake database query")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    if not args.with_guard:
+        os.environ.update({"LOGIN_CACHE_TTL": "0", "LOGIN_USERNAME_BURST": "1000000", "LOGIN_USERNAME_RATE": "1e9",
+                           "LOGIN_IP_BURST": "1000000", "LOGIN_IP_RATE": "1e9"})
+    asyncio.run(main_async(args))
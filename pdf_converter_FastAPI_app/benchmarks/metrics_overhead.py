@@ -0,0 +1,91 @@
+# benchmarks/metrics_overhead.py
+"""
+Cost of the latency instrumentation in metrics.py: one span on its own, and whole
+requests through the ASGI app with metrics enabled vs. disabled.
+
+Run from pdf_converter_FastAPI_app/:
+    python benchmarks/metrics_overhead.py --requests 2000
+
+Requests go through the app in-process with a session cookie. /auth/stats is a
+small JSON endpoint, so the app's own work is close to the floor and the
+middleware's share is as large as it will ever be; /download/{id} also records a
+presign span, but its thread-pool hop makes it noisier than the overhead itself.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+
+class PresignOnlyS3Client:
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://bench.s3.amazonaws.com/{Params['Key']}?X-Amz-Signature=bench"
+
+
+def time_spans(registry, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        with registry.span("bench_seconds", stage="noop"):
+            pass
+    return (time.perf_counter() - started) / count
+
+
+async def time_requests(client, registry, path: str, count: int) -> dict:
+    """Alternates enabled/disabled on every request, so drift and GC pauses hit both modes."""
+    samples = {True: [], False: []}
+    for i in range(count * 2):
+        registry.enabled = enabled = i % 2 == 0
+        started = time.perf_counter()
+        await client.get(path, follow_redirects=False)
+        samples[enabled].append(time.perf_counter() - started)
+    registry.enabled = True
+    return samples
+
+
+async def main_async(args):
+    import httpx
+    import main
+    import sessions
+    from metrics import MetricsRegistry
+
+    registry = MetricsRegistry(enabled=True, emf_interval=0)
+    print(f"span():           {time_spans(registry, 100000) * 1e6:6.2f} us enabled, "
+          f"{time_spans(MetricsRegistry(enabled=False), 100000) * 1e6:6.2f} us disabled")
+
+    main.logger.setLevel(logging.ERROR)
+    main.S3_BUCKET_NAME = "bench-bucket"
+    main.s3_client = PresignOnlyS3Client()
+    main.download_urls.check_exists = False
+    main.conversion_log.record("2f1e6bd8-bench", "bench", status="completed")
+    main.metrics.emf_interval = 0
+    transport = httpx.ASGITransport(app=main.app)
+    cookies = {sessions.SESSION_COOKIE_NAME: sessions.issue_session("bench")}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        for path in ("/auth/stats", "/download/2f1e6bd8-bench"):
+            await time_requests(client, main.metrics, path, 50)
+            results = await time_requests(client, main.metrics, path, args.requests)
+            on, off = statistics.median(results[True]), statistics.median(results[False])
+            print(f"{path:<28} p50 enabled={on * 1e6:7.1f} us  disabled={off * 1e6:7.1f} us  "
+                  f"overhead={(on - off) * 1e6:6.1f} us ({(on - off) / off * 100:4.1f}%)")
+    print(f"series recorded: {sum(len(v) for v in main.metrics.summary().values())}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint and mode")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("CONVERTER_BACKEND", "fake")
+    os.environ.setdefault("CONVERSION_LOG_BACKEND", "memory")
+    asyncio.run(main_async(args))
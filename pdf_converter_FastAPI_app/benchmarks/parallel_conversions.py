@@ -0,0 +1,209 @@
+# benchmarks/parallel_conversions.py
+"""
+Many overlapping /convert requests against stand-in converters, checking that they
+really run in parallel and never share a LibreOffice profile or process environment.
+
+Run from pdf_converter_FastAPI_app/:
+    python benchmarks/parallel_conversions.py --conversions 64 --slots 4
+    python benchmarks/parallel_conversions.py --backend fake
+
+With --backend cli (default) the real CLI backend runs generated stand-ins for
+xvfb-run and soffice.bin. The stand-in soffice.bin fails the conversion if HOME is
+not its profile or if another process holds the same profile, sleeps --delay
+seconds, and writes a placeholder PDF. --backend fake uses the in-process fake pool.
+Requests go through the ASGI app in-process, with S3 served by benchmarks/local_s3.py
+on a free port. Meanwhile os.environ is sampled for changes to PATH and HOME.
+The exit status is 1 if any conversion failed, the environment changed, or a
+profile was initialized more than once.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import collections
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+XVFB_RUN_STANDIN = """#!/bin/sh
+# Stand-in xvfb-run: drops its own options and runs the command.
+while [ "${1#-}" != "$1" ]; do shift; done
+exec "$@"
+"""
+
+SOFFICE_STANDIN = """#!/bin/sh
+# Stand-in soffice.bin: checks its environment and that it has the profile to itself.
+profile= outdir= init= inputs=
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -env:UserInstallation=file://*) profile="${1#-env:UserInstallation=file://}" ;;
+        --outdir) outdir="$2"; shift ;;
+        --convert-to) shift ;;
+        --terminate_after_init) init=1 ;;
+        --version) echo "LibreOffice stand-in"; exit 0 ;;
+        -*) ;;
+        *) inputs="$inputs $1" ;;
+    esac
+    shift
+done
+[ "$HOME" = "$profile" ] || { echo "HOME=$HOME is not the profile $profile" >&2; exit 1; }
+if [ -n "$init" ]; then
+    mkdir -p "$profile/user" && echo "$profile" >> "$BENCH_LOG_DIR/inits"
+    exit 0
+fi
+mkdir "$profile/.in-use" 2>/dev/null || { echo "profile $profile is used by another conversion" >&2; exit 1; }
+sleep "$BENCH_DELAY"
+for input in $inputs; do
+    cp "$BENCH_LOG_DIR/placeholder.pdf" "$outdir/$(basename "$input" .docx).pdf"
+done
+echo "$profile" >> "$BENCH_LOG_DIR/jobs"
+rmdir "$profile/.in-use"
+"""
+
+
+def write_standins(directory: str):
+    from converter import FakeInstance
+
+    for name, script in (("xvfb-run", XVFB_RUN_STANDIN), ("soffice.bin", SOFFICE_STANDIN)):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+    with open(os.path.join(directory, "placeholder.pdf"), "wb") as f:
+        f.write(FakeInstance.PDF_BYTES)
+
+
+def read_lines(path: str) -> list[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return f.read().split()
+
+
+class EnvironWatch:
+    """Samples PATH and HOME from a thread, counting every change it sees."""
+
+    def __init__(self):
+        self.expected = (os.environ.get("PATH"), os.environ.get("HOME"))
+        self.changes = 0
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.001):
+            self.samples += 1
+            if (os.environ.get("PATH"), os.environ.get("HOME")) != self.expected:
+                self.changes += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def main_async(args, work_dir: str) -> bool:
+    import httpx
+    import main
+    import sessions
+    from service_load import CorpusDocument, create_bucket
+
+    create_bucket(os.environ["S3_ENDPOINT_URL"])
+    document = CorpusDocument("parallel", args.size, random.Random(7))
+    limit = asyncio.Semaphore(args.concurrency)
+    statuses = collections.Counter()
+    errors = collections.Counter()
+
+    async def convert(client, index: int):
+        async with limit:
+            # Unique bytes, so every request converts instead of hitting the conversion cache.
+            files = {"file": (f"parallel-{index}.docx", document.build(nonce=f"{index}-{time.time_ns()}"))}
+            response = await client.post("/convert", files=files)
+        statuses[response.status_code] += 1
+        if response.status_code != 200:
+            errors[response.json().get("message", "")[:120]] += 1
+
+    transport = httpx.ASGITransport(app=main.app)
+    cookies = {sessions.SESSION_COOKIE_NAME: sessions.issue_session("bench")}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies, timeout=None) as client:
+        # Warm-up: initializes the profiles or pool instances outside the measurement.
+        await asyncio.gather(*(convert(client, -1 - i) for i in range(args.slots)))
+        statuses.clear()
+        with EnvironWatch() as watch:
+            started = time.perf_counter()
+            await asyncio.gather(*(convert(client, i) for i in range(args.conversions)))
+            elapsed = time.perf_counter() - started
+
+    serial = args.conversions * args.delay
+    print(f"backend={args.backend} slots={args.slots} conversions={args.conversions} delay={args.delay}s")
+    print(f"statuses: {dict(statuses)}")
+    for message, count in errors.most_common(5):
+        print(f"  {count} x {message}")
+    print(f"wall {elapsed:.2f}s, {args.conversions / elapsed:.1f} conversions/s; "
+          f"serialized would take {serial:.2f}s, ideal with {args.slots} slots {serial / args.slots:.2f}s")
+    print(f"os.environ PATH/HOME changes seen: {watch.changes} in {watch.samples} samples")
+    print(f"converter stats: {main.converter_engine.stats()}")
+
+    ok = statuses == collections.Counter({200: args.conversions}) and watch.changes == 0
+    if args.backend == "cli":
+        inits = read_lines(os.path.join(work_dir, "inits"))
+        jobs = collections.Counter(read_lines(os.path.join(work_dir, "jobs")))
+        print(f"profile initializations: {len(inits)} for {len(set(inits))} profiles; "
+              f"jobs per profile: {sorted(jobs.values())}")
+        ok = ok and len(inits) == len(set(inits))
+    main.converter_engine.shutdown()
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["cli", "fake"], default="cli")
+    parser.add_argument("--conversions", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    parser.add_argument("--slots", type=int, default=4, help="CONVERTER_MAX_CONCURRENCY (and fake pool size)")
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds each stand-in conversion takes")
+    parser.add_argument("--size", type=int, default=32 * 1024, help="approximate DOCX size in bytes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    import local_s3
+    import service_load
+
+    s3_server = local_s3.serve("127.0.0.1", 0)
+    threading.Thread(target=s3_server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory(prefix="parallel_conversions_") as work_dir:
+        os.environ.update({
+            "S3_ENDPOINT_URL": f"http://127.0.0.1:{s3_server.server_port}",
+            "S3_BUCKET_NAME": service_load.BUCKET,
+            "CONVERTER_BACKEND": args.backend,
+            "CONVERTER_MAX_CONCURRENCY": str(args.slots),
+            "CONVERTER_QUEUE_SIZE": str(args.conversions),
+            "CONVERTER_QUEUE_TIMEOUT": "600",
+            "LIBREOFFICE_POOL_SIZE": str(args.slots),
+            "FAKE_CONVERTER_DELAY": str(args.delay),
+            "BENCH_DELAY": str(args.delay),
+            "BENCH_LOG_DIR": work_dir,
+        })
+        for name, value in (("AWS_DEFAULT_REGION", "us-east-1"), ("AWS_ACCESS_KEY_ID", "bench"),
+                            ("AWS_SECRET_ACCESS_KEY", "bench-secret"), ("CONVERSION_LOG_BACKEND", "memory"),
+                            ("METRICS_EMF_INTERVAL", "0")):
+            os.environ.setdefault(name, value)
+        if args.backend == "cli":
+            # Before anything imports converter, which reads these at import time.
+            os.environ["XVFB_RUN_PATH"] = os.path.join(work_dir, "xvfb-run")
+            os.environ["LIBREOFFICE_PATH"] = os.path.join(work_dir, "soffice.bin")
+            os.environ["LIBREOFFICE_PROFILE_DIR"] = os.path.join(work_dir, "profiles")
+            write_standins(work_dir)
+        ok = asyncio.run(main_async(args, work_dir))
+    s3_server.shutdown()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,494 @@
+# benchmarks/service_load.py
+"""
+Mixed-workload benchmark of the whole service, run offline against local stand-ins.
+
+Run from pdf_converter_FastAPI_app/:
+    docker compose -f benchmarks/docker-compose.yml up -d postgres
+    python benchmarks/service_load.py --duration 60 --output bench-results/baseline.json
+    python benchmarks/service_load.py --duration 60 --compare bench-results/baseline.json
+
+    # No PostgreSQL at hand: conversions, downloads and history only.
+    python benchmarks/service_load.py --no-database --duration 20
+
+The app runs under uvicorn in its own process, configured only through its usual
+environment variables:
+  * S3: benchmarks/local_s3.py is started on a free port unless --s3-endpoint points
+    at another S3-compatible service (e.g. the MinIO in docker-compose.yml).
+  * PostgreSQL: --db-* (defaults match docker-compose.yml); migrations are applied first.
+  * Converter: "fake" (deterministic placeholder PDFs) by default, or "pool"/"cli" for
+    real LibreOffice via LIBREOFFICE_PATH and XVFB_RUN_PATH.
+
+--concurrency clients draw operations from --mix with a seeded RNG: logins of
+pre-registered users, registrations, conversions of a generated DOCX corpus
+(--corpus-sizes, or real files from --corpus), redirect and streamed downloads of
+converted files, and history pages. A share of uploads (1 - --unique-uploads)
+repeats earlier bytes and so hits the conversion cache. After --warmup seconds,
+--duration seconds are measured. The report gives throughput and latency
+percentiles per operation, the server's peak RSS, and the app's own /metrics
+summary; --output writes it as JSON and --compare prints the change against an
+earlier result.
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import zipfile
+import argparse
+import platform
+import subprocess
+import collections
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+BUCKET = "pdf-converter-bench"
+PASSWORD = "Bench-Passw0rd!"
+DEFAULT_MIX = "login=25,register=5,convert=20,download=30,download_stream=10,history=10"
+DATABASE_OPERATIONS = {"login", "register"}
+# Expected status codes; anything else counts as an error.
+EXPECTED_STATUS = {
+    "login": {303},
+    "register": {303},
+    "convert": {200},
+    "download": {303},
+    "download_stream": {200},
+    "history": {200},
+}
+
+
+# -------------------- Corpus --------------------
+WORDS = ("quarterly report revenue forecast pipeline contract annex schedule summary "
+         "appendix invoice memo policy review draft section table figure budget").split()
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="bin" ContentType="application/octet-stream"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+
+
+class CorpusDocument:
+    """A DOCX of roughly `size` bytes: text paragraphs plus stored, incompressible padding."""
+
+    def __init__(self, name: str, size: int, rng: random.Random):
+        self.name = name
+        text_size = min(size // 4, 64 * 1024)
+        paragraphs, length = [], 0
+        while length < text_size:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(12))
+            paragraphs.append(f"<w:p><w:r><w:t>{sentence}.</w:t></w:r></w:p>")
+            length += len(sentence)
+        self.paragraphs = "".join(paragraphs)
+        self.padding = rng.randbytes(max(size - text_size // 3, 0))
+        self.data = self.build()
+
+    def build(self, nonce: str | None = None) -> bytes:
+        """The document bytes; a nonce paragraph makes them unique (no conversion cache hit)."""
+        extra = f"<w:p><w:r><w:t>{nonce}</w:t></w:r></w:p>" if nonce else ""
+        document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                    f'<w:body>{extra}{self.paragraphs}</w:body></w:document>')
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as docx:
+            docx.writestr("[Content_Types].xml", CONTENT_TYPES)
+            docx.writestr("_rels/.rels", PACKAGE_RELS)
+            docx.writestr("word/document.xml", document)
+            docx.writestr("word/media/padding.bin", self.padding, compress_type=zipfile.ZIP_STORED)
+        return buffer.getvalue()
+
+
+class FileDocument:
+    """A real DOCX from --corpus; made unique by appending to the ZIP comment."""
+
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self.data = f.read()
+
+    def build(self, nonce: str | None = None) -> bytes:
+        if not nonce:
+            return self.data
+        buffer = io.BytesIO(self.data)
+        with zipfile.ZipFile(buffer, "a") as docx:
+            docx.comment = nonce.encode()
+        return buffer.getvalue()
+
+
+def parse_size(text: str) -> int:
+    units = {"k": 1024, "m": 1024 * 1024}
+    text = text.strip().lower()
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def load_corpus(args, rng: random.Random) -> list:
+    if args.corpus:
+        paths = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus) if name.endswith(".docx"))
+        if not paths:
+            sys.exit(f"No .docx files in {args.corpus}")
+        return [FileDocument(path) for path in paths]
+    return [CorpusDocument(f"bench-{size}.docx", parse_size(size), rng) for size in args.corpus_sizes.split(",")]
+
+
+# -------------------- Processes --------------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def read_rss(pid: int) -> dict:
+    """Current and peak resident set size in MiB from /proc (Linux); empty elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {}
+    return {name: int(fields[key].split()[0]) / 1024 for name, key in (("rss_mb", "VmRSS"), ("peak_rss_mb", "VmHWM"))
+            if key in fields}
+
+
+def wait_for_http(url: str, timeout: float, process: subprocess.Popen):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"{process.args[:3]} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"Timed out waiting for {url}")
+
+
+def server_environment(args, s3_endpoint: str, session_key: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "S3_ENDPOINT_URL": s3_endpoint,
+        "S3_BUCKET_NAME": BUCKET,
+        "AWS_DEFAULT_REGION": env.get("AWS_DEFAULT_REGION", "us-east-1"),
+        "AWS_ACCESS_KEY_ID": env.get("AWS_ACCESS_KEY_ID", "bench"),
+        "AWS_SECRET_ACCESS_KEY": env.get("AWS_SECRET_ACCESS_KEY", "bench-secret"),
+        "CONVERTER_BACKEND": args.converter,
+        "SESSION_SIGNING_KEYS": session_key,
+        "SESSION_COOKIE_SECURE": "false",
+        # One client IP and a few users would otherwise hit the login rate limits.
+        "LOGIN_IP_RATE": "1000000", "LOGIN_IP_BURST": "1000000",
+        "LOGIN_USERNAME_RATE": "1000000", "LOGIN_USERNAME_BURST": "1000000",
+        "METRICS_EMF_INTERVAL": "0",
+    })
+    if args.database:
+        env.update({"DB_HOST": args.db_host, "DB_PORT": str(args.db_port), "DB_NAME": args.db_name,
+                    "DB_USER": args.db_user, "DB_PASSWORD": args.db_password})
+    else:
+        env["CONVERSION_LOG_BACKEND"] = "memory"
+    return env
+
+
+def create_bucket(endpoint: str):
+    import boto3
+    from botocore.config import Config
+    client = boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1", aws_access_key_id="bench",
+                          aws_secret_access_key="bench-secret", config=Config(s3={"addressing_style": "path"}))
+    try:
+        client.head_bucket(Bucket=BUCKET)
+    except Exception:
+        client.create_bucket(Bucket=BUCKET)
+
+
+# -------------------- Workload --------------------
+class Workload:
+    def __init__(self, client, corpus: list, session_cookie: str, users: list, args):
+        self.client = client
+        self.corpus = corpus
+        self.cookie = {"Cookie": session_cookie}
+        self.users = users
+        self.args = args
+        self.file_ids = collections.deque(maxlen=1000)
+        self.samples = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.recording = False
+        self.run_token = uuid.uuid4().hex[:8]
+        self.registered = 0
+
+    async def login(self, rng):
+        username = rng.choice(self.users)
+        return await self.client.post("/", data={"username": username, "password": PASSWORD})
+
+    async def register(self, rng):
+        self.registered += 1
+        username = f"bench_{self.run_token}_{self.registered}"
+        return await self.client.post("/register", data={"username": username, "email": f"{username}@example.com",
+                                                          "password": PASSWORD})
+
+    async def convert(self, rng):
+        document = rng.choice(self.corpus)
+        nonce = uuid.UUID(int=rng.getrandbits(128)).hex if rng.random() < self.args.unique_uploads else None
+        data = document.build(f"{self.run_token}-{nonce}" if nonce else None)
+        response = await self.client.post("/convert", headers=self.cookie, files={"file": (document.name, data)})
+        if response.status_code == 200:
+            self.file_ids.append(response.json()["file_id"])
+        return response
+
+    async def download(self, rng):
+        return await self.client.get(f"/download/{rng.choice(self.file_ids)}", headers=self.cookie)
+
+    async def download_stream(self, rng):
+        return await self.client.get(f"/download/{rng.choice(self.file_ids)}?mode=stream", headers=self.cookie)
+
+    async def history(self, rng):
+        return await self.client.get("/conversions?limit=20", headers=self.cookie)
+
+    async def run_client(self, index: int, operations: list, weights: list, deadline: float):
+        rng = random.Random(self.args.seed * 1000 + index)
+        while time.monotonic() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                status_code = (await getattr(self, operation)(rng)).status_code
+            except Exception as e:
+                status_code = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if self.recording:
+                self.samples[operation].append(elapsed)
+                self.statuses[operation][str(status_code)] += 1
+
+
+async def sample_rss(pid: int, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        rss = read_rss(pid).get("rss_mb")
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args, base_url: str, server: subprocess.Popen) -> dict:
+    import httpx
+    import sessions
+
+    rng = random.Random(args.seed)
+    corpus = load_corpus(args, rng)
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - set(EXPECTED_STATUS)
+    if unknown:
+        sys.exit(f"Unknown operations in --mix: {sorted(unknown)}")
+    if not args.database:
+        skipped = sorted(set(mix) & DATABASE_OPERATIONS)
+        if skipped:
+            print(f"--no-database: leaving {skipped} out of the mix")
+        mix = {name: weight for name, weight in mix.items() if name not in DATABASE_OPERATIONS}
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        cookie = f"{sessions.SESSION_COOKIE_NAME}={sessions.issue_session('bench_owner')}"
+        workload = Workload(client, corpus, cookie, [], args)
+        if args.database:
+            for _ in range(args.users):
+                response = await workload.register(rng)
+                if response.status_code != 303:
+                    sys.exit(f"Registering a benchmark user failed with {response.status_code}")
+            workload.users = [f"bench_{workload.run_token}_{i + 1}" for i in range(args.users)]
+        # Every document once, so downloads have something to fetch from the start.
+        for document in corpus:
+            response = await workload.convert(random.Random(args.seed))
+            if response.status_code != 200:
+                sys.exit(f"Seeding conversion of {document.name} failed: {response.status_code} {response.text[:200]}")
+
+        operations, weights = list(mix), list(mix.values())
+        stop_sampling = asyncio.Event()
+        rss_samples = []
+        sampler = asyncio.create_task(sample_rss(server.pid, rss_samples, stop_sampling))
+        started = time.monotonic()
+        deadline = started + args.warmup + args.duration
+        clients = [asyncio.create_task(workload.run_client(i, operations, weights, deadline))
+                   for i in range(args.concurrency)]
+        await asyncio.sleep(args.warmup)
+        workload.recording = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*clients)
+        elapsed = time.monotonic() - measured_from
+        stop_sampling.set()
+        await sampler
+        server_metrics = (await client.get("/metrics/summary", headers=workload.cookie)).json()
+
+    results = {"operations": {}, "elapsed": round(elapsed, 3)}
+    total = errors = 0
+    for operation in operations:
+        samples = workload.samples[operation]
+        statuses = workload.statuses[operation]
+        failed = sum(count for code, count in statuses.items()
+                     if not code.isdigit() or int(code) not in EXPECTED_STATUS[operation])
+        total += len(samples)
+        errors += failed
+        if not samples:
+            continue
+        results["operations"][operation] = {
+            "count": len(samples),
+            "errors": failed,
+            "statuses": dict(statuses),
+            "throughput": round(len(samples) / elapsed, 2),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            "max_ms": round(max(samples) * 1000, 2),
+        }
+    rss = read_rss(server.pid)
+    results.update({
+        "throughput": round(total / elapsed, 2),
+        "errors": errors,
+        "server_peak_rss_mb": round(rss.get("peak_rss_mb", max(rss_samples, default=0)), 1),
+        "server_mean_rss_mb": round(sum(rss_samples) / len(rss_samples), 1) if rss_samples else None,
+        "server_metrics": server_metrics,
+    })
+    return results
+
+
+# -------------------- Report --------------------
+def print_report(results: dict):
+    print(f"{'operation':<16}{'count':>8}{'errors':>8}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, op in results["operations"].items():
+        print(f"{name:<16}{op['count']:>8}{op['errors']:>8}{op['throughput']:>9.1f}{op['p50_ms']:>10.1f}"
+              f"{op['p95_ms']:>10.1f}{op['p99_ms']:>10.1f}{op['max_ms']:>10.1f}")
+    print(f"total: {results['throughput']:.1f} ops/s over {results['elapsed']:.1f}s, {results['errors']} errors; "
+          f"server peak RSS {results['server_peak_rss_mb']} MiB (mean {results['server_mean_rss_mb']} MiB)")
+
+
+def print_comparison(results: dict, baseline: dict):
+    def change(new, old):
+        if not old:
+            return "     n/a"
+        return f"{(new - old) / old * 100:+7.1f}%"
+
+    print(f"\nvs. {baseline['config'].get('label') or baseline['config'].get('git_commit', 'baseline')}:")
+    print(f"{'operation':<16}{'ops/s':>20}{'p50 ms':>22}{'p95 ms':>22}{'p99 ms':>22}")
+    for name, op in results["operations"].items():
+        old = baseline["operations"].get(name)
+        if not old:
+            continue
+        row = f"{name:<16}"
+        for key in ("throughput", "p50_ms", "p95_ms", "p99_ms"):
+            row += f"{old[key]:>8.1f}->{op[key]:>6.1f}{change(op[key], old[key])}"
+        print(row)
+    print(f"{'total ops/s':<16}{baseline['throughput']:>8.1f}->{results['throughput']:>6.1f}"
+          f"{change(results['throughput'], baseline['throughput'])}")
+    print(f"{'peak RSS MiB':<16}{baseline['server_peak_rss_mb']:>8.1f}->{results['server_peak_rss_mb']:>6.1f}"
+          f"{change(results['server_peak_rss_mb'], baseline['server_peak_rss_mb'])}")
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    session_key = f"bench:{uuid.uuid4().hex}"
+    # Sessions issued here must validate in the server process.
+    os.environ["SESSION_SIGNING_KEYS"] = session_key
+    processes = []
+    try:
+        s3_endpoint = args.s3_endpoint
+        if not s3_endpoint:
+            port = free_port()
+            s3 = subprocess.Popen([sys.executable, os.path.join("benchmarks", "local_s3.py"), "--port", str(port)],
+                                  stdout=subprocess.DEVNULL)
+            processes.append(s3)
+            s3_endpoint = f"http://127.0.0.1:{port}"
+            wait_for_http(f"{s3_endpoint}/{BUCKET}", 30, s3)
+        create_bucket(s3_endpoint)
+
+        env = server_environment(args, s3_endpoint, session_key)
+        if args.database:
+            subprocess.run([sys.executable, "migrations.py"], env=env, check=True)
+        port = free_port()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                   "--port", str(port), "--log-level", "warning"], env=env)
+        processes.append(server)
+        base_url = f"http://127.0.0.1:{port}"
+        wait_for_http(f"{base_url}/register", 120, server)
+
+        results = asyncio.run(run(args, base_url, server))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    results["config"] = {
+        "label": args.label, "git_commit": git_commit(), "python": platform.python_version(),
+        "cpus": os.cpu_count(), "converter": args.converter, "database": args.database,
+        "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup, "seed": args.seed,
+        "mix": args.mix, "corpus": args.corpus or args.corpus_sizes, "unique_uploads": args.unique_uploads,
+    }
+    print_report(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds run before measuring")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights")
+    parser.add_argument("--corpus-sizes", default="20k,200k,2m", help="sizes of the generated DOCX corpus")
+    parser.add_argument("--corpus", help="directory of .docx files to use instead of the generated corpus")
+    parser.add_argument("--unique-uploads", type=float, default=0.8,
+                        help="share of conversions with unique bytes (the rest hit the conversion cache)")
+    parser.add_argument("--users", type=int, default=20, help="users registered up front for the login operation")
+    parser.add_argument("--converter", choices=["fake", "pool", "cli"], default="fake")
+    parser.add_argument("--s3-endpoint", help="S3-compatible endpoint; default: start benchmarks/local_s3.py")
+    parser.add_argument("--no-database", dest="database", action="store_false",
+                        help="skip PostgreSQL: history in memory, no logins or registrations")
+    parser.add_argument("--db-host", default="127.0.0.1")
+    parser.add_argument("--db-port", type=int, default=5432)
+    parser.add_argument("--db-name", default="pdf_converter_bench")
+    parser.add_argument("--db-user", default="bench")
+    parser.add_argument("--db-password", default="bench")
+    parser.add_argument("--timeout", type=float, default=300, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1575)
+    parser.add_argument("--label", help="name for this run in --compare output")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,105 @@
+# benchmarks/upload_memory.py
+"""
+Checks that peak memory of POST /convert stays bounded as the upload grows.
+
+Run from pdf_converter_FastAPI_app/:
+    python benchmarks/upload_memory.py --sizes 2 32 96
+
+The multipart body is generated in chunks so the client never holds the whole
+file, and S3 is an in-memory stand-in that discards part bodies. Python heap
+peaks are measured with tracemalloc; the script exits non-zero if any peak
+exceeds the expected bound of part_size * (max_in_flight + 2) + 4 * chunk_size.
+"""
+import os
+import sys
+import uuid
+import asyncio
+import argparse
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+MB = 1024 * 1024
+
+
+class DiscardingS3Client:
+    """Accepts uploads without keeping the bytes."""
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {"UploadId": str(uuid.uuid4())}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        return {}
+
+    def put_object(self, Bucket, Key, Body):
+        return {}
+
+    def upload_file(self, filename, bucket, key):
+        return None
+
+
+async def multipart_body(boundary: str, size: int, chunk_size: int):
+    yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.docx\"\r\n"
+           f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    seed = os.urandom(chunk_size)
+    sent = 0
+    while sent < size:
+        piece = seed[:min(chunk_size, size - sent)]
+        sent += len(piece)
+        yield piece
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+async def peak_for_upload(client, size: int, chunk_size: int) -> int:
+    boundary = uuid.uuid4().hex
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    response = await client.post(
+        "/convert",
+        content=multipart_body(boundary, size, chunk_size),
+        headers={"content-type": f"multipart/form-data; boundary={boundary}"},
+    )
+    assert response.status_code == 200, response.text
+    _, peak = tracemalloc.get_traced_memory()
+    return peak - baseline
+
+
+async def main_async(args):
+    import httpx
+    import main
+    import sessions
+    import streaming
+
+    main.s3_client = DiscardingS3Client()
+    bound = streaming.S3_MULTIPART_PART_SIZE * (streaming.S3_MULTIPART_MAX_IN_FLIGHT + 2) + 4 * main.UPLOAD_CHUNK_SIZE
+    tracemalloc.start()
+    failed = False
+    # /convert requires a signed session.
+    cookies = {sessions.SESSION_COOKIE_NAME: sessions.issue_session("bench")}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", cookies=cookies) as client:
+        for size_mb in args.sizes:
+            peak = await peak_for_upload(client, size_mb * MB, 64 * 1024)
+            ok = peak <= bound
+            failed |= not ok
+            print(f"upload {size_mb:5d} MB: peak {peak / MB:7.2f} MB (bound {bound / MB:.0f} MB) {'ok' if ok else 'EXCEEDED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 32, 96], help="upload sizes in MB")
+    args = parser.parse_args()
+    os.environ.setdefault("CONVERTER_BACKEND", "fake")
+    os.environ.setdefault("CONVERSION_CACHE_BACKEND", "none")
+    os.environ.setdefault("MAX_UPLOAD_SIZE", str((max(args.sizes) + 1) * MB))
+    os.environ.setdefault("S3_BUCKET_NAME", "benchmark-bucket")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    asyncio.run(main_async(args))
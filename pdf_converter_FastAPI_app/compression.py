@@ -0,0 +1,138 @@
+# compression.py
+import os
+import zlib
+import gzip
+import logging
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Responses smaller than this are sent as they are; compression would barely pay off.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Levels for responses compressed per request; cached renders and static files use the maximum.
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+# Preference order when the client accepts several.
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def accepted_encodings(header: str | None) -> set[str]:
+    """Content codings listed in an Accept-Encoding header, minus those with q=0."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+
+def choose_encoding(header: str | None, available=SUPPORTED_ENCODINGS) -> str:
+    """The preferred encoding out of `available` the client accepts, else "identity"."""
+    accepted = accepted_encodings(header)
+    return next((encoding for encoding in available if encoding in accepted), "identity")
+
+
+def is_compressible(content_type: str | None) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """Compresses a whole body; `best` uses maximum levels for bodies that are compressed once and cached."""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else COMPRESSION_BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9 if best else COMPRESSION_GZIP_LEVEL, mtime=0)
+    return data
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+            self._compress, self._finish = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress, self._finish = self._compressor.compress, self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+# -------------------- Compression Middleware --------------------
+class CompressionMiddleware:
+    """
+    Compresses text, HTML and JSON responses with brotli or gzip, as negotiated with
+    Accept-Encoding, once they reach minimum_size bytes. Responses that already carry a
+    Content-Encoding (pre-compressed static files and cached pages) pass through, as do
+    partial content and other media types such as PDFs and ZIPs.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if ("content-encoding" in headers or start["status"] in (204, 206, 304)
+                        or not is_compressible(headers.get("content-type"))
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    body = compress(body, encoding)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                # Streamed responses are compressed chunk by chunk; the length is not known up front.
+                del headers["Content-Length"]
+                compressor = _StreamCompressor(encoding)
+                await send(start)
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.finish()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
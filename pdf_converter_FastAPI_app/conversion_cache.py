@@ -0,0 +1,231 @@
+# conversion_cache.py
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from psycopg2 import Error
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# "memory" (per-process LRU), "postgres" (shared index next to the users table) or "none"
+CONVERSION_CACHE_BACKEND = os.getenv("CONVERSION_CACHE_BACKEND", "memory")
+CONVERSION_CACHE_MAX_ENTRIES = int(os.getenv("CONVERSION_CACHE_MAX_ENTRIES", "1024"))
+CONVERSION_CACHE_TTL = float(os.getenv("CONVERSION_CACHE_TTL", "86400"))
+# Expired rows of the postgres index are deleted at most this often per process; lookups
+# ignore them in the meantime.
+CONVERSION_CACHE_PRUNE_INTERVAL = float(os.getenv("CONVERSION_CACHE_PRUNE_INTERVAL", "300"))
+
+
+def pdf_key_to_file_id(pdf_s3_key: str) -> str:
+    """converted_pdfs/<file_id>.pdf -> <file_id>"""
+    return os.path.splitext(os.path.basename(pdf_s3_key))[0]
+
+
+# -------------------- Cache Backends --------------------
+class ConversionCache:
+    """
+    Index of (content hash, converter version) -> converted_pdfs/... key.
+    Keying on the converter version means a LibreOffice upgrade starts from an empty cache.
+    """
+    name = "base"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, content_hash: str, converter_version: str) -> str | None:
+        pdf_s3_key = self._lookup(content_hash, converter_version)
+        self._count("hits" if pdf_s3_key else "misses")
+        return pdf_s3_key
+
+    def put(self, content_hash: str, converter_version: str, pdf_s3_key: str):
+        self._store(content_hash, converter_version, pdf_s3_key)
+        self._count("stores")
+
+    def invalidate(self, content_hash: str, converter_version: str):
+        """Drops an entry whose PDF is gone, e.g. after S3 lifecycle expiry."""
+        self._remove(content_hash, converter_version)
+        self._count("invalidations")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        counters["backend"] = self.name
+        return counters
+
+    def _lookup(self, content_hash: str, converter_version: str) -> str | None:
+        raise NotImplementedError
+
+    def _store(self, content_hash: str, converter_version: str, pdf_s3_key: str):
+        raise NotImplementedError
+
+    def _remove(self, content_hash: str, converter_version: str):
+        raise NotImplementedError
+
+
+class NullConversionCache(ConversionCache):
+    """Disables caching; every lookup is a miss."""
+    name = "none"
+
+    def _lookup(self, content_hash, converter_version):
+        return None
+
+    def _store(self, content_hash, converter_version, pdf_s3_key):
+        pass
+
+    def _remove(self, content_hash, converter_version):
+        pass
+
+
+class LRUConversionCache(ConversionCache):
+    """Per-process LRU with a TTL and a maximum number of entries."""
+    name = "memory"
+
+    def __init__(self, max_entries: int = CONVERSION_CACHE_MAX_ENTRIES, ttl: float = CONVERSION_CACHE_TTL):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def _lookup(self, content_hash, converter_version):
+        key = (content_hash, converter_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            pdf_s3_key, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return pdf_s3_key
+
+    def _store(self, content_hash, converter_version, pdf_s3_key):
+        evicted = 0
+        with self._lock:
+            self._entries[(content_hash, converter_version)] = (pdf_s3_key, time.monotonic() + self.ttl)
+            self._entries.move_to_end((content_hash, converter_version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _remove(self, content_hash, converter_version):
+        with self._lock:
+            self._entries.pop((content_hash, converter_version), None)
+
+    def stats(self) -> dict:
+        counters = super().stats()
+        with self._lock:
+            counters["entries"] = len(self._entries)
+        return counters
+
+
+class PostgresConversionCache(ConversionCache):
+    """Shared index in the conversion_cache table created by migrations.py."""
+    name = "postgres"
+
+    def __init__(self, ttl: float = CONVERSION_CACHE_TTL, prune_interval: float = CONVERSION_CACHE_PRUNE_INTERVAL,
+                 connect=None, release=None):
+        super().__init__()
+        if connect is None:
+            from database import get_db_connection, release_db_connection
+            connect, release = get_db_connection, release_db_connection
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        self._connect = connect
+        self._release = release or (lambda conn: conn.close())
+
+    def _lookup(self, content_hash, converter_version):
+        conn = self._connect()
+        if not conn:
+            logger.error("Database connection error during conversion cache lookup.")
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT pdf_s3_key FROM conversion_cache WHERE content_hash = %s AND converter_version = %s "
+                "AND created_at > now() - make_interval(secs => %s)",
+                (content_hash, converter_version, self.ttl)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Error as e:
+            logger.error(f"Error looking up conversion cache for '{content_hash}': {e}", exc_info=True)
+            return None
+        finally:
+            self._release(conn)
+
+    def _prune_due(self) -> bool:
+        """True for one caller per prune_interval, so expired rows are not deleted on every store."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_prune:
+                return False
+            self._next_prune = now + self.prune_interval
+            return True
+
+    def _store(self, content_hash, converter_version, pdf_s3_key):
+        conn = self._connect()
+        if not conn:
+            logger.error("Database connection error during conversion cache store.")
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO conversion_cache (content_hash, converter_version, pdf_s3_key) VALUES (%s, %s, %s) "
+                "ON CONFLICT (content_hash, converter_version) "
+                "DO UPDATE SET pdf_s3_key = EXCLUDED.pdf_s3_key, created_at = now()",
+                (content_hash, converter_version, pdf_s3_key)
+            )
+            if self._prune_due():
+                # Uses idx_conversion_cache_created (migration 7).
+                cursor.execute("DELETE FROM conversion_cache WHERE created_at < now() - make_interval(secs => %s)",
+                               (self.ttl,))
+                self._count("evictions", cursor.rowcount)
+            conn.commit()
+        except Error as e:
+            logger.error(f"Error storing conversion cache entry for '{content_hash}': {e}", exc_info=True)
+            conn.rollback()
+        finally:
+            self._release(conn)
+
+    def _remove(self, content_hash, converter_version):
+        conn = self._connect()
+        if not conn:
+            logger.error("Database connection error during conversion cache invalidation.")
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM conversion_cache WHERE content_hash = %s AND converter_version = %s",
+                           (content_hash, converter_version))
+            conn.commit()
+        except Error as e:
+            logger.error(f"Error invalidating conversion cache entry for '{content_hash}': {e}", exc_info=True)
+            conn.rollback()
+        finally:
+            self._release(conn)
+
+
+def create_conversion_cache(name: str | None = None) -> ConversionCache:
+    """Builds the cache selected by CONVERSION_CACHE_BACKEND (or `name`)."""
+    name = (name or CONVERSION_CACHE_BACKEND).lower()
+    if name == "memory":
+        return LRUConversionCache()
+    if name == "postgres":
+        return PostgresConversionCache()
+    if name == "none":
+        return NullConversionCache()
+    raise ValueError(f"Unknown conversion cache backend: {name}")
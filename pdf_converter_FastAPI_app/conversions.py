@@ -0,0 +1,532 @@
+# conversions.py
+import os
+import re
+import json
+import time
+import queue
+import base64
+import logging
+import datetime
+import threading
+import subprocess
+from collections import OrderedDict
+from psycopg2 import Error
+from psycopg2.extras import execute_values
+from optimizer import QPDF_PATH
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# "postgres" (conversions table from migrations.py), "memory" (per-process) or "none"
+CONVERSION_LOG_BACKEND = os.getenv("CONVERSION_LOG_BACKEND", "postgres")
+# Records are written by a background thread in batches of up to FLUSH_SIZE rows, at
+# least every FLUSH_INTERVAL seconds. When the buffer is full new records are dropped
+# (and counted) rather than slowing down /convert.
+CONVERSION_LOG_FLUSH_SIZE = int(os.getenv("CONVERSION_LOG_FLUSH_SIZE", "100"))
+CONVERSION_LOG_FLUSH_INTERVAL = float(os.getenv("CONVERSION_LOG_FLUSH_INTERVAL", "1"))
+CONVERSION_LOG_MAX_PENDING = int(os.getenv("CONVERSION_LOG_MAX_PENDING", "10000"))
+CONVERSIONS_PAGE_SIZE = int(os.getenv("CONVERSIONS_PAGE_SIZE", "20"))
+CONVERSIONS_MAX_PAGE_SIZE = 100
+# Owners of recently converted (and recently checked) file_ids, so ownership checks for
+# downloads and previews rarely reach the database; includes records still waiting to be written.
+CONVERSION_OWNERS_CACHE_SIZE = int(os.getenv("CONVERSION_OWNERS_CACHE_SIZE", "10000"))
+
+_FIELDS = ("username", "file_id", "filename", "content_hash", "input_size", "output_size", "page_count",
+           "status", "timings", "created_at")
+# Page counting reads PDFs in chunks of this size, so memory use does not grow with the file.
+PAGE_COUNT_CHUNK_SIZE = 1024 * 1024
+_PAGE_PATTERN = re.compile(rb"/Type\s{0,32}/Page(?![s\w])")
+_OBJECT_STREAM_PATTERN = re.compile(rb"/Type\s{0,32}/ObjStm")
+# Longer than any match, so one cut by a chunk boundary is found in the next chunk.
+_SCAN_OVERLAP = 64
+
+
+def count_pdf_pages(path: str, qpdf_path: str | None = QPDF_PATH) -> int | None:
+    """
+    Counts page objects in a PDF; None when unreadable. Objects packed into compressed
+    object streams cannot be scanned, so such files are counted by `qpdf --show-npages`
+    (None without qpdf).
+    """
+    count, packed, data = 0, False, b""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(PAGE_COUNT_CHUNK_SIZE)
+                data += chunk
+                # Matches starting in the overlap are counted with the next chunk.
+                end = len(data) - _SCAN_OVERLAP if chunk else len(data)
+                for match in _PAGE_PATTERN.finditer(data):
+                    if match.start() >= end:
+                        break
+                    count += 1
+                packed = packed or _OBJECT_STREAM_PATTERN.search(data) is not None
+                if not chunk:
+                    break
+                data = data[max(end, 0):]
+    except OSError:
+        return None
+    if packed:
+        return _qpdf_page_count(path, qpdf_path)
+    return count or None
+
+
+def _qpdf_page_count(path: str, qpdf_path: str | None) -> int | None:
+    if not qpdf_path:
+        return None
+    try:
+        result = subprocess.run([qpdf_path, "--show-npages", path], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not count pages of '{path}' with qpdf: {e}")
+        return None
+    # qpdf exits with 3 when it succeeded with warnings.
+    if result.returncode not in (0, 3) or not result.stdout.strip().isdigit():
+        return None
+    return int(result.stdout.strip()) or None
+
+
+def encode_cursor(created_at: float, row_id) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        created_at, _, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        return float(created_at), row_id
+    except (UnicodeDecodeError, ValueError, base64.binascii.Error) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def _merge(records: list[dict]) -> list[dict]:
+    """Collapses records for the same (username, file_id) into one, later values winning."""
+    merged = {}
+    for record in records:
+        key = (record.get("username"), record["file_id"])
+        current = merged.setdefault(key, {})
+        for name, value in record.items():
+            if name == "timings" and current.get("timings"):
+                value = {**current["timings"], **(value or {})}
+            if value is not None:
+                current[name] = value
+    return list(merged.values())
+
+
+# -------------------- Conversion Logs --------------------
+class ConversionLog:
+    """
+    Per-user history of conversions. record() only enqueues; a background thread
+    writes batches, so recording never adds latency to a request. Records with a
+    username create (or update) that user's row; records without one update every
+    row for the file_id (used when a queued job finishes). owns() tells whether a
+    file_id belongs to a user, owns_batch() whether a batch zip does.
+    """
+    name = "base"
+
+    def __init__(self, flush_size: int = CONVERSION_LOG_FLUSH_SIZE,
+                 flush_interval: float = CONVERSION_LOG_FLUSH_INTERVAL,
+                 max_pending: int = CONVERSION_LOG_MAX_PENDING,
+                 owners_cache_size: int = CONVERSION_OWNERS_CACHE_SIZE):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.owners_cache_size = owners_cache_size
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._owners = OrderedDict()
+        self._counters = {"recorded": 0, "written": 0, "dropped": 0, "failed_batches": 0,
+                          "owner_checks": 0, "owner_lookups": 0, "owner_unknown": 0}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _remember_owner(self, username: str, file_id: str):
+        with self._lock:
+            self._owners[file_id] = username
+            self._owners.move_to_end(file_id)
+            while len(self._owners) > self.owners_cache_size:
+                self._owners.popitem(last=False)
+
+    def owns(self, username: str, file_id: str) -> bool:
+        """
+        Whether `username` converted `file_id`. Answered from memory for recent conversions
+        and earlier positive answers, otherwise from the backend; blocks on a miss.
+        Only a file recorded for someone else is refused. One the history has no row for
+        (not written yet, dropped, or a backend that stores nothing) is allowed with a
+        warning, so its owner is not locked out of it.
+        """
+        return self._owns(username, file_id, lambda: self._lookup_owner(username, file_id))
+
+    def owns_batch(self, username: str, batch_id: str) -> bool:
+        """Whether `username` created the batch zip `batch_id`; cached like owns()."""
+        return self._owns(username, f"batch/{batch_id}", lambda: self._lookup_batch_owner(username, batch_id))
+
+    def _owns(self, username: str, key: str, lookup) -> bool:
+        self._count("owner_checks")
+        with self._lock:
+            if key in self._owners:
+                self._owners.move_to_end(key)
+                return self._owners[key] == username
+        self._count("owner_lookups")
+        owned = lookup()
+        if owned is None:
+            self._count("owner_unknown")
+            logger.warning(f"No conversion history for '{key}'; serving it to '{username}' unchecked.")
+            return True
+        if not owned:
+            return False
+        self._remember_owner(username, key)
+        return True
+
+    def record_batch(self, username: str, batch_id: str):
+        """
+        Stores who created a batch zip. Unlike record(), it is written before returning:
+        the zip's URL is handed out right away, and may be fetched from another instance.
+        """
+        self._write_batch_owner(username, batch_id)
+        self._remember_owner(username, f"batch/{batch_id}")
+
+    def record(self, file_id: str, username: str | None = None, **fields):
+        record = {"file_id": file_id, "username": username, **fields}
+        if username:
+            record.setdefault("created_at", time.time())
+            self._remember_owner(username, file_id)
+        try:
+            self._pending.put_nowait(record)
+            self._count("recorded")
+        except queue.Full:
+            self._count("dropped")
+            logger.warning(f"Conversion log buffer full; dropped record for {file_id}")
+            return
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="conversion-log", daemon=True)
+                self._thread.start()
+
+    def _drain(self, timeout: float) -> list[dict]:
+        records = []
+        deadline = time.monotonic() + timeout
+        while len(records) < self.flush_size:
+            try:
+                records.append(self._pending.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return records
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.flush(self._drain(self.flush_interval))
+
+    def flush(self, records: list[dict] | None = None):
+        """Writes `records` (default: everything pending) in one batch."""
+        if records is None:
+            records = self._drain(0)
+        if not records:
+            return
+        try:
+            self._write(_merge(records))
+            self._count("written", len(records))
+        except Exception as e:
+            self._count("failed_batches")
+            logger.error(f"Failed to write {len(records)} conversion records: {e}", exc_info=True)
+
+    def shutdown(self):
+        self._stop.set()
+        while not self._pending.empty():
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["pending"] = self._pending.qsize()
+        counters["backend"] = self.name
+        return counters
+
+    def list_for_user(self, username: str, limit: int, cursor: str | None = None) -> tuple[list[dict], str | None]:
+        """Newest first. Returns (conversions, cursor for the next page or None)."""
+        raise NotImplementedError
+
+    def _lookup_owner(self, username: str, file_id: str) -> bool | None:
+        """Whether the history has `file_id` for `username`; None when it has no row for the file at all."""
+        raise NotImplementedError
+
+    def _lookup_batch_owner(self, username: str, batch_id: str) -> bool | None:
+        raise NotImplementedError
+
+    def _write(self, records: list[dict]):
+        raise NotImplementedError
+
+    def _write_batch_owner(self, username: str, batch_id: str):
+        raise NotImplementedError
+
+
+class NullConversionLog(ConversionLog):
+    """
+    Disables the history; nothing is stored. Ownership is only known for this process's
+    conversions; files converted elsewhere are served unchecked.
+    """
+    name = "none"
+
+    def record(self, file_id: str, username: str | None = None, **fields):
+        if username:
+            self._remember_owner(username, file_id)
+
+    def list_for_user(self, username, limit, cursor=None):
+        return [], None
+
+    def _lookup_owner(self, username, file_id):
+        return None
+
+    def _lookup_batch_owner(self, username, batch_id):
+        return None
+
+    def _write(self, records):
+        pass
+
+    def _write_batch_owner(self, username, batch_id):
+        pass
+
+
+class InMemoryConversionLog(ConversionLog):
+    """Per-process history; for local runs without PostgreSQL."""
+    name = "memory"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rows = {}
+        self._batches = {}
+        self._next_id = 1
+
+    def _write(self, records):
+        with self._lock:
+            for record in records:
+                if record.get("username"):
+                    row = self._rows.get((record["username"], record["file_id"]))
+                    if row is None:
+                        row = self._rows[(record["username"], record["file_id"])] = {"id": self._next_id}
+                        self._next_id += 1
+                    rows = [row]
+                else:
+                    rows = [row for (_, file_id), row in self._rows.items() if file_id == record["file_id"]]
+                for row in rows:
+                    timings = {**row.get("timings", {}), **record.get("timings", {})}
+                    row.update({k: v for k, v in record.items() if v is not None}, timings=timings)
+
+    def list_for_user(self, username, limit, cursor=None):
+        with self._lock:
+            rows = sorted((dict(row) for (owner, _), row in self._rows.items() if owner == username),
+                          key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            rows = [row for row in rows if (row["created_at"], row["id"]) < (created_at, int(row_id))]
+        page = rows[:limit]
+        next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+        return [_public(row) for row in page], next_cursor
+
+    def _lookup_owner(self, username, file_id):
+        with self._lock:
+            owners = {owner for owner, key in self._rows if key == file_id}
+        return username in owners if owners else None
+
+    def _write_batch_owner(self, username, batch_id):
+        with self._lock:
+            self._batches[batch_id] = username
+
+    def _lookup_batch_owner(self, username, batch_id):
+        with self._lock:
+            owner = self._batches.get(batch_id)
+        return owner == username if owner else None
+
+
+class PostgresConversionLog(ConversionLog):
+    """Stores the history in the conversions table (migration 4 in migrations.py)."""
+    name = "postgres"
+
+    def __init__(self, connect=None, release=None, **kwargs):
+        super().__init__(**kwargs)
+        if connect is None:
+            from database import get_db_connection, release_db_connection
+            connect, release = get_db_connection, release_db_connection
+        self._connect = connect
+        self._release = release or (lambda conn: conn.close())
+
+    def _write(self, records):
+        inserts = [r for r in records if r.get("username")]
+        updates = [r for r in records if not r.get("username")]
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database connection error.")
+        try:
+            cursor = conn.cursor()
+            if inserts:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO conversions (user_id, file_id, filename, content_hash, input_size, output_size,
+                                             page_count, status, timings, created_at)
+                    SELECT u.id, v.file_id, v.filename, v.content_hash, v.input_size, v.output_size,
+                           v.page_count, v.status, v.timings, v.created_at
+                    FROM (VALUES %s) AS v (username, file_id, filename, content_hash, input_size, output_size,
+                                           page_count, status, timings, created_at)
+                    JOIN users u ON u.username = v.username
+                    ON CONFLICT (user_id, file_id) DO UPDATE SET
+                        status = EXCLUDED.status,
+                        output_size = COALESCE(EXCLUDED.output_size, conversions.output_size),
+                        page_count = COALESCE(EXCLUDED.page_count, conversions.page_count),
+                        timings = conversions.timings || EXCLUDED.timings,
+                        updated_at = now()
+                    """,
+                    [tuple(_db_value(name, r.get(name)) for name in _FIELDS) for r in inserts],
+                    template="(%s, %s, %s, %s, %s::bigint, %s::bigint, %s::integer, %s, %s::jsonb, to_timestamp(%s))"
+                )
+            if updates:
+                execute_values(
+                    cursor,
+                    """
+                    UPDATE conversions c SET
+                        status = COALESCE(v.status, c.status),
+                        output_size = COALESCE(v.output_size, c.output_size),
+                        page_count = COALESCE(v.page_count, c.page_count),
+                        timings = c.timings || v.timings,
+                        updated_at = now()
+                    FROM (VALUES %s) AS v (file_id, status, output_size, page_count, timings)
+                    WHERE c.file_id = v.file_id
+                    """,
+                    [(r["file_id"], r.get("status"), r.get("output_size"), r.get("page_count"),
+                      json.dumps(r.get("timings") or {})) for r in updates],
+                    template="(%s, %s, %s::bigint, %s::integer, %s::jsonb)"
+                )
+            conn.commit()
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def list_for_user(self, username, limit, cursor=None):
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database connection error.")
+        try:
+            db_cursor = conn.cursor()
+            # Keyset pagination on (created_at, id) walks idx_conversions_user_created, so
+            # every page costs the same no matter how deep it is.
+            sql = """
+                SELECT id, file_id, filename, content_hash, input_size, output_size, page_count, status,
+                       timings, extract(epoch FROM created_at)
+                FROM conversions
+                WHERE user_id = (SELECT id FROM users WHERE username = %s)
+            """
+            params = [username]
+            if cursor:
+                created_at, row_id = decode_cursor(cursor)
+                sql += " AND (created_at, id) < (to_timestamp(%s), %s)"
+                params += [created_at, int(row_id)]
+            sql += " ORDER BY created_at DESC, id DESC LIMIT %s"
+            params.append(limit + 1)
+            db_cursor.execute(sql, tuple(params))
+            rows = db_cursor.fetchall()
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+        names = ("id", "file_id", "filename", "content_hash", "input_size", "output_size", "page_count",
+                 "status", "timings", "created_at")
+        page = [dict(zip(names, row)) for row in rows[:limit]]
+        for row in page:
+            row["created_at"] = float(row["created_at"])
+        next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+        return [_public(row) for row in page], next_cursor
+
+    def _lookup_owner(self, username, file_id):
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database connection error.")
+        try:
+            cursor = conn.cursor()
+            # Walks idx_conversions_file_id; NULL when no row has the file_id.
+            cursor.execute(
+                "SELECT bool_or(user_id IS NOT DISTINCT FROM (SELECT id FROM users WHERE username = %s)) "
+                "FROM conversions WHERE file_id = %s",
+                (username, file_id)
+            )
+            return cursor.fetchone()[0]
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def _write_batch_owner(self, username, batch_id):
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database connection error.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO conversion_batches (batch_id, user_id) SELECT %s, id FROM users WHERE username = %s",
+                           (batch_id, username))
+            conn.commit()
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def _lookup_batch_owner(self, username, batch_id):
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database connection error.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT user_id IS NOT DISTINCT FROM (SELECT id FROM users WHERE username = %s) "
+                "FROM conversion_batches WHERE batch_id = %s",
+                (username, batch_id)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+
+def _db_value(name: str, value):
+    if name == "timings":
+        return json.dumps(value or {})
+    return value
+
+
+def _public(row: dict) -> dict:
+    """API shape of a conversion row."""
+    return {
+        "file_id": row["file_id"],
+        "filename": row.get("filename"),
+        "status": row.get("status"),
+        "input_size": row.get("input_size"),
+        "output_size": row.get("output_size"),
+        "page_count": row.get("page_count"),
+        "timings": row.get("timings") or {},
+        "created_at": datetime.datetime.fromtimestamp(row["created_at"], datetime.timezone.utc).isoformat(),
+    }
+
+
+def create_conversion_log(name: str | None = None) -> ConversionLog:
+    """Builds the backend selected by CONVERSION_LOG_BACKEND (or `name`)."""
+    name = (name or CONVERSION_LOG_BACKEND).lower()
+    if name == "postgres":
+        return PostgresConversionLog()
+    if name == "memory":
+        return InMemoryConversionLog()
+    if name == "none":
+        return NullConversionLog()
+    raise ValueError(f"Unknown conversion log backend: {name}")
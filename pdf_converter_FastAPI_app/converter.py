@@ -0,0 +1,1021 @@
+# converter.py
+import os
+import sys
+import time
+import queue
+import socket
+import shutil
+import signal
+import asyncio
+import contextlib
+import logging
+import math
+import functools
+import tempfile
+import threading
+import subprocess
+from metrics import metrics
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- LibreOffice Path --------------------
+# Corrected path based on your EFS mount configuration
+LIBREOFFICE_PATH = os.getenv("LIBREOFFICE_PATH", '/mnt/libreoffice/program/soffice.bin')
+# Path to the Xvfb executable
+XVFB_RUN_PATH = os.getenv("XVFB_RUN_PATH", '/mnt/libreoffice/bin/xvfb/xvfb-run')
+
+# -------------------- Engine Configuration --------------------
+# "pool" keeps warm LibreOffice instances, "cli" spawns one soffice.bin per document,
+# "fake" writes a placeholder PDF and is meant for running the pool without LibreOffice.
+CONVERTER_BACKEND = os.getenv("CONVERTER_BACKEND", "pool")
+LIBREOFFICE_POOL_SIZE = int(os.getenv("LIBREOFFICE_POOL_SIZE", "2"))
+LIBREOFFICE_MAX_JOBS_PER_INSTANCE = int(os.getenv("LIBREOFFICE_MAX_JOBS_PER_INSTANCE", "50"))
+LIBREOFFICE_JOB_TIMEOUT = float(os.getenv("LIBREOFFICE_JOB_TIMEOUT", "120"))
+LIBREOFFICE_STARTUP_TIMEOUT = float(os.getenv("LIBREOFFICE_STARTUP_TIMEOUT", "30"))
+LIBREOFFICE_CHECKOUT_TIMEOUT = float(os.getenv("LIBREOFFICE_CHECKOUT_TIMEOUT", "60"))
+# Pooled instances take the first free Xvfb display from this one up; their UNO ports are
+# picked by the OS, so several workers or processes on one host never share either.
+XVFB_BASE_DISPLAY = int(os.getenv("XVFB_BASE_DISPLAY", "99"))
+# Overrides the detected converter version (used to key the conversion cache).
+CONVERTER_VERSION = os.getenv("CONVERTER_VERSION")
+# The CLI backend runs each conversion with its own LibreOffice user profile, taken from
+# a pool of profiles initialized once under this directory; 0 sizes the pool to the
+# admission concurrency.
+LIBREOFFICE_PROFILE_DIR = os.getenv("LIBREOFFICE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "lo_profiles"))
+LIBREOFFICE_PROFILE_POOL_SIZE = int(os.getenv("LIBREOFFICE_PROFILE_POOL_SIZE", "0"))
+
+# -------------------- Supervisor Configuration --------------------
+# Conversions running at once; 0 sizes it from the CPUs and memory available
+# (CONVERTER_JOB_MEMORY_MB per conversion), capped at the pool size.
+CONVERTER_MAX_CONCURRENCY = int(os.getenv("CONVERTER_MAX_CONCURRENCY", "0"))
+CONVERTER_JOB_MEMORY_MB = int(os.getenv("CONVERTER_JOB_MEMORY_MB", "512"))
+# Requests allowed to wait for a slot, and for how long, before they get 429/503 with Retry-After.
+CONVERTER_QUEUE_SIZE = int(os.getenv("CONVERTER_QUEUE_SIZE", "16"))
+CONVERTER_QUEUE_TIMEOUT = float(os.getenv("CONVERTER_QUEUE_TIMEOUT", "30"))
+# Resident memory of a converter's whole process group (xvfb-run, Xvfb, soffice.bin)
+# above which it is killed; 0 disables the check.
+CONVERTER_MAX_RSS_MB = int(os.getenv("CONVERTER_MAX_RSS_MB", "1536"))
+# How often running conversions are checked against the wall-clock and RSS limits.
+CONVERTER_WATCH_INTERVAL = float(os.getenv("CONVERTER_WATCH_INTERVAL", "0.5"))
+
+
+class ConversionError(Exception):
+    """Raised when a document could not be converted to PDF."""
+
+
+class ConversionTimeout(ConversionError):
+    """Raised when a conversion did not finish within the job timeout."""
+
+
+class ConversionMemoryExceeded(ConversionError):
+    """Raised when a converter's processes grew past CONVERTER_MAX_RSS_MB and were killed."""
+
+
+class InvalidPageRange(ConversionError):
+    """Raised when a page range selects no page of the document."""
+
+
+class ConverterBusy(ConversionError):
+    """Raised by admission control when a conversion cannot be started now."""
+
+    def __init__(self, message: str, reason: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# -------------------- Page Ranges --------------------
+MAX_PAGE_NUMBER = 100000
+
+
+class PageRange:
+    """
+    The 1-based pages of a document to export, e.g. "1-3,5". Spans are sorted and merged,
+    so equal selections have the same str(), which is also the form LibreOffice's PDF
+    export takes as its PageRange option.
+    """
+    __slots__ = ("spans",)
+
+    def __init__(self, spans: list[tuple[int, int]]):
+        merged = []
+        for first, last in sorted(spans):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+        self.spans = tuple(merged)
+
+    @classmethod
+    def parse(cls, text: str) -> "PageRange":
+        """ValueError unless `text` is a comma-separated list of pages ("4") and spans ("1-3")."""
+        spans = []
+        for part in text.replace(" ", "").split(","):
+            first, dash, last = part.partition("-")
+            if not first.isdigit() or (dash and not last.isdigit()):
+                raise ValueError(f"Invalid page range: {text!r}")
+            first, last = int(first), int(last or first)
+            if not 1 <= first <= last <= MAX_PAGE_NUMBER:
+                raise ValueError(f"Invalid page range: {text!r}")
+            spans.append((first, last))
+        return cls(spans)
+
+    @property
+    def last(self) -> int:
+        return self.spans[-1][1]
+
+    def __contains__(self, page: int) -> bool:
+        return any(first <= page <= last for first, last in self.spans)
+
+    def __str__(self):
+        return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in self.spans)
+
+    def __repr__(self):
+        return f"PageRange({str(self)!r})"
+
+
+# Spreadsheets and presentations have their own PDF export filters.
+_PDF_EXPORT_FILTERS = {
+    **dict.fromkeys((".xlsx", ".xls", ".ods", ".csv"), "calc_pdf_Export"),
+    **dict.fromkeys((".pptx", ".ppt", ".odp", ".pps", ".ppsx"), "impress_pdf_Export"),
+}
+
+
+def pdf_export_filter(input_path: str) -> str:
+    return _PDF_EXPORT_FILTERS.get(os.path.splitext(input_path)[1].lower(), "writer_pdf_Export")
+
+
+# -------------------- Backend Interface --------------------
+class ConverterBackend:
+    """
+    Interface every conversion backend implements.
+    convert() writes '<input stem>.pdf' into output_dir and returns its path; with a
+    page_range, only those pages of the document are exported.
+    """
+    name = "base"
+    # Whether aconvert_many() runs all its documents in one converter process.
+    batches_in_one_process = False
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        raise NotImplementedError
+
+    async def aconvert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        """Async variant for the event loop; the default runs convert() on a worker thread."""
+        return await asyncio.to_thread(self.convert, input_path, output_dir, page_range)
+
+    async def aconvert_many(self, input_paths: list[str], output_dir: str) -> dict:
+        """
+        Converts several documents; returns {input_path: output_path or Exception}.
+        The default converts them concurrently, one aconvert() per document.
+        """
+        results = await asyncio.gather(*(self.aconvert(path, output_dir) for path in input_paths),
+                                       return_exceptions=True)
+        return dict(zip(input_paths, results))
+
+    def version(self) -> str:
+        """Identifies the converter build; outputs of different versions are never mixed."""
+        return CONVERTER_VERSION or self.name
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+    def shutdown(self):
+        pass
+
+
+def _output_path_for(input_path: str, output_dir: str) -> str:
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{stem}.pdf")
+
+
+@functools.lru_cache(maxsize=1)
+def libreoffice_version() -> str:
+    """`soffice.bin --version`, run once per process."""
+    try:
+        result = subprocess.run([LIBREOFFICE_PATH, "--version"], capture_output=True, text=True,
+                                timeout=LIBREOFFICE_STARTUP_TIMEOUT, check=True)
+        return result.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not determine LibreOffice version: {e}")
+        return "unknown"
+
+
+def _kill_process_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+# -------------------- Process Limits --------------------
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_group_rss(pgid: int) -> int:
+    """Resident bytes of every process in a process group, from /proc; 0 where that is unavailable."""
+    total = 0
+    try:
+        pids = [name for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+            # Fields after "(comm) ": state, ppid, pgrp, ... rss is the 22nd of them.
+            fields = stat[stat.rindex(b")") + 2:].split()
+            if int(fields[2]) == pgid:
+                total += int(fields[21]) * PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+
+def _limit_breach(pgid: int, deadline: float, timeout: float, what: str,
+                  max_rss_mb: int = CONVERTER_MAX_RSS_MB) -> ConversionError | None:
+    """The error to raise if a process group is past its deadline or RSS limit, else None."""
+    if time.monotonic() >= deadline:
+        metrics.increment("converter_timeouts_total", stage="job")
+        metrics.increment("converter_kills_total", reason="timeout")
+        return ConversionTimeout(f"Conversion of {what} exceeded {timeout}s.")
+    if max_rss_mb:
+        rss = process_group_rss(pgid)
+        if rss > max_rss_mb * 1024 * 1024:
+            metrics.increment("converter_kills_total", reason="memory")
+            return ConversionMemoryExceeded(f"Conversion of {what} used {rss // (1024 * 1024)} MB, "
+                                            f"more than the {max_rss_mb} MB limit.")
+    return None
+
+
+def _watch_process(process: subprocess.Popen, timeout: float, what: str) -> tuple:
+    """communicate() for a process started in its own session, killing the group on a breached limit."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return process.communicate(timeout=CONVERTER_WATCH_INTERVAL)
+        except subprocess.TimeoutExpired:
+            pass
+        breach = _limit_breach(process.pid, deadline, timeout, what)
+        if breach is not None:
+            logger.error(f"Killing converter process group {process.pid}: {breach}")
+            _kill_process_group(process.pid)
+            process.communicate()
+            raise breach
+
+
+async def _awatch_process(process: asyncio.subprocess.Process, timeout: float, what: str) -> tuple:
+    """Async _watch_process; the group is also killed if the caller is cancelled."""
+    deadline = time.monotonic() + timeout
+    communicate = asyncio.ensure_future(process.communicate())
+    try:
+        while True:
+            done, _ = await asyncio.wait({communicate}, timeout=CONVERTER_WATCH_INTERVAL)
+            if done:
+                return communicate.result()
+            # Scanning /proc takes a moment with many processes; keep it off the event loop.
+            breach = await asyncio.to_thread(_limit_breach, process.pid, deadline, timeout, what)
+            if breach is not None:
+                logger.error(f"Killing converter process group {process.pid}: {breach}")
+                _kill_process_group(process.pid)
+                await communicate
+                raise breach
+    except asyncio.CancelledError:
+        _kill_process_group(process.pid)
+        communicate.cancel()
+        raise
+
+
+# -------------------- User Profiles --------------------
+def converter_env(profile_dir: str) -> dict:
+    """
+    Environment for one LibreOffice process: soffice.bin's directory on PATH and
+    HOME in its own profile. Built per process, never written to os.environ.
+    """
+    env = dict(os.environ)
+    env["PATH"] = f"{os.path.dirname(LIBREOFFICE_PATH)}:{env.get('PATH', '')}"
+    env["HOME"] = profile_dir
+    return env
+
+
+class ProfilePool:
+    """
+    LibreOffice user profiles handed to one conversion at a time.
+    LibreOffice locks a profile while it runs, so conversions sharing one would run
+    one after another. Each profile is initialized on first checkout (LibreOffice
+    writes several MB of defaults on first start) and marked, so later jobs and warm
+    containers reuse it as it is. A profile whose process was killed mid-job is wiped
+    and initialized again.
+    """
+    MARKER = ".initialized"
+
+    def __init__(self, size: int, root: str = LIBREOFFICE_PROFILE_DIR):
+        self.size = size
+        self.root = root
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {"checkouts": 0, "waits": 0, "initializations": 0, "resets": 0}
+        for index in range(size):
+            self._free.put(os.path.join(root, f"profile_{index}"))
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _initialize(self, profile_dir: str):
+        if os.path.exists(os.path.join(profile_dir, self.MARKER)):
+            return
+        os.makedirs(profile_dir, exist_ok=True)
+        with metrics.span("converter_seconds", operation="profile_init"):
+            try:
+                subprocess.run([XVFB_RUN_PATH, "-a", LIBREOFFICE_PATH, *_profile_args(profile_dir),
+                                "--terminate_after_init"],
+                               env=converter_env(profile_dir), stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, timeout=LIBREOFFICE_STARTUP_TIMEOUT, check=True)
+            except (OSError, subprocess.SubprocessError) as e:
+                # The first conversion in this profile will initialize it instead.
+                logger.warning(f"Could not initialize LibreOffice profile '{profile_dir}': {e}")
+                return
+        open(os.path.join(profile_dir, self.MARKER), "w").close()
+        self._count("initializations")
+
+    def acquire(self) -> str:
+        try:
+            profile_dir = self._free.get_nowait()
+        except queue.Empty:
+            self._count("waits")
+            profile_dir = self._free.get()
+        self._count("checkouts")
+        try:
+            self._initialize(profile_dir)
+        except BaseException:
+            self._free.put(profile_dir)
+            raise
+        return profile_dir
+
+    def release(self, profile_dir: str, reset: bool = False):
+        if reset:
+            logger.warning(f"Resetting LibreOffice profile '{profile_dir}' after a killed conversion.")
+            self._count("resets")
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        self._free.put(profile_dir)
+
+    @contextlib.contextmanager
+    def profile(self):
+        profile_dir = self.acquire()
+        reset = False
+        try:
+            yield profile_dir
+        except (ConversionTimeout, ConversionMemoryExceeded):
+            reset = True
+            raise
+        finally:
+            self.release(profile_dir, reset)
+
+    @contextlib.asynccontextmanager
+    async def aprofile(self):
+        """profile() for the event loop; waiting and first-time initialization run on a worker thread."""
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.acquire))
+        try:
+            profile_dir = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            def give_back(future):
+                if not future.cancelled() and future.exception() is None:
+                    self.release(future.result())
+
+            # The thread still gets a profile; hand it back once it does.
+            acquiring.add_done_callback(give_back)
+            raise
+        reset = False
+        try:
+            yield profile_dir
+        except (ConversionTimeout, ConversionMemoryExceeded, asyncio.CancelledError):
+            reset = True
+            raise
+        finally:
+            self.release(profile_dir, reset)
+
+    def stats(self) -> dict:
+        return {**self._counters, "size": self.size, "free": self._free.qsize()}
+
+
+def _profile_args(profile_dir: str) -> list[str]:
+    return ["--headless", "--nologo", "--norestore", "--nolockcheck",
+            f"-env:UserInstallation=file://{profile_dir}"]
+
+
+# -------------------- One-shot CLI Backend --------------------
+class LibreOfficeCLIBackend(ConverterBackend):
+    """
+    Spawns xvfb-run + soffice.bin --convert-to pdf for every document, each in a
+    user profile of its own from `profiles`, so concurrent conversions run in parallel.
+    """
+    name = "cli"
+    batches_in_one_process = True
+
+    def __init__(self, profiles: ProfilePool | None = None):
+        self.profiles = profiles or ProfilePool(LIBREOFFICE_PROFILE_POOL_SIZE or 1)
+
+    def version(self) -> str:
+        return CONVERTER_VERSION or libreoffice_version()
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "profiles": self.profiles.stats()}
+
+    @staticmethod
+    def _command(input_path: str | list[str], output_dir: str, profile_dir: str,
+                 page_range: PageRange | None = None) -> list[str]:
+        input_paths = [input_path] if isinstance(input_path, str) else input_path
+        target = "pdf"
+        if page_range is not None:
+            # Filter options as JSON need LibreOffice 7.4 or later.
+            target = (f'pdf:{pdf_export_filter(input_paths[0])}:'
+                      f'{{"PageRange":{{"type":"string","value":"{page_range}"}}}}')
+        return [
+            XVFB_RUN_PATH,
+            # Picks a free display, so parallel conversions do not collide on :99.
+            "-a",
+            LIBREOFFICE_PATH,
+            *_profile_args(profile_dir),
+            "--convert-to",
+            target,
+            *input_paths,
+            "--outdir",
+            output_dir
+        ]
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        logger.info(f"Starting LibreOffice conversion for '{input_path}' into '{output_dir}'")
+        with self.profiles.profile() as profile_dir, metrics.span("converter_seconds", operation="cli_process"):
+            # A new session, so a timeout or RSS breach kills Xvfb and soffice.bin too, not just xvfb-run.
+            process = subprocess.Popen(
+                self._command(input_path, output_dir, profile_dir, page_range),
+                env=converter_env(profile_dir),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                start_new_session=True
+            )
+            stdout, stderr = _watch_process(process, LIBREOFFICE_JOB_TIMEOUT, f"'{input_path}'")
+        logger.info(f"LibreOffice stdout: {stdout}")
+        logger.info(f"LibreOffice stderr: {stderr}")
+        if process.returncode != 0:
+            raise ConversionError(stderr)
+        return _output_path_for(input_path, output_dir)
+
+    async def aconvert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        """
+        Runs soffice.bin without blocking the event loop. On timeout, RSS breach or
+        cancellation the whole process group (xvfb-run, Xvfb, soffice.bin) is killed.
+        """
+        logger.info(f"Starting LibreOffice conversion for '{input_path}' into '{output_dir}'")
+        async with self.profiles.aprofile() as profile_dir:
+            process = await asyncio.create_subprocess_exec(
+                *self._command(input_path, output_dir, profile_dir, page_range),
+                env=converter_env(profile_dir),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+            with metrics.span("converter_seconds", operation="cli_process"):
+                stdout, stderr = await _awatch_process(process, LIBREOFFICE_JOB_TIMEOUT, f"'{input_path}'")
+        logger.info(f"LibreOffice stdout: {stdout.decode(errors='replace')}")
+        logger.info(f"LibreOffice stderr: {stderr.decode(errors='replace')}")
+        if process.returncode != 0:
+            raise ConversionError(stderr.decode(errors='replace'))
+        return _output_path_for(input_path, output_dir)
+
+    async def aconvert_many(self, input_paths: list[str], output_dir: str) -> dict:
+        """
+        Converts all documents in a single soffice.bin invocation, paying the startup once.
+        Inputs whose PDF is missing afterwards are reported individually.
+        """
+        if not input_paths:
+            return {}
+        timeout = LIBREOFFICE_JOB_TIMEOUT * len(input_paths)
+        logger.info(f"Starting LibreOffice batch conversion of {len(input_paths)} documents into '{output_dir}'")
+        try:
+            async with self.profiles.aprofile() as profile_dir:
+                process = await asyncio.create_subprocess_exec(
+                    *self._command(input_paths, output_dir, profile_dir),
+                    env=converter_env(profile_dir),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True
+                )
+                _, stderr = await _awatch_process(process, timeout, f"a batch of {len(input_paths)} documents")
+        except (ConversionTimeout, ConversionMemoryExceeded) as e:
+            stderr = str(e).encode()
+        message = stderr.decode(errors='replace') or (
+            f"LibreOffice exited with code {process.returncode}." if process.returncode
+            else "PDF output file not found after conversion.")
+        results = {}
+        for input_path in input_paths:
+            output_path = _output_path_for(input_path, output_dir)
+            results[input_path] = output_path if os.path.exists(output_path) else ConversionError(message)
+        return results
+
+
+# -------------------- Pooled Instances --------------------
+class LibreOfficeInstance:
+    """
+    A long-lived headless LibreOffice process with its own user profile, Xvfb display
+    and UNO socket. Documents are handed over through the UNO bridge.
+    The port, display and profile directory are picked anew on every start, so
+    instances of other workers and processes on the same host never collide.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.port = None
+        self.profile_dir = None
+        self.jobs_done = 0
+        self.process = None
+        self._desktop = None
+
+    def start(self):
+        self.port = _free_port()
+        self.profile_dir = tempfile.mkdtemp(prefix=f"lo_profile_{self.index}_")
+        env = converter_env(self.profile_dir)
+        command = [
+            XVFB_RUN_PATH,
+            # The first display from XVFB_BASE_DISPLAY up that no other Xvfb holds.
+            "-a",
+            "-n", str(XVFB_BASE_DISPLAY),
+            LIBREOFFICE_PATH,
+            "--headless",
+            "--invisible",
+            "--nologo",
+            "--nodefault",
+            "--norestore",
+            "--nolockcheck",
+            f"-env:UserInstallation=file://{self.profile_dir}",
+            f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext",
+        ]
+        logger.info(f"Starting LibreOffice instance {self.index} on port {self.port}, profile '{self.profile_dir}'")
+        # A new session lets us kill xvfb-run, Xvfb and soffice.bin together.
+        self.process = subprocess.Popen(
+            command,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        self._wait_for_socket()
+        self._desktop = self._connect()
+        self.jobs_done = 0
+
+    def _wait_for_socket(self):
+        deadline = time.monotonic() + LIBREOFFICE_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise ConversionError(f"LibreOffice instance {self.index} exited during startup "
+                                      f"with code {self.process.returncode}.")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise ConversionTimeout(f"LibreOffice instance {self.index} did not accept connections "
+                                f"within {LIBREOFFICE_STARTUP_TIMEOUT}s.")
+
+    def _connect(self):
+        uno = _import_uno()
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context)
+        context = resolver.resolve(
+            f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+        return context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        uno = _import_uno()
+        from com.sun.star.beans import PropertyValue
+
+        output_path = _output_path_for(input_path, output_dir)
+        document = self._desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(input_path)), "_blank", 0,
+            (PropertyValue(Name="Hidden", Value=True),))
+        if document is None:
+            raise ConversionError(f"LibreOffice could not open '{input_path}'.")
+        options = [PropertyValue(Name="FilterName", Value=pdf_export_filter(input_path))]
+        if page_range is not None:
+            filter_data = uno.Any("[]com.sun.star.beans.PropertyValue",
+                                  (PropertyValue(Name="PageRange", Value=str(page_range)),))
+            options.append(PropertyValue(Name="FilterData", Value=filter_data))
+        try:
+            document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(output_path)), tuple(options))
+        finally:
+            document.close(True)
+        return output_path
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None and self._desktop is not None
+
+    def rss(self) -> int:
+        """Resident bytes of xvfb-run, Xvfb and soffice.bin together."""
+        return process_group_rss(self.process.pid) if self.process is not None else 0
+
+    def stop(self):
+        self._desktop = None
+        if self.process is not None:
+            if self.process.poll() is None:
+                _kill_process_group(self.process.pid)
+                self.process.wait()
+            logger.info(f"Stopped LibreOffice instance {self.index}")
+            self.process = None
+        if self.profile_dir is not None:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+
+def _free_port() -> int:
+    """A TCP port on 127.0.0.1 that no process is listening on right now."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _import_uno():
+    """Imports the UNO bridge, looking next to soffice.bin when it is not on sys.path."""
+    program_dir = os.path.dirname(LIBREOFFICE_PATH)
+    if program_dir not in sys.path:
+        sys.path.append(program_dir)
+    import uno
+    return uno
+
+
+class FakeInstance:
+    """
+    Stand-in for LibreOfficeInstance that writes a tiny placeholder PDF.
+    Lets the pool's checkout, restart and recycle logic run without LibreOffice installed.
+    """
+    PDF_BYTES = (b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+                 b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+                 b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\n"
+                 b"trailer<</Root 1 0 R>>\n%%EOF\n")
+
+    def __init__(self, index: int, delay: float = float(os.getenv("FAKE_CONVERTER_DELAY", "0"))):
+        self.index = index
+        self.delay = delay
+        self.jobs_done = 0
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+        self.jobs_done = 0
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        output_path = _output_path_for(input_path, output_dir)
+        with open(output_path, "wb") as f:
+            f.write(self.PDF_BYTES)
+        return output_path
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+    def rss(self) -> int:
+        return 0
+
+    def stop(self):
+        self.alive = False
+
+
+# -------------------- Instance Pool --------------------
+class ConverterPool:
+    """
+    Keeps `size` converter instances checked in and hands each job to an idle one.
+    Dead instances are restarted on checkout, hung ones are killed after job_timeout,
+    ones grown past max_rss_mb are killed mid-job, and every instance is recycled
+    after max_jobs_per_instance conversions.
+    Instances are started lazily so importing the app never waits on LibreOffice.
+    """
+
+    def __init__(self, instance_factory, size: int = LIBREOFFICE_POOL_SIZE,
+                 max_jobs_per_instance: int = LIBREOFFICE_MAX_JOBS_PER_INSTANCE,
+                 job_timeout: float = LIBREOFFICE_JOB_TIMEOUT,
+                 checkout_timeout: float = LIBREOFFICE_CHECKOUT_TIMEOUT,
+                 max_rss_mb: int = CONVERTER_MAX_RSS_MB):
+        self.instance_factory = instance_factory
+        self.size = size
+        self.max_jobs_per_instance = max_jobs_per_instance
+        self.job_timeout = job_timeout
+        self.checkout_timeout = checkout_timeout
+        self.max_rss_mb = max_rss_mb
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {"jobs": 0, "failures": 0, "restarts": 0, "recycles": 0, "timeouts": 0, "memory_kills": 0}
+        for index in range(size):
+            self._idle.put(instance_factory(index))
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _checkout(self):
+        try:
+            with metrics.span("converter_seconds", operation="checkout_wait"):
+                instance = self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            metrics.increment("converter_timeouts_total", stage="checkout")
+            raise ConversionTimeout(f"No converter instance became free within {self.checkout_timeout}s.")
+        if not instance.is_alive():
+            try:
+                if instance.jobs_done:
+                    logger.warning(f"Converter instance {instance.index} died while idle, restarting it.")
+                    self._count("restarts")
+                instance.stop()
+                # Xvfb + soffice.bin startup and the UNO connection.
+                with metrics.span("converter_seconds", operation="instance_start"):
+                    instance.start()
+            except Exception:
+                # Keep the slot so the next job retries the startup.
+                instance.stop()
+                self._idle.put(instance)
+                raise
+        return instance
+
+    def _checkin(self, instance):
+        if instance.is_alive() and instance.jobs_done >= self.max_jobs_per_instance:
+            logger.info(f"Recycling converter instance {instance.index} after {instance.jobs_done} jobs.")
+            self._count("recycles")
+            instance.stop()
+            instance = self.instance_factory(instance.index)
+        self._idle.put(instance)
+
+    def _run_with_timeout(self, instance, input_path: str, output_dir: str,
+                          page_range: PageRange | None = None) -> str:
+        outcome = {}
+
+        def target():
+            try:
+                outcome["path"] = instance.convert(input_path, output_dir, page_range)
+            except BaseException as e:
+                outcome["error"] = e
+
+        worker = threading.Thread(target=target, name=f"converter-{instance.index}", daemon=True)
+        worker.start()
+        deadline = time.monotonic() + self.job_timeout
+        while True:
+            worker.join(max(min(CONVERTER_WATCH_INTERVAL, deadline - time.monotonic()), 0))
+            if not worker.is_alive():
+                break
+            if time.monotonic() >= deadline:
+                metrics.increment("converter_timeouts_total", stage="job")
+                metrics.increment("converter_kills_total", reason="timeout")
+                raise ConversionTimeout(f"Conversion of '{input_path}' exceeded {self.job_timeout}s.")
+            if self.max_rss_mb:
+                rss = instance.rss()
+                if rss > self.max_rss_mb * 1024 * 1024:
+                    metrics.increment("converter_kills_total", reason="memory")
+                    raise ConversionMemoryExceeded(f"Conversion of '{input_path}' grew instance {instance.index} to "
+                                                   f"{rss // (1024 * 1024)} MB, more than {self.max_rss_mb} MB.")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["path"]
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        instance = self._checkout()
+        try:
+            with metrics.span("converter_seconds", operation="convert"):
+                output_path = self._run_with_timeout(instance, input_path, output_dir, page_range)
+            instance.jobs_done += 1
+            self._count("jobs")
+            return output_path
+        except (ConversionTimeout, ConversionMemoryExceeded) as e:
+            logger.error(f"Killing converter instance {instance.index}: {e}")
+            self._count("timeouts" if isinstance(e, ConversionTimeout) else "memory_kills")
+            instance.stop()
+            instance = self.instance_factory(instance.index)
+            raise
+        except Exception as e:
+            self._count("failures")
+            if not instance.is_alive():
+                logger.error(f"Converter instance {instance.index} crashed during conversion: {e}")
+                self._count("restarts")
+                instance.stop()
+                instance.jobs_done = 0
+            if isinstance(e, ConversionError):
+                raise
+            raise ConversionError(str(e)) from e
+        finally:
+            self._checkin(instance)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({"size": self.size, "idle": self._idle.qsize()})
+        return counters
+
+    def shutdown(self):
+        while True:
+            try:
+                instance = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            instance.stop()
+
+
+class PooledBackend(ConverterBackend):
+    """Routes conversions through a ConverterPool."""
+
+    def __init__(self, pool: ConverterPool, name: str = "pool"):
+        self.pool = pool
+        self.name = name
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        return self.pool.convert(input_path, output_dir, page_range)
+
+    def version(self) -> str:
+        if self.pool.instance_factory is LibreOfficeInstance:
+            return CONVERTER_VERSION or libreoffice_version()
+        return super().version()
+
+    def stats(self) -> dict:
+        return {"backend": self.name, **self.pool.stats()}
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+# -------------------- Admission Control --------------------
+def _memory_limit() -> int | None:
+    """Bytes of memory this process may use: the Lambda size, the cgroup limit or physical RAM."""
+    lambda_mb = os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    if lambda_mb:
+        return int(lambda_mb) * 1024 * 1024
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge number.
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * PAGE_SIZE
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_concurrency(job_memory_mb: int = CONVERTER_JOB_MEMORY_MB) -> int:
+    """One conversion per CPU, fewer if memory does not fit job_memory_mb for each."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    memory = _memory_limit()
+    by_memory = memory // (job_memory_mb * 1024 * 1024) if memory and job_memory_mb else cpus
+    return max(1, min(cpus, by_memory))
+
+
+class ConverterSupervisor:
+    """
+    Admission control in front of the converter: at most max_concurrency conversions run
+    at once and at most max_queue wait for a slot, each for up to queue_timeout seconds.
+    Beyond that, requests fail fast with ConverterBusy (with a Retry-After estimate from
+    recent job durations) instead of slowing down every conversion in flight.
+    Callers that are already bounded, like the job worker, pass wait=True to queue
+    without those limits.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int = CONVERTER_QUEUE_SIZE,
+                 queue_timeout: float = CONVERTER_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._loop = None
+        self._semaphore = None
+        self._running = 0
+        self._waiting = 0
+        # Moving average of how long a slot is held; seeds the Retry-After estimate.
+        self._average_job = 5.0
+        self._counters = {"admitted": 0, "rejected_queue_full": 0, "rejected_queue_timeout": 0}
+
+    def _slots(self) -> asyncio.Semaphore:
+        # The semaphore belongs to the running loop; Mangum and tests may start new ones.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def retry_after(self) -> int:
+        """Seconds until the queue in front of a new request has likely drained."""
+        backlog = (self._waiting + self._running) / self.max_concurrency
+        return max(1, min(math.ceil(backlog * self._average_job), 300))
+
+    def _reject(self, reason: str, message: str):
+        self._counters[f"rejected_{reason}"] += 1
+        metrics.increment("converter_rejections_total", reason=reason)
+        retry_after = self.retry_after()
+        logger.warning(f"Converter busy ({reason}): {self._running} running, {self._waiting} waiting; "
+                       f"retry after {retry_after}s")
+        raise ConverterBusy(message, reason, retry_after)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, wait: bool = False):
+        slots = self._slots()
+        if not wait and slots.locked() and self._waiting >= self.max_queue:
+            self._reject("queue_full", "Too many conversions are waiting; retry later.")
+        self._waiting += 1
+        started = time.perf_counter()
+        try:
+            if wait:
+                await slots.acquire()
+            else:
+                await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout", f"No converter slot became free within {self.queue_timeout}s; retry later.")
+        finally:
+            self._waiting -= 1
+        metrics.observe("converter_seconds", time.perf_counter() - started, operation="queue_wait")
+        self._counters["admitted"] += 1
+        self._running += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._running -= 1
+            slots.release()
+            self._average_job = 0.8 * self._average_job + 0.2 * (time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {**self._counters, "max_concurrency": self.max_concurrency, "max_queue": self.max_queue,
+                "running": self._running, "waiting": self._waiting,
+                "average_job_seconds": round(self._average_job, 3)}
+
+
+class SupervisedBackend(ConverterBackend):
+    """
+    Routes async conversions of another backend through a ConverterSupervisor.
+    The synchronous convert() is passed straight through.
+    """
+
+    def __init__(self, backend: ConverterBackend, supervisor: ConverterSupervisor):
+        self.backend = backend
+        self.supervisor = supervisor
+        self.name = backend.name
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        return self.backend.convert(input_path, output_dir, page_range)
+
+    async def aconvert(self, input_path: str, output_dir: str, page_range: PageRange | None = None, *,
+                       wait: bool = False) -> str:
+        async with self.supervisor.slot(wait):
+            return await self.backend.aconvert(input_path, output_dir, page_range)
+
+    async def aconvert_many(self, input_paths: list[str], output_dir: str, *, wait: bool = False) -> dict:
+        """
+        One slot for a backend that converts the whole call in one process. Otherwise one
+        slot per document, so a batch never runs more conversions than max_concurrency;
+        documents turned away are returned as ConverterBusy.
+        """
+        if self.backend.batches_in_one_process:
+            async with self.supervisor.slot(wait):
+                return await self.backend.aconvert_many(input_paths, output_dir)
+        results = await asyncio.gather(*(self.aconvert(path, output_dir, wait=wait) for path in input_paths),
+                                       return_exceptions=True)
+        return dict(zip(input_paths, results))
+
+    def version(self) -> str:
+        return self.backend.version()
+
+    def stats(self) -> dict:
+        return {**self.backend.stats(), "admission": self.supervisor.stats()}
+
+    def shutdown(self):
+        self.backend.shutdown()
+
+
+# -------------------- Backend Factory --------------------
+def _create_engine(name: str) -> ConverterBackend:
+    if name == "fake":
+        return PooledBackend(ConverterPool(FakeInstance), name="fake")
+    if name == "pool":
+        if shutil.which(XVFB_RUN_PATH) is None or not os.path.exists(LIBREOFFICE_PATH):
+            logger.warning("LibreOffice binaries not found; falling back to the one-shot CLI backend.")
+            return LibreOfficeCLIBackend()
+        try:
+            _import_uno()
+        except ImportError:
+            logger.warning("UNO bridge not importable; falling back to the one-shot CLI backend.")
+            return LibreOfficeCLIBackend()
+        return PooledBackend(ConverterPool(LibreOfficeInstance))
+    if name == "cli":
+        return LibreOfficeCLIBackend()
+    raise ValueError(f"Unknown converter backend: {name}")
+
+
+def create_backend(name: str | None = None) -> SupervisedBackend:
+    """Builds the backend selected by CONVERTER_BACKEND (or `name`) behind admission control."""
+    backend = _create_engine((name or CONVERTER_BACKEND).lower())
+    concurrency = CONVERTER_MAX_CONCURRENCY or default_concurrency()
+    if isinstance(backend, PooledBackend) and not CONVERTER_MAX_CONCURRENCY:
+        # More slots than instances would only move the wait into the pool checkout.
+        concurrency = min(concurrency, backend.pool.size)
+    if isinstance(backend, LibreOfficeCLIBackend) and not LIBREOFFICE_PROFILE_POOL_SIZE:
+        # One profile per admitted conversion, so admitted jobs never wait on a profile.
+        backend.profiles = ProfilePool(concurrency)
+    logger.info(f"Converter admission: {concurrency} concurrent conversions, queue of {CONVERTER_QUEUE_SIZE}")
+    return SupervisedBackend(backend, ConverterSupervisor(concurrency))
@@ -266,9 +266,13 @@
 # init_db()
 
 import os
+import time
+import threading
 import psycopg2
-from psycopg2 import Error
-from passlib.hash import pbkdf2_sha256 # Using pbkdf2_sha256 for stronger hashing
+from psycopg2 import Error, extensions
+from psycopg2 import pool as pg_pool
+from utils import hash_password, verify_and_update_password # pbkdf2_sha256, bounded concurrency
+from metrics import metrics, statement_label
 import datetime
 import logging
 import re # For regular expressions, used in email and password validation
@@ -285,63 +289,222 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_PORT = os.getenv("DB_PORT", "5432") # Default PostgreSQL port
 
+# Connection pool settings. The pool lives at module level, so warm Lambda invocations
+# and requests handled by the same uvicorn worker reuse their connections.
+DB_POOL_ENABLED = os.getenv("DB_POOL_ENABLED", "true").lower() == "true"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10")) # Seconds to wait for a free connection
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", "30")) # Idle seconds before re-validating
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+# --- Round-trip Accounting and Prepared Statements ---
+
+_round_trips = 0
+_round_trips_lock = threading.Lock()
+
+def _count_round_trip():
+    global _round_trips
+    with _round_trips_lock:
+        _round_trips += 1
+
+def db_round_trip_count() -> int:
+    """Statements, commits and rollbacks this process has sent to PostgreSQL."""
+    return _round_trips
+
+# The counting lives in mixins so tests can put it on fake cursors and connections.
+class RoundTripCountingCursor:
+    """Counts every execute() as one round-trip and times it by statement type and table."""
+
+    def execute(self, query, vars=None):
+        _count_round_trip()
+        with metrics.span("db_query_seconds", statement=statement_label(query)):
+            return super().execute(query, vars)
+
+class RoundTripCountingConnection:
+    """Counts every commit() and rollback() as one round-trip."""
+
+    def commit(self):
+        _count_round_trip()
+        with metrics.span("db_query_seconds", statement="commit"):
+            return super().commit()
+
+    def rollback(self):
+        _count_round_trip()
+        with metrics.span("db_query_seconds", statement="rollback"):
+            return super().rollback()
+
+class CountingCursor(RoundTripCountingCursor, extensions.cursor):
+    """Cursor created by AppConnection."""
+
+class AppConnection(RoundTripCountingConnection, extensions.connection):
+    """
+    Connection class used for every database call. Counts round-trips and remembers
+    which server-side prepared statements already exist on this session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+        self.prepared_statements = set()
+
+# Hot queries prepared once per connection: name -> (statement with $n placeholders, parameter count)
+PREPARED_STATEMENTS = {
+    "verify_user_password": ("SELECT password FROM users WHERE username = $1", 1),
+}
+
+def _execute_prepared(conn, cursor, name: str, params: tuple):
+    """
+    Executes a statement from PREPARED_STATEMENTS. The first use on a connection sends
+    PREPARE and EXECUTE together, so preparing never costs an extra round-trip.
+    """
+    sql, arity = PREPARED_STATEMENTS[name]
+    execute = f"EXECUTE {name} ({', '.join(['%s'] * arity)})"
+    prepared = getattr(conn, "prepared_statements", None)
+    if prepared is None or name in prepared:
+        # Connections not created by AppConnection run the plain statement instead.
+        cursor.execute(execute if prepared is not None else re.sub(r"\$\d+", "%s", sql), params)
+        return
+    cursor.execute(f"PREPARE {name} AS {sql}; {execute}", params)
+    prepared.add(name)
+
+def _read_outside_transaction(conn):
+    """
+    Lets a read-only function run without opening a transaction, so handing the connection
+    back does not cost the ROLLBACK that ConnectionPool.putconn sends for an open one.
+    psycopg2 switches autocommit locally, without a round-trip; putconn switches it back.
+    """
+    conn.autocommit = True
+
+def _connection_params() -> dict:
+    return {
+        "connection_factory": AppConnection,
+        "host": DB_HOST,
+        "database": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "port": DB_PORT,
+        "connect_timeout": DB_CONNECT_TIMEOUT,
+    }
+
+class ConnectionPool:
+    """
+    Thread-safe pool on top of psycopg2's ThreadedConnectionPool.
+    Callers wait up to DB_POOL_TIMEOUT for a free connection instead of failing at max size.
+    Connections idle longer than DB_POOL_HEALTHCHECK_AFTER are checked with SELECT 1 on
+    checkout, and broken ones (e.g. after an RDS failover) are discarded and replaced.
+    """
+
+    def __init__(self, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE):
+        self.max_size = max_size
+        self._pool = pg_pool.ThreadedConnectionPool(min_size, max_size, **_connection_params())
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+        self.pid = os.getpid()
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < DB_POOL_HEALTHCHECK_AFTER:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Error as e:
+            logger.warning(f"Discarding broken pooled database connection: {e}")
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise pg_pool.PoolError(f"Timed out after {DB_POOL_TIMEOUT}s waiting for a database connection.")
+        try:
+            # After a failover every pooled connection may be dead; replace them one by one.
+            for _ in range(self.max_size + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+            raise pg_pool.PoolError("No healthy database connection available.")
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            broken = bool(conn.closed) or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+            if not broken and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                # Never hand out a connection with an open transaction.
+                conn.rollback()
+            if not broken and conn.autocommit:
+                conn.autocommit = False
+        except Error:
+            broken = True
+        if broken:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        # A forked worker must not share its parent's sockets.
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool()
+            logger.info(f"Created PostgreSQL connection pool (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE}).")
+        return _pool
+
 def get_db_connection():
     """
-    Establishes and returns a new PostgreSQL database connection.
-    Handles potential connection errors.
+    Returns a PostgreSQL connection from the module-level pool, or a new connection
+    when DB_POOL_ENABLED is false. Hand it back with release_db_connection().
+    Returns None if no connection could be obtained.
     """
-    conn = None
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
+        if DB_POOL_ENABLED:
+            with metrics.span("db_query_seconds", statement="checkout"):
+                return _get_pool().getconn()
+        with metrics.span("db_query_seconds", statement="connect"):
+            conn = psycopg2.connect(**_connection_params())
         logger.debug("Successfully connected to PostgreSQL database.")
         return conn
     except Error as e:
         logger.error(f"Error connecting to PostgreSQL database: {e}", exc_info=True)
         return None
 
+def release_db_connection(conn):
+    """Returns a connection obtained from get_db_connection() to the pool (or closes it)."""
+    if conn is None:
+        return
+    if DB_POOL_ENABLED and _pool is not None and _pool.pid == os.getpid():
+        _pool.putconn(conn)
+    else:
+        conn.close()
+
 def init_db():
     """
-    Initializes the database by creating necessary tables if they don't exist.
-    This function should be called ONCE when the application starts up.
-    In a Lambda context, it's often called during cold starts.
+    Creates or upgrades the database schema by applying pending migrations.
+    Schema changes live in migrations.py and run once at deploy time
+    (`python migrations.py`), never on import or cold start.
     """
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            # Create users table
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(255) UNIQUE NOT NULL,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                password TEXT NOT NULL
-            )
-            """)
-            # Create password_reset_tokens table
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                id SERIAL PRIMARY KEY,
-                email VARCHAR(255) NOT NULL,
-                token VARCHAR(255) UNIQUE NOT NULL,
-                expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
-                used BOOLEAN DEFAULT FALSE
-            )
-            """)
-            conn.commit()
-            logger.info("Database tables initialized successfully.")
-        except Error as e:
-            logger.error(f"Error initializing database tables: {e}", exc_info=True)
-        finally:
-            conn.close()
-    else:
-        logger.error("Could not establish database connection for initialization.")
+    from migrations import migrate
+    try:
+        migrate()
+    except (Error, RuntimeError) as e:
+        logger.error(f"Error initializing database tables: {e}")
 
 
 # --- Validation Helper Functions ---
@@ -403,12 +566,13 @@ def create_user(username: str, email: str, password: str) -> tuple[bool, str]:
     if not _is_strong_password(password):
         return False, "Password must be at least 8 characters, include uppercase, lowercase, digit, and special character."
 
+    # Hash before checking out a connection, so pooled connections are not held during CPU work.
+    hashed_password = hash_password(password)
     conn = get_db_connection()
     if not conn:
         return False, "Database connection error."
 
     try:
-        hashed_password = pbkdf2_sha256.hash(password) # Using pbkdf2_sha256
         cursor = conn.cursor()
         cursor.execute("INSERT INTO users (username, email, password) VALUES (%s, %s, %s) RETURNING id",
                        (username, email, hashed_password))
@@ -423,33 +587,60 @@ def create_user(username: str, email: str, password: str) -> tuple[bool, str]:
             return False, "Username or Email already exists."
         return False, "Failed to create user due to a database error."
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def verify_user(username: str, password: str) -> bool:
     """
     Verifies user credentials against the database.
     Returns True if credentials are valid, False otherwise.
+    A hash made with an outdated work factor is replaced after a successful login.
     """
     conn = get_db_connection()
     if not conn:
         logger.error("Database connection error during user verification.")
         return False
     try:
+        _read_outside_transaction(conn)
         cursor = conn.cursor()
-        cursor.execute("SELECT password FROM users WHERE username = %s", (username,))
+        _execute_prepared(conn, cursor, "verify_user_password", (username,))
         row = cursor.fetchone()
-        if row and pbkdf2_sha256.verify(password, row[0]): # Using pbkdf2_sha256
-            logger.info(f"User '{username}' authenticated successfully.")
-            return True
-        logger.warning(f"Failed login attempt for user '{username}': invalid credentials.")
-        return False
     except Error as e:
         logger.error(f"Error verifying user '{username}': {e}", exc_info=True)
         return False
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
+
+    # The connection is back in the pool before the (slow) hash check.
+    if not row:
+        logger.warning(f"Failed login attempt for user '{username}': invalid credentials.")
+        return False
+    valid, new_hash = verify_and_update_password(password, row[0])
+    if not valid:
+        logger.warning(f"Failed login attempt for user '{username}': invalid credentials.")
+        return False
+    logger.info(f"User '{username}' authenticated successfully.")
+    if new_hash:
+        _rehash_user_password(username, row[0], new_hash)
+    return True
+
+def _rehash_user_password(username: str, old_hash: str, new_hash: str):
+    """Stores a hash with the current work factor unless the password changed meanwhile."""
+    conn = get_db_connection()
+    if not conn:
+        logger.error("Database connection error during password rehash.")
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET password = %s WHERE username = %s AND password = %s",
+                       (new_hash, username, old_hash))
+        conn.commit()
+        logger.info(f"Rehashed password for user '{username}' with the current work factor.")
+    except Error as e:
+        # Login already succeeded; the next one retries the rehash.
+        logger.error(f"Error rehashing password for user '{username}': {e}", exc_info=True)
+        conn.rollback()
+    finally:
+        release_db_connection(conn)
 
 def get_user_by_email(email: str) -> dict | None:
     """
@@ -464,6 +655,7 @@ def get_user_by_email(email: str) -> dict | None:
         logger.error("Database connection error during get_user_by_email.")
         return None
     try:
+        _read_outside_transaction(conn)
         cursor = conn.cursor()
         cursor.execute("SELECT id, username, email FROM users WHERE email = %s", (email,))
         row = cursor.fetchone()
@@ -474,8 +666,7 @@ def get_user_by_email(email: str) -> dict | None:
         logger.error(f"Error getting user by email '{email}': {e}", exc_info=True)
         return None
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def get_user_by_username(username: str) -> dict | None:
     """
@@ -490,6 +681,7 @@ def get_user_by_username(username: str) -> dict | None:
         logger.error("Database connection error during get_user_by_username.")
         return None
     try:
+        _read_outside_transaction(conn)
         cursor = conn.cursor()
         cursor.execute("SELECT id, username, email FROM users WHERE username = %s", (username,))
         row = cursor.fetchone()
@@ -500,48 +692,48 @@ def get_user_by_username(username: str) -> dict | None:
         logger.error(f"Error getting user by username '{username}': {e}", exc_info=True)
         return None
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
-def update_user_password(username_or_email: str, new_password: str) -> tuple[bool, str]:
+def update_user_password(username_or_email: str, new_password: str) -> tuple[bool, str, str | None]:
     """
     Updates a user's password in the database after validation.
-    Returns (True, "Success message") on success,
-    (False, "Error message") on failure (e.g., user not found, weak password).
+    Returns (True, "Success message", username) on success,
+    (False, "Error message", None) on failure (e.g., user not found, weak password).
     """
     if not _is_strong_password(new_password):
-        return False, "New password does not meet complexity requirements."
-
-    user = get_user_by_email(username_or_email)
-    if not user:
-        user = get_user_by_username(username_or_email)
-
-    if not user:
-        return False, "No account found with that username or email."
+        return False, "New password does not meet complexity requirements.", None
 
+    hashed_password = hash_password(new_password)
     conn = get_db_connection()
     if not conn:
-        return False, "Database connection error."
+        return False, "Database connection error.", None
 
     try:
         cursor = conn.cursor()
-        hashed_password = pbkdf2_sha256.hash(new_password) # Using pbkdf2_sha256
-        cursor.execute("UPDATE users SET password = %s WHERE email = %s", (hashed_password, user["email"]))
+        # Lookup and update in one statement; an email match wins over a username match.
+        cursor.execute(
+            """
+            UPDATE users SET password = %s
+            WHERE id = (
+                SELECT id FROM users WHERE email = %s OR username = %s
+                ORDER BY (email = %s) DESC LIMIT 1
+            )
+            RETURNING email, username
+            """,
+            (hashed_password, username_or_email, username_or_email, username_or_email)
+        )
+        row = cursor.fetchone()
         conn.commit()
-        success = cursor.rowcount > 0
-        if success:
-            logger.info(f"Password updated for user: {user['email']}")
-            return True, "Password reset successfully!"
-        else:
-            logger.warning(f"Password update failed for email '{user['email']}'. User might not exist (though checked).")
-            return False, "Failed to update password."
+        if row:
+            logger.info(f"Password updated for user: {row[0]}")
+            return True, "Password reset successfully!", row[1]
+        return False, "No account found with that username or email.", None
     except Error as e:
-        logger.error(f"Error updating password for email '{user['email']}': {e}", exc_info=True)
+        logger.error(f"Error updating password for '{username_or_email}': {e}", exc_info=True)
         conn.rollback()
-        return False, "Failed to update password due to a database error."
+        return False, "Failed to update password due to a database error.", None
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 # --- Password Reset Token Management Functions (Adjusted for PostgreSQL) ---
 
@@ -570,8 +762,7 @@ def save_password_reset_token(email: str, token: str, expires_at: datetime.datet
         conn.rollback()
         return False
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def verify_password_reset_token(token: str) -> str | None:
     """
@@ -586,6 +777,7 @@ def verify_password_reset_token(token: str) -> str | None:
         logger.error("Database connection error during verify_password_reset_token.")
         return None
     try:
+        _read_outside_transaction(conn)
         cursor = conn.cursor()
         cursor.execute("SELECT email, expires_at, used FROM password_reset_tokens WHERE token = %s", (token,))
         row = cursor.fetchone()
@@ -603,8 +795,7 @@ def verify_password_reset_token(token: str) -> str | None:
         logger.error(f"Error verifying password reset token '{token}': {e}", exc_info=True)
         return None
     finally:
-        if conn:
-            conn.close()
+        release_db_connection(conn)
 
 def invalidate_token(token: str) -> bool:
     """
@@ -632,11 +823,4 @@ def invalidate_token(token: str) -> bool:
         conn.rollback()
         return False
     finally:
-        if conn:
-            conn.close()
-
-# Initialize the database tables when the script starts
-# This will run once per cold start of the Lambda function.
-# Ensure your Lambda's IAM role has permissions to create tables if they don't exist.
-init_db()
-
+        release_db_connection(conn)
@@ -0,0 +1,120 @@
+# downloads.py
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Lifetime of the presigned download URLs handed out by /download.
+DOWNLOAD_URL_EXPIRY = int(os.getenv("DOWNLOAD_URL_EXPIRY", "300"))
+# A cached URL is reused until this many seconds before it expires, so a client that
+# follows the redirect a little late still gets a working link.
+DOWNLOAD_URL_EXPIRY_MARGIN = int(os.getenv("DOWNLOAD_URL_EXPIRY_MARGIN", "60"))
+DOWNLOAD_URL_CACHE_MAX_ENTRIES = int(os.getenv("DOWNLOAD_URL_CACHE_MAX_ENTRIES", "10000"))
+# HEAD the object before signing, so downloads of missing files get a 404 instead of a
+# link to an S3 error page. Missing keys are remembered for DOWNLOAD_MISSING_TTL seconds.
+DOWNLOAD_CHECK_EXISTS = os.getenv("DOWNLOAD_CHECK_EXISTS", "true").lower() == "true"
+DOWNLOAD_MISSING_TTL = float(os.getenv("DOWNLOAD_MISSING_TTL", "10"))
+
+# head_object has no response body, so a missing key comes back as a bare 404.
+MISSING_KEY_ERROR_CODES = {"404", "NoSuchKey", "NotFound"}
+
+
+class PresignedUrlCache:
+    """
+    Per-process LRU of presigned GET URLs keyed by (bucket, key), so popular files are
+    signed once per URL lifetime instead of on every download. With check_exists the
+    HEAD result is cached along with the URL; missing keys are cached as None for
+    missing_ttl seconds. Calls block (HEAD is a network round-trip), so run them on
+    the S3 thread pool.
+    """
+
+    def __init__(self, expires_in: int = DOWNLOAD_URL_EXPIRY, margin: int = DOWNLOAD_URL_EXPIRY_MARGIN,
+                 check_exists: bool = DOWNLOAD_CHECK_EXISTS, missing_ttl: float = DOWNLOAD_MISSING_TTL,
+                 max_entries: int = DOWNLOAD_URL_CACHE_MAX_ENTRIES):
+        self.expires_in = expires_in
+        # A margin as long as the URL itself would disable caching; fall back to half its lifetime.
+        self.ttl = expires_in - margin if margin < expires_in else expires_in // 2
+        self.check_exists = check_exists
+        self.missing_ttl = missing_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "signed": 0, "head_requests": 0, "missing": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _cached(self, cache_key: tuple) -> tuple[bool, str | None]:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return False, None
+            url, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[cache_key]
+                return False, None
+            self._entries.move_to_end(cache_key)
+            return True, url
+
+    def _store(self, cache_key: tuple, url: str | None, ttl: float):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[cache_key] = (url, time.monotonic() + ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, s3_client, bucket: str, key: str) -> str | None:
+        """
+        Returns a presigned GET URL for s3://bucket/key, or None if the existence check
+        found no such object. Other S3 errors are raised.
+        """
+        cache_key = (bucket, key)
+        found, url = self._cached(cache_key)
+        if found:
+            self._count("hits")
+            if url is None:
+                self._count("missing")
+            return url
+        self._count("misses")
+
+        if self.check_exists:
+            self._count("head_requests")
+            try:
+                s3_client.head_object(Bucket=bucket, Key=key)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in MISSING_KEY_ERROR_CODES:
+                    raise
+                self._count("missing")
+                self._store(cache_key, None, self.missing_ttl)
+                return None
+
+        url = s3_client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=self.expires_in
+        )
+        self._count("signed")
+        self._store(cache_key, url, self.ttl)
+        return url
+
+    def forget(self, bucket: str, key: str):
+        """Drops a cached entry, e.g. a 'missing' result for a key that has just been uploaded."""
+        with self._lock:
+            self._entries.pop((bucket, key), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        counters.update(expires_in=self.expires_in, reuse_ttl=self.ttl, check_exists=self.check_exists)
+        return counters
@@ -0,0 +1,336 @@
+# formats.py
+import os
+import re
+import mmap
+import asyncio
+import logging
+import zipfile
+import threading
+from collections import OrderedDict
+from converter import ConverterBackend, ConversionError, ConverterBusy, ConverterSupervisor, PageRange
+from renderers import RENDERER_VERSION, HtmlRenderer, ImageRenderer, TextRenderer, UnsupportedContent, text_encoding
+from metrics import metrics
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# In-process renderers ("text", "html", "image"); formats of a renderer left out go to LibreOffice.
+INPROCESS_RENDERERS = {name.strip() for name in os.getenv("INPROCESS_RENDERERS", "text,html,image").split(",")
+                       if name.strip()}
+# In-process renders admitted at once; they queue and get 429/503 like LibreOffice conversions
+# (CONVERTER_QUEUE_SIZE, CONVERTER_QUEUE_TIMEOUT). Default: one per CPU.
+RENDER_MAX_CONCURRENCY = int(os.getenv("RENDER_MAX_CONCURRENCY", "0")) or os.cpu_count() or 1
+OFFICE_ENGINE = "office"
+# Outputs whose producing engine is remembered until version() is asked about them.
+PRODUCED_BY_SIZE = 1024
+
+
+class UnsupportedFormat(ConversionError):
+    """Raised when an input is not a document type any engine converts."""
+
+
+class DocumentFormat:
+    """A convertible input type. `engine` is OFFICE_ENGINE (LibreOffice) or an in-process renderer's name."""
+    __slots__ = ("name", "extension", "media_type", "engine")
+
+    def __init__(self, name: str, extension: str, media_type: str, engine: str):
+        self.name = name
+        self.extension = extension
+        self.media_type = media_type
+        self.engine = engine
+
+    def __repr__(self):
+        return f"DocumentFormat({self.name!r})"
+
+
+FORMATS = {fmt.name: fmt for fmt in (
+    DocumentFormat("docx", ".docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", OFFICE_ENGINE),
+    DocumentFormat("doc", ".doc", "application/msword", OFFICE_ENGINE),
+    DocumentFormat("odt", ".odt", "application/vnd.oasis.opendocument.text", OFFICE_ENGINE),
+    DocumentFormat("rtf", ".rtf", "application/rtf", OFFICE_ENGINE),
+    DocumentFormat("xlsx", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", OFFICE_ENGINE),
+    DocumentFormat("xls", ".xls", "application/vnd.ms-excel", OFFICE_ENGINE),
+    DocumentFormat("ods", ".ods", "application/vnd.oasis.opendocument.spreadsheet", OFFICE_ENGINE),
+    DocumentFormat("pptx", ".pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+                   OFFICE_ENGINE),
+    DocumentFormat("ppt", ".ppt", "application/vnd.ms-powerpoint", OFFICE_ENGINE),
+    DocumentFormat("odp", ".odp", "application/vnd.oasis.opendocument.presentation", OFFICE_ENGINE),
+    DocumentFormat("txt", ".txt", "text/plain", "text"),
+    DocumentFormat("html", ".html", "text/html", "html"),
+    DocumentFormat("jpeg", ".jpg", "image/jpeg", "image"),
+    DocumentFormat("png", ".png", "image/png", "image"),
+    DocumentFormat("gif", ".gif", "image/gif", "image"),
+    DocumentFormat("bmp", ".bmp", "image/bmp", "image"),
+    DocumentFormat("tiff", ".tif", "image/tiff", "image"),
+    DocumentFormat("webp", ".webp", "image/webp", "image"),
+)}
+# Filename extensions per format, including common variants. Only used as a hint:
+# the format is always taken from the content.
+EXTENSIONS = {
+    ".docx": "docx", ".dotx": "docx", ".doc": "doc", ".dot": "doc", ".odt": "odt", ".ott": "odt", ".rtf": "rtf",
+    ".xlsx": "xlsx", ".xls": "xls", ".ods": "ods", ".pptx": "pptx", ".ppsx": "pptx", ".ppt": "ppt", ".pps": "ppt",
+    ".odp": "odp", ".txt": "txt", ".text": "txt", ".log": "txt", ".csv": "txt", ".md": "txt", ".html": "html",
+    ".htm": "html", ".xhtml": "html", ".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".gif": "gif", ".bmp": "bmp",
+    ".tif": "tiff", ".tiff": "tiff", ".webp": "webp",
+}
+
+ZIP_MAGIC = b"PK\x03\x04"
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_IMAGE_MAGIC = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+_HTML_START = re.compile(r"\s*(<!--.*?-->\s*|<\?xml[^>]*>\s*)*<(!doctype\s+html|html|head|body)[\s>]",
+                         re.IGNORECASE | re.DOTALL)
+# Members that identify an OOXML package, and the mimetype member of ODF packages.
+_OOXML_PARTS = (("word/document.xml", "docx"), ("xl/workbook.xml", "xlsx"), ("ppt/presentation.xml", "pptx"))
+_ODF_TYPES = (("application/vnd.oasis.opendocument.text", "odt"),
+              ("application/vnd.oasis.opendocument.spreadsheet", "ods"),
+              ("application/vnd.oasis.opendocument.presentation", "odp"))
+# Stream names in the directory of an OLE2 compound file, stored as UTF-16LE.
+_OLE_STREAMS = (("WordDocument", "doc"), ("Workbook", "xls"), ("PowerPoint Document", "ppt"), ("Book", "xls"))
+
+
+def supported_extensions() -> list[str]:
+    return sorted(EXTENSIONS)
+
+
+def _hinted(filename: str, candidates: tuple, default: str) -> DocumentFormat:
+    name = EXTENSIONS.get(os.path.splitext(filename or "")[1].lower())
+    return FORMATS[name if name in candidates else default]
+
+
+# -------------------- Detection --------------------
+def sniff_format(head: bytes, filename: str = "") -> DocumentFormat | None:
+    """
+    The format suggested by the first bytes of an input, or None if it is not one we convert.
+    ZIP and OLE2 containers get a provisional format from the filename; detect_format() looks inside.
+    """
+    if not head:
+        return None
+    if head.startswith(ZIP_MAGIC):
+        return _hinted(filename, ("docx", "xlsx", "pptx", "odt", "ods", "odp"), "docx")
+    if head.startswith(OLE_MAGIC):
+        return _hinted(filename, ("doc", "xls", "ppt"), "doc")
+    if head.startswith(b"{\\rtf"):
+        return FORMATS["rtf"]
+    for magic, name in _IMAGE_MAGIC:
+        if head.startswith(magic):
+            return FORMATS[name]
+    if head.startswith(b"BM") and len(head) >= 26 and head[6:10] == b"\0\0\0\0":
+        return FORMATS["bmp"]
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return FORMATS["webp"]
+    if head.startswith(b"%PDF"):
+        return None
+    encoding = text_encoding(head)
+    if encoding is None:
+        return None
+    text = head.decode(encoding, errors="ignore")
+    if _HTML_START.match(text) or (EXTENSIONS.get(os.path.splitext(filename or "")[1].lower()) == "html"
+                                   and "<" in text):
+        return FORMATS["html"]
+    return FORMATS["txt"]
+
+
+def _zip_format(path: str) -> DocumentFormat | None:
+    try:
+        with zipfile.ZipFile(path) as package:
+            names = set(package.namelist())
+            for part, name in _OOXML_PARTS:
+                if part in names:
+                    return FORMATS[name]
+            if "mimetype" in names:
+                mimetype = package.read("mimetype")[:100].decode("ascii", errors="ignore").strip()
+                for prefix, name in _ODF_TYPES:
+                    if mimetype.startswith(prefix):
+                        return FORMATS[name]
+    except (zipfile.BadZipFile, OSError):
+        pass
+    return None
+
+
+def _ole_format(path: str, fallback: DocumentFormat) -> DocumentFormat:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for stream, name in _OLE_STREAMS:
+            if data.find(stream.encode("utf-16-le") + b"\0\0") != -1:
+                return FORMATS[name]
+    return fallback
+
+
+def detect_format(path: str, filename: str = "") -> DocumentFormat | None:
+    """The format of a file from its content; `filename` (the upload's name) only breaks ties."""
+    with open(path, "rb") as f:
+        head = f.read(8192)
+    fmt = sniff_format(head, filename or path)
+    if fmt is None:
+        return None
+    if head.startswith(ZIP_MAGIC):
+        # Any other ZIP is an archive, not a document.
+        return _zip_format(path)
+    if head.startswith(OLE_MAGIC):
+        return _ole_format(path, fmt)
+    return fmt
+
+
+# -------------------- Routing --------------------
+def default_renderers() -> list:
+    return [renderer() for renderer in (TextRenderer, HtmlRenderer, ImageRenderer) if renderer.name in INPROCESS_RENDERERS]
+
+
+class FormatRouter(ConverterBackend):
+    """
+    Sends every input to the engine for its detected format: office documents to
+    `office` (the LibreOffice backend behind admission control), text, HTML and images
+    to in-process renderers. When a renderer meets content it cannot draw faithfully
+    (characters outside the standard PDF fonts, images it cannot embed) the document
+    goes to LibreOffice instead. Renders take a slot of their own `supervisor`, so they
+    neither wait behind LibreOffice nor run unbounded in the thread pool.
+    """
+
+    def __init__(self, office: ConverterBackend, renderers: list | None = None,
+                 supervisor: ConverterSupervisor | None = None):
+        self.office = office
+        self.name = office.name
+        self.renderers = {renderer.name: renderer for renderer in (default_renderers() if renderers is None else renderers)}
+        self.supervisor = supervisor or ConverterSupervisor(RENDER_MAX_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._fallbacks = 0
+        self._produced_by = OrderedDict()
+
+    def _produced(self, output_path: str, engine: ConverterBackend) -> str:
+        with self._lock:
+            self._produced_by[output_path] = engine.version()
+            self._produced_by.move_to_end(output_path)
+            while len(self._produced_by) > PRODUCED_BY_SIZE:
+                self._produced_by.popitem(last=False)
+        return output_path
+
+    def _count(self, fmt: DocumentFormat, engine: str):
+        with self._lock:
+            key = f"{fmt.name}:{engine}"
+            self._counters[key] = self._counters.get(key, 0) + 1
+        metrics.increment("converter_formats_total", format=fmt.name, engine=engine)
+
+    def _fallback(self, fmt: DocumentFormat, error: Exception):
+        logger.info(f"Rendering {fmt.name} in-process not possible ({error}); using LibreOffice.")
+        with self._lock:
+            self._fallbacks += 1
+        metrics.increment("converter_fallbacks_total", format=fmt.name)
+
+    def route(self, input_path: str, input_format: DocumentFormat | None = None) -> tuple[DocumentFormat, ConverterBackend]:
+        fmt = input_format or detect_format(input_path)
+        if fmt is None:
+            raise UnsupportedFormat(f"'{os.path.basename(input_path)}' is not a supported document type.")
+        renderer = self.renderers.get(fmt.engine)
+        if renderer is not None and renderer.accepts(input_path, fmt):
+            return fmt, renderer
+        return fmt, self.office
+
+    def _render(self, renderer, fmt: DocumentFormat, input_path: str, output_dir: str,
+                page_range: PageRange | None = None) -> str:
+        with metrics.span("converter_seconds", operation=f"render_{renderer.name}"):
+            output_path = renderer.convert(input_path, output_dir, page_range)
+        self._count(fmt, renderer.name)
+        return self._produced(output_path, renderer)
+
+    async def _arender(self, renderer, fmt: DocumentFormat, input_path: str, output_dir: str,
+                       page_range: PageRange | None = None, wait: bool = False) -> str:
+        async with self.supervisor.slot(wait):
+            return await asyncio.to_thread(self._render, renderer, fmt, input_path, output_dir, page_range)
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None,
+                input_format: DocumentFormat | None = None) -> str:
+        fmt, engine = self.route(input_path, input_format)
+        if engine is not self.office:
+            try:
+                return self._render(engine, fmt, input_path, output_dir, page_range)
+            except UnsupportedContent as e:
+                self._fallback(fmt, e)
+        self._count(fmt, OFFICE_ENGINE)
+        return self._produced(self.office.convert(input_path, output_dir, page_range), self.office)
+
+    async def aconvert(self, input_path: str, output_dir: str, page_range: PageRange | None = None, *,
+                       wait: bool = False, input_format: DocumentFormat | None = None) -> str:
+        """Rendered formats take a render slot, LibreOffice conversions (fallbacks included) an office one."""
+        fmt, engine = await asyncio.to_thread(self.route, input_path, input_format)
+        if engine is not self.office:
+            try:
+                return await self._arender(engine, fmt, input_path, output_dir, page_range, wait)
+            except UnsupportedContent as e:
+                self._fallback(fmt, e)
+        self._count(fmt, OFFICE_ENGINE)
+        output_path = await self.office.aconvert(input_path, output_dir, wait=wait, page_range=page_range)
+        return self._produced(output_path, self.office)
+
+    async def aconvert_many(self, input_paths: list[str], output_dir: str, *, wait: bool = False) -> dict:
+        """Renders what it can in-process; the office documents go to LibreOffice in one call."""
+        results, office_paths, rendered = {}, [], []
+
+        def route_all():
+            for path in input_paths:
+                try:
+                    fmt, engine = self.route(path)
+                except ConversionError as e:
+                    results[path] = e
+                    continue
+                if engine is self.office:
+                    self._count(fmt, OFFICE_ENGINE)
+                    office_paths.append(path)
+                else:
+                    rendered.append((path, fmt, engine))
+
+        await asyncio.to_thread(route_all)
+
+        async def render(path: str, fmt: DocumentFormat, renderer):
+            try:
+                results[path] = await self._arender(renderer, fmt, path, output_dir, wait=wait)
+            except UnsupportedContent as e:
+                self._fallback(fmt, e)
+                self._count(fmt, OFFICE_ENGINE)
+                office_paths.append(path)
+            except Exception as e:
+                results[path] = e
+
+        await asyncio.gather(*(render(*item) for item in rendered))
+        if office_paths:
+            try:
+                outputs = await self.office.aconvert_many(office_paths, output_dir, wait=wait)
+                results.update((path, self._produced(output, self.office) if isinstance(output, str) else output)
+                               for path, output in outputs.items())
+            except ConverterBusy as e:
+                # Rendered documents are done; only the LibreOffice ones are turned away.
+                results.update((path, e) for path in office_paths)
+        return results
+
+    def version(self, input_format: DocumentFormat | None = None, output_path: str | None = None) -> str:
+        """
+        Keys the conversion cache; rendered formats change with RENDERER_VERSION, not LibreOffice.
+        Given the `output_path` of a conversion, the version of the engine that produced it,
+        so a document that fell back to LibreOffice is not cached as rendered.
+        """
+        if output_path is not None:
+            with self._lock:
+                version = self._produced_by.pop(output_path, None)
+            if version is not None:
+                return version
+        if input_format is not None and input_format.engine in self.renderers:
+            return RENDERER_VERSION
+        return self.office.version()
+
+    def stats(self) -> dict:
+        with self._lock:
+            formats = dict(self._counters)
+            fallbacks = self._fallbacks
+        return {**self.office.stats(), "formats": formats, "fallbacks": fallbacks,
+                "renderers": sorted(self.renderers), "render_admission": self.supervisor.stats()}
+
+    def shutdown(self):
+        self.office.shutdown()
@@ -0,0 +1,62 @@
+# health.py
+import os
+import time
+import asyncio
+import logging
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Seconds a readiness result is reused; failures are re-checked sooner.
+HEALTHZ_CACHE_TTL = float(os.getenv("HEALTHZ_CACHE_TTL", "30"))
+HEALTHZ_FAILURE_TTL = float(os.getenv("HEALTHZ_FAILURE_TTL", "5"))
+# Upper bound for each check, so a slow RDS or EFS mount cannot hang the probe.
+HEALTHZ_CHECK_TIMEOUT = float(os.getenv("HEALTHZ_CHECK_TIMEOUT", "5"))
+
+
+class ReadinessProbe:
+    """
+    Runs named dependency checks on first use and caches the combined result.
+    Each check is a blocking callable returning a short detail (e.g. a version) or
+    raising; checks run in threads, concurrently, with HEALTHZ_CHECK_TIMEOUT each.
+    Concurrent probes while a refresh is running share that refresh.
+    """
+
+    def __init__(self, checks: dict, ttl: float = HEALTHZ_CACHE_TTL, failure_ttl: float = HEALTHZ_FAILURE_TTL,
+                 timeout: float = HEALTHZ_CHECK_TIMEOUT):
+        self.checks = checks
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.timeout = timeout
+        self._result = None
+        self._expires_at = 0.0
+        self._lock = None
+
+    async def _run_check(self, name: str, check) -> dict:
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(asyncio.to_thread(check), self.timeout)
+            result = {"status": "ok", "detail": detail}
+        except asyncio.TimeoutError:
+            result = {"status": "failed", "detail": f"Timed out after {self.timeout}s."}
+        except Exception as e:
+            result = {"status": "failed", "detail": str(e)}
+        result["duration"] = round(time.perf_counter() - started, 3)
+        if result["status"] != "ok":
+            logger.error(f"Readiness check '{name}' failed: {result['detail']}")
+        return result
+
+    async def check(self) -> dict:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._result is None or time.monotonic() >= self._expires_at:
+                names = list(self.checks)
+                results = await asyncio.gather(*(self._run_check(name, self.checks[name]) for name in names))
+                ready = all(result["status"] == "ok" for result in results)
+                self._result = {"status": "ok" if ready else "failed", "checked_at": time.time(),
+                                "checks": dict(zip(names, results))}
+                self._expires_at = time.monotonic() + (self.ttl if ready else self.failure_ttl)
+            return self._result
@@ -0,0 +1,383 @@
+# jobs.py
+import os
+import json
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+from psycopg2 import Error
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# "memory" (in-process only), "postgres" (shared with database.py) or "sqs"
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory")
+# Leave unset to use the in-process stand-in for SQS.
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL")
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# A job still "running" this many seconds after it started is taken to belong to a worker
+# that died, and is queued again; workers check every JOB_REQUEUE_INTERVAL seconds.
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "900"))
+JOB_REQUEUE_INTERVAL = float(os.getenv("JOB_REQUEUE_INTERVAL", "60"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+def new_job(file_id: str, filename: str, input_s3_key: str, input_path: str | None = None,
+            content_hash: str | None = None, optimize: str = "none", pages: str | None = None,
+            preview: int = 0) -> dict:
+    """Builds the record that is enqueued for a conversion job."""
+    return {
+        "file_id": file_id,
+        "filename": filename,
+        "input_s3_key": input_s3_key,
+        # Only usable by an in-process worker; remote workers download input_s3_key.
+        "input_path": input_path,
+        "content_hash": content_hash,
+        # PDF optimization preset (see optimizer.py).
+        "optimize": optimize,
+        # Page range to export ("1-3,5", None for all) and how many first-page thumbnails to make.
+        "pages": pages,
+        "preview": preview,
+        "status": JOB_QUEUED,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "timings": {},
+        "error": None,
+    }
+
+
+# -------------------- Queue Backends --------------------
+class JobQueue:
+    """
+    Interface for job queue backends.
+    save/get/update manage the status record; enqueue/dequeue move jobs to workers.
+    """
+    # Only a worker in the same process can see the jobs.
+    process_local = False
+
+    def save(self, job: dict):
+        raise NotImplementedError
+
+    def get(self, file_id: str) -> dict | None:
+        raise NotImplementedError
+
+    def update(self, file_id: str, **fields):
+        raise NotImplementedError
+
+    def enqueue(self, job: dict):
+        raise NotImplementedError
+
+    def dequeue(self, timeout: float) -> dict | None:
+        raise NotImplementedError
+
+    def ack(self, job: dict):
+        """Called once a dequeued job reached a final state."""
+
+    def requeue_stale(self, older_than: float) -> int:
+        """
+        Queues jobs again that have been running for more than `older_than` seconds;
+        returns how many. Backends whose jobs cannot outlive their worker do nothing.
+        """
+        return 0
+
+
+class InMemoryJobQueue(JobQueue):
+    """Process-local queue; only an in-process worker can drain it."""
+    process_local = True
+
+    def __init__(self):
+        self._records = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+
+    def save(self, job: dict):
+        with self._lock:
+            self._records[job["file_id"]] = dict(job)
+
+    def get(self, file_id: str) -> dict | None:
+        with self._lock:
+            job = self._records.get(file_id)
+            return dict(job) if job else None
+
+    def update(self, file_id: str, **fields):
+        with self._lock:
+            if file_id in self._records:
+                self._records[file_id].update(fields)
+
+    def enqueue(self, job: dict):
+        self.save(job)
+        self._pending.put(job["file_id"])
+
+    def dequeue(self, timeout: float) -> dict | None:
+        try:
+            file_id = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.update(file_id, status=JOB_RUNNING, started_at=time.time())
+        return self.get(file_id)
+
+
+class PostgresJobQueue(JobQueue):
+    """
+    Stores jobs in the conversion_jobs table created by migrations.py.
+    Workers claim jobs with FOR UPDATE SKIP LOCKED, so several processes can share it.
+    """
+    _COLUMNS = ("file_id, filename, input_s3_key, input_path, content_hash, optimize, pages, preview, status, "
+                "created_at, started_at, finished_at, timings, error")
+
+    def __init__(self, connect=None, release=None):
+        if connect is None:
+            from database import get_db_connection, release_db_connection
+            connect, release = get_db_connection, release_db_connection
+        self._connect = connect
+        self._release = release or (lambda conn: conn.close())
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job = dict(zip([c.strip() for c in PostgresJobQueue._COLUMNS.split(",")], row))
+        for key in ("created_at", "started_at", "finished_at"):
+            if job[key] is not None:
+                job[key] = job[key].timestamp()
+        job["timings"] = job["timings"] or {}
+        return job
+
+    def _execute(self, sql: str, params: tuple, fetch: bool = False):
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database connection error.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            row = cursor.fetchone() if fetch else None
+            conn.commit()
+            return row
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def save(self, job: dict):
+        self._execute(
+            "INSERT INTO conversion_jobs (file_id, filename, input_s3_key, input_path, content_hash, optimize, pages, "
+            "preview, status, created_at, timings) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, to_timestamp(%s), %s)",
+            (job["file_id"], job["filename"], job["input_s3_key"], job["input_path"], job["content_hash"],
+             job["optimize"], job["pages"], job["preview"], job["status"], job["created_at"], json.dumps(job["timings"]))
+        )
+
+    def get(self, file_id: str) -> dict | None:
+        row = self._execute(f"SELECT {self._COLUMNS} FROM conversion_jobs WHERE file_id = %s", (file_id,), fetch=True)
+        return self._row_to_job(row) if row else None
+
+    def update(self, file_id: str, **fields):
+        if not fields:
+            return
+        assignments, params = [], []
+        for key, value in fields.items():
+            if key in ("started_at", "finished_at"):
+                assignments.append(f"{key} = to_timestamp(%s)")
+            elif key in ("status", "error", "timings"):
+                assignments.append(f"{key} = %s")
+                if key == "timings":
+                    value = json.dumps(value)
+            else:
+                raise ValueError(f"Unknown job field: {key}")
+            params.append(value)
+        params.append(file_id)
+        self._execute(f"UPDATE conversion_jobs SET {', '.join(assignments)} WHERE file_id = %s", tuple(params))
+
+    def enqueue(self, job: dict):
+        self.save(job)
+
+    def dequeue(self, timeout: float) -> dict | None:
+        row = self._execute(
+            f"""
+            UPDATE conversion_jobs SET status = %s, started_at = now()
+            WHERE file_id = (
+                SELECT file_id FROM conversion_jobs WHERE status = %s
+                ORDER BY created_at LIMIT 1 FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {self._COLUMNS}
+            """,
+            (JOB_RUNNING, JOB_QUEUED), fetch=True
+        )
+        if row:
+            return self._row_to_job(row)
+        # Nothing queued; wait before the worker polls again.
+        time.sleep(timeout)
+        return None
+
+    def requeue_stale(self, older_than: float) -> int:
+        conn = self._connect()
+        if not conn:
+            raise RuntimeError("Database connection error.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE conversion_jobs SET status = %s, started_at = NULL "
+                "WHERE status = %s AND started_at < now() - make_interval(secs => %s)",
+                (JOB_QUEUED, JOB_RUNNING, older_than)
+            )
+            requeued = cursor.rowcount
+            conn.commit()
+            return requeued
+        except Error:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+
+class LocalSQSClient:
+    """In-process stand-in implementing the subset of the boto3 SQS client we use."""
+
+    def __init__(self):
+        self._messages = queue.Queue()
+
+    def send_message(self, QueueUrl: str, MessageBody: str) -> dict:
+        message_id = str(uuid.uuid4())
+        self._messages.put({"MessageId": message_id, "ReceiptHandle": message_id, "Body": MessageBody})
+        return {"MessageId": message_id}
+
+    def receive_message(self, QueueUrl: str, MaxNumberOfMessages: int = 1, WaitTimeSeconds: int = 0) -> dict:
+        try:
+            return {"Messages": [self._messages.get(timeout=WaitTimeSeconds)]}
+        except queue.Empty:
+            return {}
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str) -> dict:
+        return {}
+
+
+class SQSJobQueue(JobQueue):
+    """
+    Moves jobs through an SQS queue (or LocalSQSClient). Status records live in
+    `status_store`, which must be shared (e.g. PostgresJobQueue) for remote workers.
+    """
+
+    def __init__(self, client, queue_url: str, status_store: JobQueue):
+        self.client = client
+        self.queue_url = queue_url
+        self.status_store = status_store
+
+    @property
+    def process_local(self) -> bool:
+        return isinstance(self.client, LocalSQSClient)
+
+    def save(self, job: dict):
+        self.status_store.save(job)
+
+    def get(self, file_id: str) -> dict | None:
+        return self.status_store.get(file_id)
+
+    def update(self, file_id: str, **fields):
+        self.status_store.update(file_id, **fields)
+
+    def enqueue(self, job: dict):
+        self.save(job)
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(job))
+
+    def dequeue(self, timeout: float) -> dict | None:
+        response = self.client.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=1,
+                                               WaitTimeSeconds=int(max(timeout, 0)))
+        messages = response.get("Messages", [])
+        if not messages:
+            return None
+        job = json.loads(messages[0]["Body"])
+        job["receipt_handle"] = messages[0]["ReceiptHandle"]
+        started_at = time.time()
+        self.update(job["file_id"], status=JOB_RUNNING, started_at=started_at)
+        job.update(status=JOB_RUNNING, started_at=started_at)
+        return job
+
+    def ack(self, job: dict):
+        if job.get("receipt_handle"):
+            self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=job["receipt_handle"])
+
+
+def create_job_queue(name: str | None = None) -> JobQueue:
+    """Builds the backend selected by JOB_QUEUE_BACKEND (or `name`)."""
+    name = (name or JOB_QUEUE_BACKEND).lower()
+    if name == "memory":
+        return InMemoryJobQueue()
+    if name == "postgres":
+        return PostgresJobQueue()
+    if name == "sqs":
+        if JOB_QUEUE_URL:
+            import boto3
+            return SQSJobQueue(boto3.client("sqs"), JOB_QUEUE_URL, PostgresJobQueue())
+        logger.warning("JOB_QUEUE_URL not set; using the in-process SQS stand-in.")
+        return SQSJobQueue(LocalSQSClient(), "local", InMemoryJobQueue())
+    raise ValueError(f"Unknown job queue backend: {name}")
+
+
+# -------------------- Worker --------------------
+async def run_job(job_queue: JobQueue, job: dict, process_job):
+    """
+    Runs one dequeued job through `process_job(job) -> timings` and records the outcome.
+    process_job is a coroutine; it raises on failure.
+    """
+    file_id = job["file_id"]
+    timings = {"queue_wait": round(job["started_at"] - job["created_at"], 3)}
+    try:
+        timings.update(await process_job(job))
+        timings["total"] = round(time.time() - job["created_at"], 3)
+        await asyncio.to_thread(job_queue.update, file_id, status=JOB_COMPLETED,
+                                finished_at=time.time(), timings=timings)
+        logger.info(f"Job {file_id} completed: {timings}")
+    except Exception as e:
+        logger.error(f"Job {file_id} failed: {e}", exc_info=True)
+        await asyncio.to_thread(job_queue.update, file_id, status=JOB_FAILED,
+                                finished_at=time.time(), timings=timings, error=str(e))
+    finally:
+        await asyncio.to_thread(job_queue.ack, job)
+
+
+async def worker_loop(job_queue: JobQueue, process_job, concurrency: int = JOB_WORKER_CONCURRENCY,
+                      stop_event: asyncio.Event | None = None):
+    """
+    Drains the queue, running at most `concurrency` jobs at once, until stop_event is set;
+    then waits for the jobs already running. Jobs left running by a worker that died are
+    queued again every JOB_REQUEUE_INTERVAL seconds.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    next_requeue = 0.0
+    logger.info(f"Conversion worker started with concurrency {concurrency}")
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if time.monotonic() >= next_requeue:
+                next_requeue = time.monotonic() + JOB_REQUEUE_INTERVAL
+                try:
+                    requeued = await asyncio.to_thread(job_queue.requeue_stale, JOB_STALE_AFTER)
+                except Exception as e:
+                    logger.error(f"Could not requeue stale jobs: {e}")
+                else:
+                    if requeued:
+                        logger.warning(f"Requeued {requeued} jobs running for more than {JOB_STALE_AFTER}s")
+            await slots.acquire()
+            if stop_event is not None and stop_event.is_set():
+                slots.release()
+                break
+            job = await asyncio.to_thread(job_queue.dequeue, JOB_POLL_INTERVAL)
+            if job is None:
+                slots.release()
+                continue
+            task = asyncio.create_task(run_job(job_queue, job, process_job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+    finally:
+        if running:
+            logger.info(f"Conversion worker stopping; waiting for {len(running)} running jobs")
+            await asyncio.gather(*running, return_exceptions=True)
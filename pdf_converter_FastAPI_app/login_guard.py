@@ -0,0 +1,151 @@
+# login_guard.py
+import os
+import hmac
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Token buckets: BURST attempts at once, refilled at RATE attempts per minute.
+LOGIN_USERNAME_RATE = float(os.getenv("LOGIN_USERNAME_RATE", "5"))
+LOGIN_USERNAME_BURST = int(os.getenv("LOGIN_USERNAME_BURST", "5"))
+LOGIN_IP_RATE = float(os.getenv("LOGIN_IP_RATE", "30"))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "20"))
+# Buckets tracked per limiter; the least recently used ones are dropped beyond this.
+LOGIN_LIMITER_MAX_KEYS = int(os.getenv("LOGIN_LIMITER_MAX_KEYS", "100000"))
+# Successful verifications reused without a database lookup or hash check. Per process,
+# so a password reset handled by another instance is only seen after the TTL.
+LOGIN_CACHE_TTL = float(os.getenv("LOGIN_CACHE_TTL", "60"))
+LOGIN_CACHE_MAX_ENTRIES = int(os.getenv("LOGIN_CACHE_MAX_ENTRIES", "10000"))
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets, kept in an LRU so memory stays bounded under a spray of keys."""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = LOGIN_LIMITER_MAX_KEYS):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Takes one token for `key`. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / self.rate if self.rate > 0 else float("inf")
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class VerifiedLoginCache:
+    """
+    Remembers recent successful logins as HMAC fingerprints of (username, password).
+    The key is random per process, so neither passwords nor reusable hashes are kept.
+    """
+
+    def __init__(self, ttl: float = LOGIN_CACHE_TTL, max_entries: int = LOGIN_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, username: str, password: str) -> str:
+        message = username.encode() + b"\0" + password.encode()
+        return hmac.new(self._key, message, hashlib.sha256).hexdigest()
+
+    def contains(self, username: str, password: str) -> bool:
+        fingerprint = self._fingerprint(username, password)
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return False
+            cached_fingerprint, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[username]
+                return False
+            return hmac.compare_digest(cached_fingerprint, fingerprint)
+
+    def add(self, username: str, password: str):
+        fingerprint = self._fingerprint(username, password)
+        with self._lock:
+            self._entries[username] = (fingerprint, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LoginGuard:
+    """
+    Sits in front of database.verify_user: rate-limits attempts per username and per
+    client IP before any hashing or database work, and short-circuits repeated
+    successful logins from the verified-login cache.
+    """
+
+    def __init__(self):
+        self.username_limiter = TokenBucketLimiter(LOGIN_USERNAME_RATE, LOGIN_USERNAME_BURST)
+        self.ip_limiter = TokenBucketLimiter(LOGIN_IP_RATE, LOGIN_IP_BURST)
+        self.cache = VerifiedLoginCache()
+        self._lock = threading.Lock()
+        self._counters = {"attempts": 0, "cache_hits": 0, "cache_misses": 0,
+                          "rejected_username": 0, "rejected_ip": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def admit(self, username: str, client_ip: str | None) -> float:
+        """Returns 0 if the attempt may proceed, else the Retry-After in seconds."""
+        self._count("attempts")
+        if client_ip:
+            retry_after = self.ip_limiter.acquire(client_ip)
+            if retry_after:
+                self._count("rejected_ip")
+                logger.warning(f"Rejected login attempt from {client_ip}: rate limit exceeded.")
+                return retry_after
+        retry_after = self.username_limiter.acquire(username.lower())
+        if retry_after:
+            self._count("rejected_username")
+            logger.warning(f"Rejected login attempt for user '{username}': rate limit exceeded.")
+        return retry_after
+
+    def is_cached(self, username: str, password: str) -> bool:
+        hit = self.cache.contains(username, password)
+        self._count("cache_hits" if hit else "cache_misses")
+        return hit
+
+    def remember(self, username: str, password: str):
+        self.cache.add(username, password)
+
+    def forget(self, username: str):
+        self.cache.invalidate(username)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["cache_hits"] + counters["cache_misses"]
+        counters["cache_hit_ratio"] = round(counters["cache_hits"] / lookups, 3) if lookups else 0.0
+        counters["cache_entries"] = len(self.cache)
+        return counters
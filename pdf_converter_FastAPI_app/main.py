@@ -1,17 +1,50 @@
 # main.py
 import os
-import subprocess
+import sys
+import json
+import time
 import uuid
+import asyncio
+import hashlib
 import logging
 import tempfile
+import shutil
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+import aiofiles
 from fastapi import FastAPI, Request, Form, UploadFile, File, Query
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-# from fastapi.staticfiles import StaticFiles
 from starlette import status
+from starlette.background import BackgroundTask
 from mangum import Mangum
-from database import create_user, verify_user, get_user_by_email, get_user_by_username, update_user_password
+import migrations
+from database import get_db_connection, release_db_connection, create_user, verify_user, get_user_by_username, update_user_password
+from converter import (LIBREOFFICE_PATH, XVFB_RUN_PATH, ConversionError, ConverterBusy, InvalidPageRange, PageRange,
+                       create_backend, libreoffice_version)
+from formats import EXTENSIONS, FORMATS, FormatRouter, UnsupportedFormat, detect_format, sniff_format, supported_extensions
+from optimizer import NO_OPTIMIZATION, PDF_OPTIMIZE_PRESET, PRESETS, PdfOptimizer, is_preset
+from previews import PREVIEW_MAX_AGE, PREVIEW_MAX_PAGES, PREVIEW_PAGES, PreviewCache, PreviewRasterizer, preview_key
+from streaming import (MAX_UPLOAD_SIZE, MaxBodySizeMiddleware, S3StreamingDownload, S3StreamingUpload, UploadTooLarge,
+                       http_date, parse_http_date, single_byte_range)
+from batch import (MAX_BATCH_FILES, MAX_BATCH_UPLOAD_SIZE, BATCH_CHUNK_SIZE, BATCH_CONVERT_CONCURRENCY,
+                   BatchError, build_zip, chunked, extract_documents)
+from conversion_cache import create_conversion_cache
+from downloads import MISSING_KEY_ERROR_CODES, PresignedUrlCache
+from conversions import CONVERSIONS_MAX_PAGE_SIZE, CONVERSIONS_PAGE_SIZE, count_pdf_pages, create_conversion_log
+from health import ReadinessProbe
+from assets import StaticAssets, StaticPageCache, configure_templates
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, metrics
+from utils import auth_executor, hash_stats, run_auth
+from login_guard import LoginGuard
+from sessions import (SESSION_COOKIE_NAME, SESSION_COOKIE_SECURE, SESSION_TTL, SessionAuthMiddleware,
+                      issue_session)
+from jobs import JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, create_job_queue, new_job, run_job, worker_loop
 
 # -------------------- Logging --------------------
 logger = logging.getLogger(__name__)
@@ -25,138 +58,892 @@ API_GATEWAY_BASE_PATH = os.getenv("API_GATEWAY_BASE_PATH", "/prod")
 # Initialize FastAPI with the correct root_path using the defined variable.
 # This is the crucial fix that prevents the NameError.
 app = FastAPI(root_path=API_GATEWAY_BASE_PATH)
+# Oversized uploads are rejected before Starlette buffers the multipart body.
+app.add_middleware(MaxBodySizeMiddleware, limits={"/convert": MAX_UPLOAD_SIZE, "/convert/batch": MAX_BATCH_UPLOAD_SIZE})
+# Signed session cookies are checked in-process (no database hit); anonymous requests never reach the handlers.
+# Everything needs a session except these: the login and registration pages, static assets,
+# the API docs and the load balancer's health check. Stats and /metrics are not public.
+app.add_middleware(SessionAuthMiddleware,
+                   public_paths=("/", "/register", "/forgot_password", "/reset_password_direct", "/logout",
+                                 "/healthz", "/openapi.json"),
+                   public_prefixes=("/static", "/docs", "/redoc"),
+                   page_prefixes=("/dashboard",), login_url=f"{API_GATEWAY_BASE_PATH}/")
+# HTML and JSON go out brotli/gzip-compressed (see compression.py).
+app.add_middleware(CompressionMiddleware)
+# Added last, so it is the outermost layer and times the whole request (see metrics.py).
+app.add_middleware(MetricsMiddleware)
 templates = Jinja2Templates(directory="templates")
 
+# -------------------- Static Assets & Page Cache --------------------
+# Stylesheets and images are served from static/ under fingerprinted URLs with long cache
+# headers; templates are compiled once per package (see assets.py).
+static_assets = StaticAssets()
+configure_templates(templates, static_assets)
+# Login, register and forgot-password pages without messages depend only on root_path.
+static_pages = StaticPageCache(templates.env)
+
+@app.get("/static/{path:path}")
+async def static_file(request: Request, path: str):
+    response = await asyncio.to_thread(static_assets.response, path, request.headers.get("accept-encoding"),
+                                       request.headers.get("if-none-match"))
+    if response is None:
+        return JSONResponse({"status": "failed", "message": "Not found."}, status_code=status.HTTP_404_NOT_FOUND)
+    return response
+
 # -------------------- S3 Setup --------------------
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
-s3_client = boto3.client("s3")
+# Points the client at an S3-compatible service (MinIO, benchmarks/local_s3.py) instead of AWS.
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+if S3_ENDPOINT_URL:
+    s3_client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, config=BotoConfig(s3={"addressing_style": "path"}))
+else:
+    s3_client = boto3.client("s3")
+# boto3 calls block, so they run on a bounded pool instead of the event loop.
+S3_TRANSFER_WORKERS = int(os.getenv("S3_TRANSFER_WORKERS", "8"))
+s3_executor = ThreadPoolExecutor(max_workers=S3_TRANSFER_WORKERS, thread_name_prefix="s3")
+
+async def run_s3(func, *args, **kwargs):
+    """Runs a blocking boto3 call on the S3 thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(s3_executor, functools.partial(func, *args, **kwargs))
+
+# -------------------- Converter Engine --------------------
+# Selected with CONVERTER_BACKEND ("pool", "cli" or "fake"); see converter.py. Conversions
+# beyond CONVERTER_MAX_CONCURRENCY wait in a bounded queue; past that /convert answers
+# 429 (queue full) or 503 (waited too long) with Retry-After.
+# Inputs are routed by detected format: office documents to LibreOffice, text, HTML and
+# images to in-process renderers (see formats.py).
+converter_engine = FormatRouter(create_backend())
+UNSUPPORTED_FORMAT_MESSAGE = f"Unsupported file type. Supported: {', '.join(supported_extensions())}."
+logger.info(f"Using converter backend: {converter_engine.name}")
+
+@app.get("/converter/stats")
+async def converter_stats():
+    return JSONResponse(converter_engine.stats())
+
+def _converter_busy_response(e: ConverterBusy) -> JSONResponse:
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS if e.reason == "queue_full" else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse({"status": "failed", "message": str(e)}, status_code=status_code,
+                        headers={"Retry-After": str(e.retry_after)})
+
+# -------------------- PDF Optimization --------------------
+# Converted PDFs can be rewritten with a preset ("screen", "print" or "archive"): images
+# recompressed and downsampled, duplicate fonts and objects merged, the file linearized.
+# Chosen per request with ?optimize= (default PDF_OPTIMIZE_PRESET); see optimizer.py.
+pdf_optimizer = PdfOptimizer()
+INVALID_PRESET_MESSAGE = f"Unknown optimization preset. Use one of: {', '.join([NO_OPTIMIZATION, *PRESETS])}."
+
+@app.get("/optimizer/stats")
+async def optimizer_stats():
+    return JSONResponse(pdf_optimizer.stats())
+
+def _output_version(input_format, optimize: str, page_range: PageRange | None = None,
+                    output_path: str | None = None) -> str:
+    """
+    Conversion cache version: the converter's, plus the page range and optimization applied to its output.
+    With `output_path`, the converter is the one that actually produced that PDF.
+    """
+    version = converter_engine.version(input_format, output_path)
+    if page_range is not None:
+        version = f"{version}; pages={page_range}"
+    optimization = pdf_optimizer.version(optimize)
+    return f"{version}; {optimization}" if optimization else version
+
+@app.on_event("shutdown")
+def shutdown_converter_engine():
+    converter_engine.shutdown()
+    s3_executor.shutdown(wait=False)
+    auth_executor.shutdown(wait=False)
+
+# -------------------- Previews --------------------
+# Thumbnails of the first pages are stored next to the PDF (see previews.py): made while
+# converting with ?preview=N, or on the first GET /preview/{file_id} for a page, and then
+# served from an in-process cache so document lists never fetch whole PDFs.
+preview_rasterizer = PreviewRasterizer()
+preview_cache = PreviewCache()
+INVALID_PAGE_RANGE_MESSAGE = "Invalid page range. Use pages and spans like 1-3,5."
+
+def _preview_urls(file_id: str, count: int) -> list[str]:
+    return [f"{API_GATEWAY_BASE_PATH}/preview/{file_id}?page={page}" for page in range(1, count + 1)]
+
+async def _publish_previews(file_id: str, pdf_path: str, count: int) -> int:
+    """Renders and stores thumbnails of the first `count` pages; returns how many. Failures are logged, not raised."""
+    try:
+        images = await preview_rasterizer.render(pdf_path, 1, count)
+        for page, body in enumerate(images, start=1):
+            key = preview_key(file_id, page, preview_rasterizer.image_format)
+            await run_s3(s3_client.put_object, Bucket=S3_BUCKET_NAME, Key=key, Body=body,
+                         ContentType=preview_rasterizer.media_type)
+            preview_cache.put(key, body)
+        return len(images)
+    except Exception as e:
+        logger.error(f"Could not publish previews for {file_id}: {e}", exc_info=True)
+        return 0
+
+async def _load_preview(file_id: str, page: int) -> bytes | None:
+    """A stored thumbnail; a missing one is rendered from the PDF and stored. None if there is no such page."""
+    key = preview_key(file_id, page, preview_rasterizer.image_format)
+    try:
+        response = await run_s3(s3_client.get_object, Bucket=S3_BUCKET_NAME, Key=key)
+        return await run_s3(response["Body"].read)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in MISSING_KEY_ERROR_CODES:
+            raise
+    if not preview_rasterizer.available:
+        return None
+    pdf_path = os.path.join(tempfile.gettempdir(), f"preview_{uuid.uuid4()}.pdf")
+    try:
+        try:
+            await run_s3(s3_client.download_file, S3_BUCKET_NAME, f"converted_pdfs/{file_id}.pdf", pdf_path)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in MISSING_KEY_ERROR_CODES:
+                raise
+            return None
+        images = await preview_rasterizer.render(pdf_path, page, page)
+    finally:
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+    if not images:
+        return None
+    await run_s3(s3_client.put_object, Bucket=S3_BUCKET_NAME, Key=key, Body=images[0],
+                 ContentType=preview_rasterizer.media_type)
+    return images[0]
+
+@app.get("/preview/stats")
+async def preview_stats():
+    return JSONResponse({**preview_cache.stats(), **preview_rasterizer.stats()})
 
-# -------------------- LibreOffice Path --------------------
-# Corrected path based on your EFS mount configuration
-LIBREOFFICE_PATH = '/mnt/libreoffice/program/soffice.bin'
-# Path to the Xvfb executable
-XVFB_RUN_PATH = '/mnt/libreoffice/bin/xvfb/xvfb-run'
+@app.get("/preview/{file_id}")
+async def preview_thumbnail(request: Request, file_id: str, page: int = Query(1, ge=1, le=PREVIEW_MAX_PAGES)):
+    if not S3_BUCKET_NAME:
+        logger.error("S3_BUCKET_NAME environment variable not set for preview.")
+        return JSONResponse(
+            {"status": "failed", "message": "Server configuration error: S3 bucket not set."},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    key = preview_key(file_id, page, preview_rasterizer.image_format)
+    try:
+        if not await _owns(request, file_id):
+            return JSONResponse({"error": "Preview not available."}, status_code=status.HTTP_404_NOT_FOUND)
+        entry = await preview_cache.get_or_load(key, lambda: _load_preview(file_id, page))
+    except Exception as e:
+        logger.error(f"An unexpected error occurred loading preview '{key}': {e}", exc_info=True)
+        return JSONResponse({"error": "Could not load the preview."}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if entry is None:
+        return JSONResponse({"error": "Preview not available."}, status_code=status.HTTP_404_NOT_FOUND)
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={PREVIEW_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type=preview_rasterizer.media_type, headers=headers)
+
+# -------------------- Readiness Probe --------------------
+# Dependencies are checked on the first /healthz call, not at import, so a slow RDS
+# or EFS mount never delays a cold start; results are cached (see health.py).
+def _check_database() -> str:
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection error.")
+    try:
+        version = migrations.schema_version(conn.cursor())
+    finally:
+        release_db_connection(conn)
+    if version < migrations.LATEST_VERSION:
+        raise RuntimeError(f"Schema version {version} is behind {migrations.LATEST_VERSION}; run migrations.py.")
+    return f"schema version {version}"
 
-# -------------------- Health Check for LibreOffice --------------------
-try:
-    # First, check if the binary files actually exist
+def _check_converter() -> str:
+    if converter_engine.name == "fake":
+        return "fake converter"
     if not os.path.exists(LIBREOFFICE_PATH):
-        logger.error(f"LibreOffice binary file not found at {LIBREOFFICE_PATH}.")
-        # List the contents of the mounted directory to help with debugging
-        logger.error(f"Contents of /mnt/libreoffice/: {os.listdir('/mnt/libreoffice/')}")
-    
-    if not os.path.exists(XVFB_RUN_PATH):
-        logger.error(f"Xvfb executable not found at {XVFB_RUN_PATH}. Please install the 'xvfb' package.")
-
-    # Then try to run it with Xvfb
-    version_check = subprocess.run(
-        [XVFB_RUN_PATH, LIBREOFFICE_PATH, "--version"],
-        capture_output=True,
-        text=True,
-        check=True
-    )
-    logger.info(f"LibreOffice version: {version_check.stdout.strip()}")
-
-except FileNotFoundError as e:
-    logger.error(f"Required file not found: {e.filename}. Check Lambda Layer or EFS configuration.")
-except subprocess.CalledProcessError as e:
-    logger.error(f"LibreOffice version check failed with exit code {e.returncode}. Stderr: {e.stderr}")
-except Exception as e:
-    logger.error(f"LibreOffice check failed: {e}")
+        raise RuntimeError(f"LibreOffice binary file not found at {LIBREOFFICE_PATH}.")
+    if shutil.which(XVFB_RUN_PATH) is None:
+        raise RuntimeError(f"Xvfb executable not found at {XVFB_RUN_PATH}.")
+    version = converter_engine.version()
+    if version == "unknown":
+        # Do not keep the failed lookup cached; the EFS mount may just be slow.
+        libreoffice_version.cache_clear()
+        raise RuntimeError("LibreOffice version check failed.")
+    return version
+
+readiness_probe = ReadinessProbe({"database": _check_database, "converter": _check_converter})
+
+@app.get("/healthz")
+async def healthz():
+    result = await readiness_probe.check()
+    status_code = status.HTTP_200_OK if result["status"] == "ok" else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(result, status_code=status_code)
+
+# -------------------- Conversion Cache --------------------
+# Identical uploads (same SHA-256 and converter version) reuse the existing PDF.
+conversion_cache = create_conversion_cache()
+
+async def _reuse_cached_pdf(content_hash: str, converter_version: str, pdf_s3_key: str) -> str | None:
+    """
+    On a cache hit, copies the cached PDF to `pdf_s3_key` inside S3, so every conversion owns
+    its own object and history entry; returns the cached key, or None on a miss. An entry
+    whose PDF is gone (e.g. expired by an S3 lifecycle rule) is dropped, so the upload is
+    converted again instead of a 404 later.
+    """
+    cached_pdf_s3_key = await asyncio.to_thread(conversion_cache.get, content_hash, converter_version)
+    if not cached_pdf_s3_key:
+        return None
+    try:
+        await run_s3(s3_client.copy_object, Bucket=S3_BUCKET_NAME, Key=pdf_s3_key,
+                     CopySource={"Bucket": S3_BUCKET_NAME, "Key": cached_pdf_s3_key})
+        return cached_pdf_s3_key
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in MISSING_KEY_ERROR_CODES:
+            raise
+    logger.warning(f"Cached PDF {cached_pdf_s3_key} no longer exists; dropping the cache entry.")
+    await asyncio.to_thread(conversion_cache.invalidate, content_hash, converter_version)
+    return None
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# -------------------- Metrics --------------------
+# Latency histograms for requests, conversion and download stages, converter operations
+# and database queries; also written to CloudWatch as EMF log lines (see metrics.py).
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/summary")
+async def metrics_summary():
+    return JSONResponse(metrics.summary())
+
+@app.on_event("shutdown")
+def flush_metrics():
+    metrics.maybe_flush_emf(force=True)
+
+@app.get("/cache/stats")
+async def conversion_cache_stats():
+    return JSONResponse(conversion_cache.stats())
+
+# -------------------- Conversion History --------------------
+# Every conversion is recorded per user; records are written in batches by a background
+# thread, so /convert never waits on the database for them (see conversions.py).
+conversion_log = create_conversion_log()
+
+async def _owns(request: Request, file_id: str) -> bool:
+    """Downloads, previews and job status are only served to the user who converted the file."""
+    return await asyncio.to_thread(conversion_log.owns, request.state.username, file_id)
+
+async def _owns_batch(request: Request, batch_id: str) -> bool:
+    """Batch zips are only served to the user who created the batch."""
+    return await asyncio.to_thread(conversion_log.owns_batch, request.state.username, batch_id)
+
+@app.on_event("shutdown")
+def flush_conversion_log():
+    conversion_log.shutdown()
+
+@app.get("/conversions")
+async def list_conversions(request: Request, limit: int = Query(CONVERSIONS_PAGE_SIZE, ge=1, le=CONVERSIONS_MAX_PAGE_SIZE),
+                           cursor: str | None = Query(None)):
+    """The signed-in user's conversions, newest first; pass next_cursor back to get the next page."""
+    try:
+        items, next_cursor = await asyncio.to_thread(conversion_log.list_for_user, request.state.username, limit, cursor)
+    except ValueError as e:
+        return JSONResponse({"status": "failed", "message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error listing conversions for '{request.state.username}': {e}", exc_info=True)
+        return JSONResponse({"status": "failed", "message": "Could not load conversions."},
+                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JSONResponse({"conversions": items, "next_cursor": next_cursor})
+
+@app.get("/conversions/stats")
+async def conversion_log_stats():
+    return JSONResponse(conversion_log.stats())
+
+# -------------------- Conversion Jobs --------------------
+# "sync" converts inside the request, "async" enqueues a job and returns immediately.
+CONVERSION_MODE = os.getenv("CONVERSION_MODE", "sync")
+# "inprocess" drains the queue inside this app; "external" leaves it to worker_handler
+# or `python main.py worker`.
+JOB_WORKER_MODE = os.getenv("JOB_WORKER_MODE", "inprocess")
+if JOB_WORKER_MODE not in ("inprocess", "external"):
+    raise ValueError(f"Unknown job worker mode: {JOB_WORKER_MODE}")
+job_queue = create_job_queue()
+if JOB_WORKER_MODE == "external" and job_queue.process_local:
+    # No other process could ever see the queued jobs.
+    raise ValueError("JOB_WORKER_MODE=external needs a shared job queue: set JOB_QUEUE_BACKEND=postgres, "
+                     "or sqs with JOB_QUEUE_URL.")
+worker_stop_event = asyncio.Event()
+worker_task = None
+# How long shutdown waits for running jobs before cancelling them; their rows are requeued
+# by the next worker once JOB_STALE_AFTER has passed.
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "60"))
+
+async def process_conversion_job(job: dict) -> dict:
+    """
+    Converts the input of a queued job and uploads the PDF.
+    Returns per-stage timings in seconds; raises on failure.
+    """
+    timings = {}
+    file_id = job["file_id"]
+    input_path = job.get("input_path")
+    pdf_s3_key = f"converted_pdfs/{file_id}.pdf"
+    page_range = PageRange.parse(job["pages"]) if job.get("pages") else None
+    output_pdf_temp_path = None
+    preview_task = None
+    try:
+        if not input_path or not os.path.exists(input_path):
+            input_path = os.path.join(tempfile.gettempdir(), f"{file_id}.upload")
+            started = time.perf_counter()
+            await run_s3(s3_client.download_file, S3_BUCKET_NAME, job["input_s3_key"], input_path)
+            timings["download"] = round(time.perf_counter() - started, 3)
+        input_format = await asyncio.to_thread(detect_format, input_path, job.get("filename") or "")
+        if input_format is None:
+            raise UnsupportedFormat(UNSUPPORTED_FORMAT_MESSAGE)
+        if not input_path.endswith(input_format.extension):
+            typed_path = os.path.join(tempfile.gettempdir(), f"{file_id}{input_format.extension}")
+            os.rename(input_path, typed_path)
+            input_path = typed_path
+
+        started = time.perf_counter()
+        # The worker's own concurrency bounds queued jobs, so they wait for a slot instead of being turned away.
+        output_pdf_temp_path = await converter_engine.aconvert(input_path, tempfile.gettempdir(), wait=True,
+                                                               input_format=input_format, page_range=page_range)
+        timings["convert"] = round(time.perf_counter() - started, 3)
+        if not os.path.exists(output_pdf_temp_path):
+            raise ConversionError("PDF output file not found after conversion.")
+
+        page_count = asyncio.create_task(asyncio.to_thread(count_pdf_pages, output_pdf_temp_path))
+        optimize = job.get("optimize", NO_OPTIMIZATION)
+        if optimize != NO_OPTIMIZATION:
+            # qpdf hides page objects in object streams; count them while they can still be scanned.
+            await asyncio.wait([page_count])
+            started = time.perf_counter()
+            optimization = await pdf_optimizer.aoptimize(output_pdf_temp_path, optimize)
+            timings["optimize"] = round(time.perf_counter() - started, 3)
+            logger.info(f"Job {file_id} optimized with preset {optimize}: {optimization['bytes_saved']} bytes saved")
+
+        started = time.perf_counter()
+        if job.get("preview"):
+            preview_task = asyncio.create_task(_publish_previews(file_id, output_pdf_temp_path, job["preview"]))
+        await run_s3(s3_client.upload_file, output_pdf_temp_path, S3_BUCKET_NAME, pdf_s3_key)
+        timings["upload"] = round(time.perf_counter() - started, 3)
+        if preview_task is not None:
+            started = time.perf_counter()
+            await preview_task
+            timings["preview"] = round(time.perf_counter() - started, 3)
+        # Clients poll /download while the job runs; drop any cached "missing" result.
+        download_urls.forget(S3_BUCKET_NAME, pdf_s3_key)
+        if job.get("content_hash"):
+            converter_version = await asyncio.to_thread(_output_version, input_format, optimize, page_range,
+                                                        output_pdf_temp_path)
+            await asyncio.to_thread(conversion_cache.put, job["content_hash"], converter_version, pdf_s3_key)
+        conversion_log.record(file_id, status=JOB_COMPLETED, output_size=os.path.getsize(output_pdf_temp_path),
+                              page_count=await page_count, timings=timings)
+        return timings
+    except Exception:
+        conversion_log.record(file_id, status=JOB_FAILED)
+        raise
+    finally:
+        if preview_task is not None and not preview_task.done():
+            await asyncio.gather(preview_task, return_exceptions=True)
+        started = time.perf_counter()
+        for path in (input_path, output_pdf_temp_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        metrics.observe_stages("conversion_stage_seconds", {**timings, "cleanup": time.perf_counter() - started},
+                               mode="async")
+
+@app.on_event("startup")
+async def start_conversion_worker():
+    global worker_task
+    if JOB_WORKER_MODE == "inprocess":
+        worker_task = asyncio.create_task(worker_loop(job_queue, process_conversion_job, stop_event=worker_stop_event))
+
+async def stop_conversion_worker():
+    worker_stop_event.set()
+    if worker_task is None:
+        return
+    try:
+        await asyncio.wait_for(worker_task, JOB_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Conversion worker did not finish within {JOB_SHUTDOWN_TIMEOUT}s; cancelled its jobs.")
+
+# Runs before the other shutdown handlers: running jobs still need the converter, the
+# S3 and default executors and the conversion log.
+app.router.on_shutdown.insert(0, stop_conversion_worker)
+
+def _format_timestamp(value: float | None) -> str | None:
+    if value is None:
+        return None
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).isoformat()
+
+@app.get("/jobs/{file_id}")
+async def get_job_status(request: Request, file_id: str):
+    job = await asyncio.to_thread(job_queue.get, file_id) if await _owns(request, file_id) else None
+    if not job:
+        return JSONResponse({"error": "Job not found."}, status_code=status.HTTP_404_NOT_FOUND)
+    return JSONResponse({
+        "file_id": job["file_id"],
+        "status": job["status"],
+        "created_at": _format_timestamp(job["created_at"]),
+        "started_at": _format_timestamp(job["started_at"]),
+        "finished_at": _format_timestamp(job["finished_at"]),
+        "timings": job["timings"],
+        "error": job["error"],
+    })
 
 # -------------------- PDF Conversion Endpoint --------------------
+async def _finish_archive(archive: S3StreamingUpload, timings: dict):
+    """Completes the archival upload, recording its time; failures are logged separately."""
+    started = time.perf_counter()
+    try:
+        await archive.complete()
+        timings["archive"] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        logger.error(f"Archival upload to s3://{archive.bucket}/{archive.key} failed: {e}", exc_info=True)
+        await archive.abort()
+        raise
+
 @app.post("/convert")
-async def convert_to_pdf(file: UploadFile = File(...)):
+async def convert_to_pdf(request: Request, file: UploadFile = File(...), mode: str = Query(CONVERSION_MODE),
+                         optimize: str = Query(PDF_OPTIMIZE_PRESET), pages: str | None = Query(None),
+                         preview: int = Query(PREVIEW_PAGES, ge=0, le=PREVIEW_MAX_PAGES)):
     if not S3_BUCKET_NAME:
         logger.error("S3_BUCKET_NAME environment variable not set.")
         return JSONResponse(
             {"status": "failed", "message": "Server configuration error: S3 bucket not set."},
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-
-    if not file.filename.lower().endswith(".docx"):
-        logger.warning(f"Received non-DOCX file for conversion: {file.filename}")
-        return JSONResponse(
-            {"status": "failed", "message": "Only .docx files are supported for conversion."},
-            status_code=status.HTTP_400_BAD_REQUEST
-        )
+    if not is_preset(optimize):
+        return JSONResponse({"status": "failed", "message": INVALID_PRESET_MESSAGE},
+                            status_code=status.HTTP_400_BAD_REQUEST)
+    try:
+        page_range = PageRange.parse(pages) if pages else None
+    except ValueError:
+        return JSONResponse({"status": "failed", "message": INVALID_PAGE_RANGE_MESSAGE},
+                            status_code=status.HTTP_400_BAD_REQUEST)
 
     file_id = str(uuid.uuid4())
-    input_docx_temp_path = os.path.join(tempfile.gettempdir(), f"{file_id}.docx")
+    username = request.state.username
+    # The format is detected from the content once the upload is on disk; the archival
+    # copy keeps the extension the client sent.
+    claimed_extension = os.path.splitext(file.filename or "")[1].lower()
+    input_temp_path = os.path.join(tempfile.gettempdir(), f"{file_id}.upload")
     output_pdf_temp_path = os.path.join(tempfile.gettempdir(), f"{file_id}.pdf")
-    docx_s3_key = f"uploads/{file_id}.docx"
+    input_s3_key = f"uploads/{file_id}{claimed_extension if claimed_extension in EXTENSIONS else ''}"
     pdf_s3_key = f"converted_pdfs/{file_id}.pdf"
 
-    original_path_env = os.environ.get('PATH', '')
-    original_home_env = os.environ.get('HOME', '')
-
-    try:
-        os.environ['PATH'] = f"{os.path.dirname(LIBREOFFICE_PATH)}:{original_path_env}"
-        os.environ['HOME'] = tempfile.gettempdir()
-
-        logger.info(f"Saving uploaded DOCX from '{file.filename}' to '{input_docx_temp_path}'")
-        with open(input_docx_temp_path, "wb") as f:
-            f.write(await file.read())
-
-        logger.info(f"Uploading original DOCX to s3://{S3_BUCKET_NAME}/{docx_s3_key}")
-        s3_client.upload_file(input_docx_temp_path, S3_BUCKET_NAME, docx_s3_key)
-
-        logger.info(f"Starting LibreOffice conversion for '{input_docx_temp_path}' to '{output_pdf_temp_path}'")
-        result = subprocess.run(
-            [
-                XVFB_RUN_PATH,
-                LIBREOFFICE_PATH,
-                "--headless",
-                "--nologo",
-                "--convert-to",
-                "pdf",
-                input_docx_temp_path,
-                "--outdir",
-                tempfile.gettempdir()
-            ],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        logger.info(f"LibreOffice stdout: {result.stdout}")
-        logger.info(f"LibreOffice stderr: {result.stderr}")
+    # Set once the in-process worker owns the temp input file.
+    input_handed_off = False
+    # Finishes the archival DOCX upload while LibreOffice runs.
+    archive_task = None
+    # Renders and stores the preview thumbnails while the PDF is uploaded.
+    preview_task = None
+    timings = {}
 
-        if os.path.exists(output_pdf_temp_path):
-            logger.info(f"Uploading converted PDF to s3://{S3_BUCKET_NAME}/{pdf_s3_key}")
-            s3_client.upload_file(output_pdf_temp_path, S3_BUCKET_NAME, pdf_s3_key)
-            return JSONResponse({"status": "completed", "file_id": file_id})
-        else:
+    try:
+        # The upload is copied to disk in fixed-size chunks and the same chunks are
+        # streamed to S3 as the archival copy, so memory use does not grow with file size.
+        logger.info(f"Streaming upload '{file.filename}' to '{input_temp_path}' "
+                    f"and s3://{S3_BUCKET_NAME}/{input_s3_key}")
+        hasher = hashlib.sha256()
+        archive = S3StreamingUpload(s3_client, S3_BUCKET_NAME, input_s3_key, s3_executor)
+        started = time.perf_counter()
+        try:
+            async with aiofiles.open(input_temp_path, "wb") as f:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    if archive.bytes_written + len(chunk) > MAX_UPLOAD_SIZE:
+                        raise UploadTooLarge(f"'{file.filename}' exceeds {MAX_UPLOAD_SIZE} bytes.")
+                    if not archive.bytes_written and sniff_format(chunk, file.filename) is None:
+                        # Stop before streaming the rest of something we cannot convert.
+                        raise UnsupportedFormat(f"'{file.filename}' is not a supported document type.")
+                    hasher.update(chunk)
+                    await f.write(chunk)
+                    await archive.write(chunk)
+            content_hash = hasher.hexdigest()
+            timings["receive"] = round(time.perf_counter() - started, 3)
+
+            started = time.perf_counter()
+            input_format = await asyncio.to_thread(detect_format, input_temp_path, file.filename)
+            if input_format is None:
+                raise UnsupportedFormat(f"'{file.filename}' is not a supported document type.")
+            # LibreOffice chooses its import filter partly by extension.
+            typed_path = os.path.join(tempfile.gettempdir(), f"{file_id}{input_format.extension}")
+            os.rename(input_temp_path, typed_path)
+            input_temp_path = typed_path
+            converter_version = await asyncio.to_thread(_output_version, input_format, optimize, page_range)
+            cached_pdf_s3_key = await _reuse_cached_pdf(content_hash, converter_version, pdf_s3_key)
+            timings["lookup"] = round(time.perf_counter() - started, 3)
+            if cached_pdf_s3_key:
+                logger.info(f"Conversion cache hit for '{file.filename}' ({content_hash}): "
+                            f"copied {cached_pdf_s3_key} to {pdf_s3_key}")
+                await archive.abort()
+                conversion_log.record(file_id, username, filename=file.filename, content_hash=content_hash,
+                                      input_size=archive.bytes_written, status="completed",
+                                      timings={**timings, "cached": True})
+                response = {"status": "completed", "file_id": file_id, "format": input_format.name, "cached": True}
+                if page_range is not None:
+                    response["pages"] = str(page_range)
+                if preview:
+                    # Thumbnails a cached conversion lacks are made on the first GET.
+                    response["previews"] = _preview_urls(file_id, preview)
+                return JSONResponse(response)
+        except BaseException:
+            await archive.abort()
+            raise
+
+        archive_task = asyncio.create_task(_finish_archive(archive, timings))
+
+        if mode == "async":
+            # Remote workers read the input from S3, so the archive must be complete first.
+            await archive_task
+            worker_reads_input = JOB_WORKER_MODE == "inprocess"
+            job = new_job(file_id, file.filename, input_s3_key,
+                          input_temp_path if worker_reads_input else None, content_hash, optimize,
+                          str(page_range) if page_range else None, preview)
+            await asyncio.to_thread(job_queue.enqueue, job)
+            # Only a queued job owns the file; a failed enqueue leaves it to be removed below.
+            input_handed_off = worker_reads_input
+            conversion_log.record(file_id, username, filename=file.filename, content_hash=content_hash,
+                                  input_size=archive.bytes_written, status=JOB_QUEUED, timings=timings)
+            logger.info(f"Queued conversion job {file_id} for '{file.filename}'")
+            return JSONResponse({"status": JOB_QUEUED, "file_id": file_id}, status_code=status.HTTP_202_ACCEPTED)
+
+        started = time.perf_counter()
+        output_pdf_temp_path = await converter_engine.aconvert(input_temp_path, tempfile.gettempdir(),
+                                                               input_format=input_format, page_range=page_range)
+        timings["convert"] = round(time.perf_counter() - started, 3)
+
+        if not os.path.exists(output_pdf_temp_path):
             logger.error(f"PDF output file not found after conversion: '{output_pdf_temp_path}'")
             return JSONResponse(
                 {"status": "failed", "message": "PDF output file not found after conversion."},
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    except subprocess.CalledProcessError as e:
-        logger.error(f"LibreOffice failed: {e.stderr}")
+        # Counting pages overlaps the upload, so the history costs no extra request time.
+        page_count = asyncio.create_task(asyncio.to_thread(count_pdf_pages, output_pdf_temp_path))
+        optimization = None
+        if optimize != NO_OPTIMIZATION:
+            # qpdf hides page objects in object streams; count them while they can still be scanned.
+            await asyncio.wait([page_count])
+            started = time.perf_counter()
+            optimization = await pdf_optimizer.aoptimize(output_pdf_temp_path, optimize)
+            timings["optimize"] = round(time.perf_counter() - started, 3)
+
+        logger.info(f"Uploading converted PDF to s3://{S3_BUCKET_NAME}/{pdf_s3_key}")
+        started = time.perf_counter()
+        if preview:
+            preview_task = asyncio.create_task(_publish_previews(file_id, output_pdf_temp_path, preview))
+        await run_s3(s3_client.upload_file, output_pdf_temp_path, S3_BUCKET_NAME, pdf_s3_key)
+        timings["publish"] = round(time.perf_counter() - started, 3)
+        previews_published = 0
+        if preview_task is not None:
+            started = time.perf_counter()
+            previews_published = await preview_task
+            timings["preview"] = round(time.perf_counter() - started, 3)
+        converter_version = await asyncio.to_thread(_output_version, input_format, optimize, page_range,
+                                                    output_pdf_temp_path)
+        await asyncio.to_thread(conversion_cache.put, content_hash, converter_version, pdf_s3_key)
+        conversion_log.record(file_id, username, filename=file.filename, content_hash=content_hash,
+                              input_size=archive.bytes_written, output_size=os.path.getsize(output_pdf_temp_path),
+                              page_count=await page_count, status="completed", timings=timings)
+
+        # The PDF is already published; an archival failure is reported, not fatal.
+        archive_status = "completed"
+        try:
+            await archive_task
+        except Exception:
+            archive_status = "failed"
+        logger.info(f"Conversion timings for {file_id}: {timings}")
+        response = {"status": "completed", "file_id": file_id, "format": input_format.name,
+                    "archive": archive_status, "timings": timings}
+        if page_range is not None:
+            response["pages"] = str(page_range)
+        if optimization:
+            response["optimization"] = optimization
+        if previews_published:
+            response["previews"] = _preview_urls(file_id, previews_published)
+        return JSONResponse(response)
+
+    except UploadTooLarge as e:
+        logger.warning(f"Rejected oversized upload: {e}")
+        return JSONResponse(
+            {"status": "failed", "message": f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE // (1024 * 1024)} MB."},
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+    except UnsupportedFormat as e:
+        logger.warning(f"Rejected upload: {e}")
+        return JSONResponse(
+            {"status": "failed", "message": UNSUPPORTED_FORMAT_MESSAGE},
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    except InvalidPageRange as e:
+        conversion_log.record(file_id, username, filename=file.filename, status="failed", timings=timings)
+        return JSONResponse({"status": "failed", "message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+    except ConverterBusy as e:
+        conversion_log.record(file_id, username, filename=file.filename, status="failed", timings=timings)
+        return _converter_busy_response(e)
+    except ConversionError as e:
+        logger.error(f"Conversion failed: {e}")
+        conversion_log.record(file_id, username, filename=file.filename, status="failed", timings=timings)
         return JSONResponse(
-            {"status": "failed", "message": f"LibreOffice conversion failed: {e.stderr}"},
+            {"status": "failed", "message": f"Conversion failed: {e}"},
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
     except Exception as e:
         logger.error(f"An error occurred during conversion for file '{file.filename}': {e}", exc_info=True)
+        conversion_log.record(file_id, username, filename=file.filename, status="failed", timings=timings)
         return JSONResponse(
             {"status": "failed", "message": f"An unexpected server error occurred: {str(e)}"},
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
     finally:
-        if os.path.exists(input_docx_temp_path):
-            os.remove(input_docx_temp_path)
-            logger.info(f"Cleaned up '{input_docx_temp_path}'")
+        if archive_task is not None and not archive_task.done():
+            # Keep the archival copy even when the conversion failed.
+            await asyncio.gather(archive_task, return_exceptions=True)
+        if preview_task is not None and not preview_task.done():
+            await asyncio.gather(preview_task, return_exceptions=True)
+        started = time.perf_counter()
+        if not input_handed_off and os.path.exists(input_temp_path):
+            os.remove(input_temp_path)
+            logger.info(f"Cleaned up '{input_temp_path}'")
         if os.path.exists(output_pdf_temp_path):
             os.remove(output_pdf_temp_path)
             logger.info(f"Cleaned up '{output_pdf_temp_path}'")
-        os.environ['PATH'] = original_path_env
-        os.environ['HOME'] = original_home_env
+        metrics.observe_stages("conversion_stage_seconds", {**timings, "cleanup": time.perf_counter() - started},
+                               mode="async" if mode == "async" else "sync")
+
+# -------------------- Batch Conversion Endpoint --------------------
+async def _save_upload(upload: UploadFile, path: str, max_size: int) -> int:
+    """Copies an upload to disk in chunks, raising UploadTooLarge past max_size."""
+    written = 0
+    async with aiofiles.open(path, "wb") as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > max_size:
+                raise UploadTooLarge(f"'{upload.filename}' exceeds {max_size} bytes.")
+            await f.write(chunk)
+    return written
+
+def _hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+@app.post("/convert/batch")
+async def convert_batch(request: Request, files: list[UploadFile] = File(...), zip_output: bool = Query(False),
+                        optimize: str = Query(PDF_OPTIMIZE_PRESET)):
+    """
+    Converts many documents, or the documents inside uploaded ZIP archives; each one is
+    routed by its detected format like a single /convert upload.
+    Documents are converted in chunks of BATCH_CHUNK_SIZE per converter call with at most
+    BATCH_CONVERT_CONCURRENCY calls at once; a failing document does not abort the batch.
+    """
+    if not S3_BUCKET_NAME:
+        logger.error("S3_BUCKET_NAME environment variable not set.")
+        return JSONResponse(
+            {"status": "failed", "message": "Server configuration error: S3 bucket not set."},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    if not is_preset(optimize):
+        return JSONResponse({"status": "failed", "message": INVALID_PRESET_MESSAGE},
+                            status_code=status.HTTP_400_BAD_REQUEST)
+
+    batch_id = str(uuid.uuid4())
+    batch_dir = tempfile.mkdtemp(prefix=f"batch_{batch_id}_")
+    try:
+        # (original filename, path on disk or None, error or None)
+        documents = []
+        for upload in files:
+            try:
+                if upload.filename.lower().endswith(".zip"):
+                    zip_path = os.path.join(batch_dir, f"upload_{len(documents)}.zip")
+                    await _save_upload(upload, zip_path, MAX_BATCH_UPLOAD_SIZE)
+                    documents.extend(await asyncio.to_thread(extract_documents, zip_path, batch_dir, MAX_UPLOAD_SIZE))
+                    os.remove(zip_path)
+                else:
+                    path = os.path.join(batch_dir, f"upload_{len(documents)}")
+                    await _save_upload(upload, path, MAX_UPLOAD_SIZE)
+                    documents.append((upload.filename, path, None))
+            except UploadTooLarge:
+                documents.append((upload.filename, None, "File exceeds the maximum upload size."))
+        if len(documents) > MAX_BATCH_FILES:
+            raise BatchError(f"A batch may contain at most {MAX_BATCH_FILES} documents.")
+
+        results, pending = [], []
+        for filename, path, error in documents:
+            input_format = None if error else await asyncio.to_thread(detect_format, path, filename)
+            if input_format is None:
+                results.append({"filename": filename, "status": "failed", "message": error or UNSUPPORTED_FORMAT_MESSAGE})
+                continue
+            result = {"filename": filename, "file_id": str(uuid.uuid4()), "format": input_format.name}
+            results.append(result)
+            result["input_path"] = os.path.join(batch_dir, f"{result['file_id']}{input_format.extension}")
+            os.rename(path, result["input_path"])
+            result["content_hash"] = await asyncio.to_thread(_hash_file, result["input_path"])
+            result["converter_version"] = await asyncio.to_thread(_output_version, input_format, optimize)
+            if await _reuse_cached_pdf(result["content_hash"], result["converter_version"],
+                                       f"converted_pdfs/{result['file_id']}.pdf"):
+                result.update(status="completed", cached=True)
+            else:
+                pending.append(result)
+
+        # Archival uploads run alongside the conversions.
+        archive_tasks = [
+            asyncio.create_task(run_s3(s3_client.upload_file, result["input_path"], S3_BUCKET_NAME,
+                                       f"uploads/{os.path.basename(result['input_path'])}"))
+            for result in pending
+        ]
+        convert_slots = asyncio.Semaphore(BATCH_CONVERT_CONCURRENCY)
+
+        async def convert_chunk(chunk: list[dict]):
+            async with convert_slots:
+                outputs = await converter_engine.aconvert_many([r["input_path"] for r in chunk], batch_dir)
+            for result in chunk:
+                output = outputs.get(result["input_path"])
+                if isinstance(output, ConverterBusy):
+                    result.update(status="failed", message=str(output), retry_after=output.retry_after)
+                    continue
+                if isinstance(output, Exception) or output is None or not os.path.exists(output):
+                    result.update(status="failed", message=f"Conversion failed: {output}")
+                    continue
+                optimization = await pdf_optimizer.aoptimize(output, optimize)
+                if optimization:
+                    result["bytes_saved"] = optimization["bytes_saved"]
+                pdf_s3_key = f"converted_pdfs/{result['file_id']}.pdf"
+                try:
+                    await run_s3(s3_client.upload_file, output, S3_BUCKET_NAME, pdf_s3_key)
+                    converter_version = await asyncio.to_thread(_output_version, FORMATS[result["format"]], optimize,
+                                                                output_path=output)
+                    await asyncio.to_thread(conversion_cache.put, result["content_hash"], converter_version, pdf_s3_key)
+                    result.update(status="completed", output_path=output)
+                except Exception as e:
+                    logger.error(f"Failed to upload PDF for '{result['filename']}': {e}", exc_info=True)
+                    result.update(status="failed", message="Failed to store the converted PDF.")
+
+        await asyncio.gather(*(convert_chunk(chunk) for chunk in chunked(pending, BATCH_CHUNK_SIZE)))
+        for result, outcome in zip(pending, await asyncio.gather(*archive_tasks, return_exceptions=True)):
+            result["archive"] = "failed" if isinstance(outcome, Exception) else "completed"
+            if isinstance(outcome, Exception):
+                logger.error(f"Archival upload for '{result['filename']}' failed: {outcome}")
+        for result in results:
+            if "file_id" in result:
+                conversion_log.record(result["file_id"], request.state.username, filename=result["filename"],
+                                      content_hash=result["content_hash"], input_size=os.path.getsize(result["input_path"]),
+                                      output_size=os.path.getsize(result["output_path"]) if result.get("output_path") else None,
+                                      status=result["status"], timings={"cached": True} if result.get("cached") else None)
+
+        completed = [r for r in results if r["status"] == "completed"]
+        response = {
+            "status": "completed" if len(completed) == len(results) else ("partial" if completed else "failed"),
+            "batch_id": batch_id,
+            "files": [{k: v for k, v in r.items() if k not in ("input_path", "output_path", "content_hash", "converter_version")}
+                      for r in results],
+        }
+
+        if zip_output and completed:
+            entries = []
+            for result in completed:
+                pdf_path = result.get("output_path")
+                if not pdf_path:
+                    # Cache hits have no local PDF yet.
+                    pdf_path = os.path.join(batch_dir, f"{result['file_id']}.pdf")
+                    await run_s3(s3_client.download_file, S3_BUCKET_NAME, f"converted_pdfs/{result['file_id']}.pdf", pdf_path)
+                entries.append((f"{os.path.splitext(result['filename'])[0]}.pdf", pdf_path))
+            zip_path = os.path.join(batch_dir, f"{batch_id}.zip")
+            await asyncio.to_thread(build_zip, entries, zip_path)
+            await asyncio.to_thread(conversion_log.record_batch, request.state.username, batch_id)
+            await run_s3(s3_client.upload_file, zip_path, S3_BUCKET_NAME, f"converted_pdfs/batches/{batch_id}.zip")
+            response["zip_download"] = f"{API_GATEWAY_BASE_PATH}/download/batch/{batch_id}"
+
+        logger.info(f"Batch {batch_id}: {len(completed)}/{len(results)} documents converted")
+        return JSONResponse(response)
+
+    except BatchError as e:
+        logger.warning(f"Rejected batch {batch_id}: {e}")
+        return JSONResponse({"status": "failed", "message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"An error occurred during batch conversion {batch_id}: {e}", exc_info=True)
+        return JSONResponse(
+            {"status": "failed", "message": f"An unexpected server error occurred: {str(e)}"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
 
 # -------------------- Download PDF --------------------
+# Presigned URLs are cached per S3 key for most of their lifetime, and the object is
+# checked with a cached HEAD first so missing files get a 404 (see downloads.py).
+download_urls = PresignedUrlCache()
+# "redirect" (303 to S3) or "stream" (proxied through the app with Range/304 support);
+# clients can override it per request with ?mode=.
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "redirect")
+
+def _single_etag(value: str | None) -> str | None:
+    return value.strip() if value and "," not in value and value.strip() != "*" else None
+
+async def _stream_download(request: Request, s3_key: str, filename: str, media_type: str):
+    """
+    Proxies an S3 object in chunks. Honours a single Range (206), If-Range, If-None-Match
+    and If-Modified-Since (304); other requests get the whole object with ETag and
+    Last-Modified so the next view can revalidate instead of downloading again.
+    """
+    download = S3StreamingDownload(s3_client, S3_BUCKET_NAME, s3_key, s3_executor)
+    byte_range = single_byte_range(request.headers.get("range"))
+    if_range = request.headers.get("if-range")
+    try:
+        if byte_range and if_range:
+            # A range is only served if the client's partial copy is still current.
+            with metrics.span("download_stage_seconds", stage="if_range_head"):
+                head = await run_s3(s3_client.head_object, Bucket=S3_BUCKET_NAME, Key=s3_key)
+            if if_range not in (head["ETag"], http_date(head["LastModified"])):
+                byte_range = None
+        with metrics.span("download_stage_seconds", stage="open"):
+            meta = await download.open(byte_range, request.headers.get("if-none-match"),
+                                       parse_http_date(request.headers.get("if-modified-since")))
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code in ("304", "NotModified"):
+            headers = {"Cache-Control": "private, no-cache"}
+            etag = _single_etag(request.headers.get("if-none-match"))
+            if etag:
+                headers["ETag"] = etag
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if code in MISSING_KEY_ERROR_CODES:
+            logger.warning(f"Download request for non-existent file: {s3_key}")
+            return JSONResponse(
+                {"error": "File not found. It may have been deleted or never existed."},
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        if code == "InvalidRange":
+            head = await run_s3(s3_client.head_object, Bucket=S3_BUCKET_NAME, Key=s3_key)
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            headers={"Content-Range": f"bytes */{head['ContentLength']}"})
+        raise
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(meta["ContentLength"]),
+        "ETag": meta["ETag"],
+        "Last-Modified": http_date(meta["LastModified"]),
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f'inline; filename="{filename}"',
+    }
+    status_code = status.HTTP_200_OK
+    if meta.get("ContentRange"):
+        headers["Content-Range"] = meta["ContentRange"]
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+    # close() also runs as a background task in case the client disconnects mid-stream.
+    return StreamingResponse(download, status_code=status_code, media_type=media_type, headers=headers,
+                             background=BackgroundTask(_close_download, download, time.perf_counter()))
+
+async def _close_download(download: S3StreamingDownload, started: float):
+    await download.close()
+    metrics.observe("download_stage_seconds", time.perf_counter() - started, stage="transfer")
+
+@app.get("/download/stats")
+async def download_url_stats():
+    return JSONResponse(download_urls.stats())
+
 @app.get("/download/{file_id}")
-async def download_pdf(file_id: str):
+async def download_pdf(request: Request, file_id: str, mode: str = Query(DOWNLOAD_MODE)):
     if not S3_BUCKET_NAME:
         logger.error("S3_BUCKET_NAME environment variable not set for download.")
         return JSONResponse(
@@ -167,20 +954,24 @@ async def download_pdf(file_id: str):
     pdf_s3_key = f"converted_pdfs/{file_id}.pdf"
 
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET_NAME, 'Key': pdf_s3_key},
-            ExpiresIn=300
-        )
-        logger.info(f"Generated presigned URL for s3://{S3_BUCKET_NAME}/{pdf_s3_key}")
-        return RedirectResponse(presigned_url, status_code=status.HTTP_303_SEE_OTHER)
-    except s3_client.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchKey':
+        if not await _owns(request, file_id):
+            logger.warning(f"Download request for a file not owned by '{request.state.username}': {file_id}")
+            return JSONResponse(
+                {"error": "File not found. It may have been deleted or never existed."},
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        if mode == "stream":
+            return await _stream_download(request, pdf_s3_key, f"{file_id}.pdf", "application/pdf")
+        with metrics.span("download_stage_seconds", stage="presign"):
+            presigned_url = await run_s3(download_urls.get, s3_client, S3_BUCKET_NAME, pdf_s3_key)
+        if presigned_url is None:
             logger.warning(f"Download request for non-existent file: {pdf_s3_key}")
             return JSONResponse(
                 {"error": "File not found. It may have been deleted or never existed."},
                 status_code=status.HTTP_404_NOT_FOUND
             )
+        return RedirectResponse(presigned_url, status_code=status.HTTP_303_SEE_OTHER)
+    except ClientError as e:
         logger.error(f"Error generating presigned URL for '{pdf_s3_key}': {e}", exc_info=True)
         return JSONResponse(
             {"error": "Could not generate download link due to an S3 error."},
@@ -193,52 +984,148 @@ async def download_pdf(file_id: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@app.get("/download/batch/{batch_id}")
+async def download_batch_zip(request: Request, batch_id: str, mode: str = Query(DOWNLOAD_MODE)):
+    if not S3_BUCKET_NAME:
+        logger.error("S3_BUCKET_NAME environment variable not set for download.")
+        return JSONResponse(
+            {"status": "failed", "message": "Server configuration error: S3 bucket not set."},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    zip_s3_key = f"converted_pdfs/batches/{batch_id}.zip"
+    try:
+        if not await _owns_batch(request, batch_id):
+            logger.warning(f"Batch download request for a batch not owned by '{request.state.username}': {batch_id}")
+            return JSONResponse(
+                {"error": "File not found. It may have been deleted or never existed."},
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        if mode == "stream":
+            return await _stream_download(request, zip_s3_key, f"{batch_id}.zip", "application/zip")
+        with metrics.span("download_stage_seconds", stage="presign"):
+            presigned_url = await run_s3(download_urls.get, s3_client, S3_BUCKET_NAME, zip_s3_key)
+        if presigned_url is None:
+            return JSONResponse(
+                {"error": "File not found. It may have been deleted or never existed."},
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        return RedirectResponse(presigned_url, status_code=status.HTTP_303_SEE_OTHER)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during batch download for '{batch_id}': {e}", exc_info=True)
+        return JSONResponse(
+            {"error": "An unexpected server error occurred during download."},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 # -------------------- Authentication & Dashboard Endpoints --------------------
+# Per-username/per-IP rate limits and a short-lived cache of verified logins (see login_guard.py).
+login_guard = LoginGuard()
+
+@app.get("/auth/stats")
+async def auth_stats():
+    return JSONResponse({**login_guard.stats(), "hashing": hash_stats()})
+
 @app.get("/register", response_class=HTMLResponse)
 async def register_form(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request, "root_path": API_GATEWAY_BASE_PATH})
+    return static_pages.response("register.html", API_GATEWAY_BASE_PATH, request.headers.get("if-none-match"),
+                                    request.headers.get("accept-encoding"))
 
 @app.post("/register")
 async def register_user(request: Request, username: str = Form(...), email: str = Form(...), password: str = Form(...)):
-    success, message = create_user(username, email, password)
+    success, message = await run_auth(create_user, username, email, password)
     if success:
         return RedirectResponse(request.url_for("login_form").include_query_params(message="registration_success"), status_code=status.HTTP_303_SEE_OTHER)
-    return templates.TemplateResponse("register.html", {"request": request, "error": message})
+    return templates.TemplateResponse("register.html", {"request": request, "error": message, "root_path": API_GATEWAY_BASE_PATH})
 
 @app.get("/", response_class=HTMLResponse, name="login_form")
 async def login_form(request: Request):
     message = request.query_params.get("message")
     error = request.query_params.get("error")
+    if not message and not error:
+        return static_pages.response("login.html", API_GATEWAY_BASE_PATH, request.headers.get("if-none-match"),
+                                    request.headers.get("accept-encoding"))
     return templates.TemplateResponse("login.html", {"request": request, "message": message, "error": error, "root_path": API_GATEWAY_BASE_PATH})
 
 @app.post("/", response_class=HTMLResponse)
 async def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    if verify_user(username, password):
+    # Rate limits are checked before any database or hashing work.
+    retry_after = login_guard.admit(username, request.client.host if request.client else None)
+    if retry_after:
+        retry_after = int(retry_after) + 1
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": f"Too many login attempts. Try again in {retry_after} seconds.", "root_path": API_GATEWAY_BASE_PATH},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(retry_after)}
+        )
+    authenticated = login_guard.is_cached(username, password)
+    if not authenticated and await run_auth(verify_user, username, password):
+        # Only fresh verifications are cached, so an entry never outlives LOGIN_CACHE_TTL.
+        login_guard.remember(username, password)
+        authenticated = True
+    if authenticated:
         # Use request.url_for to get the correct URL with the root_path
-        redirect_url = f"{API_GATEWAY_BASE_PATH}/dashboard?username={username}"
-        return RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
+        redirect_url = f"{API_GATEWAY_BASE_PATH}/dashboard"
+        response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
+        response.set_cookie(SESSION_COOKIE_NAME, issue_session(username), max_age=SESSION_TTL, httponly=True,
+                            secure=SESSION_COOKIE_SECURE, samesite="lax", path="/")
+        return response
         # return RedirectResponse(request.url_for("dashboard", username=username), status_code=status.HTTP_303_SEE_OTHER)
     return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid username or password", "root_path": API_GATEWAY_BASE_PATH})
 
 @app.get("/forgot_password", response_class=HTMLResponse)
 async def forgot_password_page(request: Request):
     error = request.query_params.get("error")
+    if not error:
+        return static_pages.response("forgot_password.html", API_GATEWAY_BASE_PATH, request.headers.get("if-none-match"),
+                                    request.headers.get("accept-encoding"))
     return templates.TemplateResponse("forgot_password.html", {"request": request, "error": error, "root_path": API_GATEWAY_BASE_PATH})
 
 @app.post("/reset_password_direct")
 async def reset_password_direct(request: Request, username_or_email: str = Form(...), new_password: str = Form(...), confirm_new_password: str = Form(...)):
     if new_password != confirm_new_password:
         return templates.TemplateResponse("forgot_password.html", {"request": request, "error": "Passwords do not match.", "root_path": API_GATEWAY_BASE_PATH})
-    success, message = update_user_password(username_or_email, new_password)
+    success, message, username = await run_auth(update_user_password, username_or_email, new_password)
     if success:
+        # Drop the cached login so the old password stops working immediately on this instance.
+        login_guard.forget(username)
         return RedirectResponse(request.url_for("login_form").include_query_params(message="password_reset_success"), status_code=status.HTTP_303_SEE_OTHER)
     return templates.TemplateResponse("forgot_password.html", {"request": request, "error": message, "root_path": API_GATEWAY_BASE_PATH})
 
+@app.get("/logout")
+async def logout():
+    response = RedirectResponse(f"{API_GATEWAY_BASE_PATH}/", status_code=status.HTTP_303_SEE_OTHER)
+    response.delete_cookie(SESSION_COOKIE_NAME, path="/")
+    return response
+
 @app.get("/dashboard", response_class=HTMLResponse, name="dashboard")
-async def dashboard(request: Request, username: str = Query("Guest")):
-    user = {"username": username}
-    return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "root_path": API_GATEWAY_BASE_PATH})
+async def dashboard(request: Request):
+    # Set by SessionAuthMiddleware from the signed session cookie.
+    user = {"username": request.state.username}
+    return templates.TemplateResponse("dashboard.html", {"request": request, "user": user, "root_path": API_GATEWAY_BASE_PATH,
+                                                         "accepted_extensions": ",".join(supported_extensions())})
 
 # -------------------- Lambda Entry Point --------------------
 # Pass the api_gateway_base_path to Mangum to correctly handle the stage prefix.
-handler = Mangum(app, api_gateway_base_path=API_GATEWAY_BASE_PATH)
+http_handler = Mangum(app, api_gateway_base_path=API_GATEWAY_BASE_PATH)
+
+def handler(event, context):
+    """API Gateway events go to FastAPI; {"action": "migrate"} applies schema migrations at deploy time."""
+    if isinstance(event, dict) and event.get("action") == "migrate":
+        return migrations.handler(event, context)
+    return http_handler(event, context)
+
+# -------------------- Worker Entry Points --------------------
+def worker_handler(event, context):
+    """Lambda entry point for an SQS-triggered conversion worker (JOB_QUEUE_BACKEND=sqs)."""
+    async def drain():
+        for record in event.get("Records", []):
+            job = json.loads(record["body"])
+            job["started_at"] = time.time()
+            await asyncio.to_thread(job_queue.update, job["file_id"], status=JOB_RUNNING, started_at=job["started_at"])
+            await run_job(job_queue, job, process_conversion_job)
+    asyncio.run(drain())
+
+if __name__ == "__main__" and sys.argv[1:] == ["worker"]:
+    # Standalone worker: `python main.py worker` with JOB_QUEUE_BACKEND=postgres or sqs.
+    asyncio.run(worker_loop(job_queue, process_conversion_job))
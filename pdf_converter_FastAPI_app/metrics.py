@@ -0,0 +1,338 @@
+# metrics.py
+import os
+import re
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+import contextlib
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# CloudWatch namespace for the embedded-metric-format (EMF) log lines.
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "PdfConverter")
+# Seconds between EMF flushes, checked at the end of each request (a frozen Lambda runs
+# no background threads); 0 disables EMF output.
+METRICS_EMF_INTERVAL = float(os.getenv("METRICS_EMF_INTERVAL", "60"))
+# Histogram bucket upper bounds in seconds, from sub-millisecond queries to slow conversions.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+HELP = {
+    "http_request_seconds": "Request latency by endpoint, method and status class.",
+    "conversion_stage_seconds": "Time spent in each stage of a conversion request.",
+    "download_stage_seconds": "Time spent in each stage of a download request.",
+    "converter_seconds": "Converter engine operations: instance checkout, startup and document conversion.",
+    "db_query_seconds": "Database round-trips by statement type and table.",
+    "converter_rejections_total": "Conversions turned away by admission control (queue full or queue wait timed out).",
+    "converter_timeouts_total": "Conversions that ran past the job timeout or found no free instance in time.",
+    "converter_kills_total": "Converter process groups killed for breaching the wall-clock or RSS limit.",
+    "converter_formats_total": "Conversions by detected input format and the engine that converted them.",
+    "converter_fallbacks_total": "Inputs an in-process renderer handed to LibreOffice (content it cannot draw).",
+    "pdf_optimize_seconds": "PDF optimization steps (Ghostscript rewrite, qpdf linearization).",
+    "pdf_optimize_failures_total": "PDF optimization steps that failed or timed out; the PDF is kept as converted.",
+    "pdf_optimize_bytes_saved_total": "Bytes removed from converted PDFs by optimization, by preset.",
+    "preview_seconds": "Preview thumbnails: rasterizing pages (pdftoppm or Ghostscript) and encoding them.",
+}
+
+
+# -------------------- Histograms --------------------
+class Histogram:
+    """Fixed-bucket latency histogram. Not thread-safe on its own; MetricsRegistry holds the lock."""
+    __slots__ = ("buckets", "counts", "sum", "count", "min", "max", "emitted", "window_min", "window_max", "window_sum")
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # counts[i] holds observations <= buckets[i]; the last slot is the +Inf overflow.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.min = float("inf")
+        self.max = 0.0
+        # Counts already written as EMF, plus min/max/sum since then.
+        self.emitted = [0] * (len(buckets) + 1)
+        self.window_min = None
+        self.window_max = None
+        self.window_sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.window_sum += value
+        if self.window_min is None or value < self.window_min:
+            self.window_min = value
+        if self.window_max is None or value > self.window_max:
+            self.window_max = value
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimate by linear interpolation inside the bucket holding the q-th observation,
+        clamped to the smallest and largest values seen.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = max(self.buckets[i - 1] if i > 0 else 0.0, self.min)
+                upper = min(self.buckets[i] if i < len(self.buckets) else self.max, self.max)
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+    def _representative(self, i: int) -> float:
+        """Bucket midpoint, kept within the window's min and max."""
+        if i == len(self.buckets):
+            return self.window_max
+        lower = self.buckets[i - 1] if i > 0 else 0.0
+        return min(max((lower + self.buckets[i]) / 2, self.window_min), self.window_max)
+
+    def take_window(self) -> dict | None:
+        """EMF value set (Values/Counts/Min/Max/Sum/Count) for observations since the last call."""
+        values, counts = [], []
+        for i, (total, emitted) in enumerate(zip(self.counts, self.emitted)):
+            if total > emitted:
+                values.append(round(self._representative(i), 6))
+                counts.append(total - emitted)
+        if not counts:
+            return None
+        window = {"Values": values, "Counts": counts, "Min": round(self.window_min, 6), "Max": round(self.window_max, 6),
+                  "Sum": round(self.window_sum, 6), "Count": sum(counts)}
+        self.emitted = list(self.counts)
+        self.window_min = self.window_max = None
+        self.window_sum = 0.0
+        return window
+
+
+class MetricsRegistry:
+    """
+    In-process latency histograms and counters keyed by metric name and labels. Exposed as
+    Prometheus text (/metrics), a JSON summary with p50/p95/p99 (/metrics/summary), and
+    periodic CloudWatch EMF log lines written to stdout.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, emf_interval: float = METRICS_EMF_INTERVAL,
+                 namespace: str = METRICS_NAMESPACE):
+        self.enabled = enabled
+        self.emf_interval = emf_interval
+        self.namespace = namespace
+        self._histograms = {}
+        # (name, labels) -> [total, total at the last EMF flush]
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._last_emf = time.monotonic()
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = [0, 0]
+            counter[0] += amount
+
+    def span(self, name: str, **labels):
+        """Context manager timing the enclosed block (including awaits) into the `name` histogram."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, labels)
+
+    def observe_stages(self, name: str, timings: dict, **labels):
+        """Records a request's per-stage timings dict ({"receive": 0.012, ...}) under a `stage` label."""
+        for stage, seconds in timings.items():
+            if isinstance(seconds, (int, float)) and not isinstance(seconds, bool):
+                self.observe(name, seconds, stage=stage, **labels)
+
+    def summary(self) -> dict:
+        with self._lock:
+            items = sorted(self._histograms.items())
+            rows = [(name, dict(labels), h.count, h.sum, [h.quantile(q) for q in QUANTILES]) for (name, labels), h in items]
+            counters = sorted((key, total) for key, (total, _) in self._counters.items())
+        summary = {}
+        for name, labels, count, total, quantiles in rows:
+            entry = {**labels, "count": count, "sum": round(total, 6)}
+            entry.update({f"p{int(q * 100)}": round(v, 6) for q, v in zip(QUANTILES, quantiles) if v is not None})
+            summary.setdefault(name, []).append(entry)
+        for (name, labels), total in counters:
+            summary.setdefault(name, []).append({**dict(labels), "value": total})
+        return summary
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format (cumulative buckets, _sum and _count per series)."""
+        with self._lock:
+            items = sorted((key, list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items())
+            counters = sorted((key, total) for key, (total, _) in self._counters.items())
+        lines, described = [], set()
+        for (name, labels), counts, total, count, buckets in items:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{name}_sum{suffix} {total}")
+            lines.append(f"{name}_count{suffix} {count}")
+        for (name, labels), total in counters:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+            lines.append(f"{name}{{{label_text}}} {total}" if label_text else f"{name} {total}")
+        return "\n".join(lines) + "\n"
+
+    def emf_documents(self) -> list[dict]:
+        """One EMF document per series with observations (or counter increments) since the previous flush."""
+        timestamp = int(time.time() * 1000)
+        with self._lock:
+            windows = [(name, labels, h.take_window(), "Seconds") for (name, labels), h in self._histograms.items()]
+            for (name, labels), counter in self._counters.items():
+                windows.append((name, labels, counter[0] - counter[1] or None, "Count"))
+                counter[1] = counter[0]
+        documents = []
+        for name, labels, window, unit in windows:
+            if window is None:
+                continue
+            dimensions = [key for key, _ in labels]
+            documents.append({
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [dimensions],
+                        "Metrics": [{"Name": name, "Unit": unit}],
+                    }],
+                },
+                **{key: str(value) for key, value in labels},
+                name: window,
+            })
+        return documents
+
+    def flush_emf(self, stream=None):
+        """Writes pending EMF documents as raw JSON lines; CloudWatch Logs turns them into metrics."""
+        self._last_emf = time.monotonic()
+        stream = stream or sys.stdout
+        for document in self.emf_documents():
+            # Not through logging: the Lambda log format prefix would stop CloudWatch parsing the JSON.
+            stream.write(json.dumps(document, separators=(",", ":")) + "\n")
+        stream.flush()
+
+    def maybe_flush_emf(self, force: bool = False):
+        """Flushes once emf_interval has passed (or now, with `force`), unless EMF output is off."""
+        if not self.enabled or self.emf_interval <= 0:
+            return
+        if force or time.monotonic() - self._last_emf >= self.emf_interval:
+            try:
+                self.flush_emf()
+            except Exception as e:
+                logger.error(f"Failed to write EMF metrics: {e}")
+
+
+class _Span:
+    # A plain class rather than @contextmanager: spans wrap every database query.
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry: MetricsRegistry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = MetricsRegistry()
+
+
+# -------------------- Statement Labels --------------------
+_STATEMENT = re.compile(
+    r"\s*(?:(select|delete)\b.*?\bfrom\s+(\w+)|(insert)\s+into\s+(\w+)|(update)\s+(\w+)"
+    r"|(prepare|execute)\s+(\w+)|(\w+))", re.IGNORECASE | re.DOTALL)
+
+
+def statement_label(query) -> str:
+    """'select users', 'insert conversions', 'execute verify_user_password', ... from an SQL string."""
+    if isinstance(query, bytes):
+        query = query[:300].decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        return "composed"
+    match = _STATEMENT.match(query[:300])
+    if not match:
+        return "other"
+    words = [group for group in match.groups() if group]
+    return " ".join(word.lower() if i == 0 else word for i, word in enumerate(words))
+
+
+# -------------------- Request Metrics Middleware --------------------
+class MetricsMiddleware:
+    """
+    Records http_request_seconds per endpoint function, method and status class, and
+    flushes EMF lines when METRICS_EMF_INTERVAL has passed. The endpoint name (not the
+    raw path) keeps the number of series bounded.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def recording_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            endpoint = scope.get("endpoint")
+            self.registry.observe("http_request_seconds", time.perf_counter() - started,
+                                  endpoint=getattr(endpoint, "__name__", "unmatched"),
+                                  method=scope["method"], status=f"{status_code // 100}xx")
+            self.registry.maybe_flush_emf()
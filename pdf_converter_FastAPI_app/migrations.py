@@ -0,0 +1,210 @@
+# migrations.py
+"""
+Versioned schema migrations, applied once per deploy instead of on every cold start.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # print the applied and latest versions
+
+The deployed Lambda applies them when invoked with {"action": "migrate"}
+(see modules/lambda_function/main.tf). Applied versions are recorded in the
+schema_migrations table; migrations never change once released, new schema
+changes get a new version at the end of MIGRATIONS.
+"""
+import sys
+import logging
+from psycopg2 import Error
+from database import get_db_connection, release_db_connection
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Key for pg_advisory_xact_lock, so concurrent deploys apply each migration once.
+MIGRATIONS_LOCK_ID = 1575001
+
+# -------------------- Migrations --------------------
+# (version, description, statements)
+MIGRATIONS = [
+    (1, "users and password reset tokens", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(255) UNIQUE NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS password_reset_tokens (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR(255) NOT NULL,
+            token VARCHAR(255) UNIQUE NOT NULL,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            used BOOLEAN DEFAULT FALSE
+        )
+        """,
+    ]),
+    # Used by jobs.PostgresJobQueue
+    (2, "conversion jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS conversion_jobs (
+            file_id VARCHAR(36) PRIMARY KEY,
+            filename TEXT NOT NULL,
+            input_s3_key TEXT NOT NULL,
+            input_path TEXT,
+            content_hash VARCHAR(64),
+            status VARCHAR(16) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            started_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE,
+            timings JSONB NOT NULL DEFAULT '{}'::jsonb,
+            error TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversion_jobs_queued ON conversion_jobs (created_at) WHERE status = 'queued'",
+    ]),
+    # Used by conversion_cache.PostgresConversionCache
+    (3, "conversion cache", [
+        """
+        CREATE TABLE IF NOT EXISTS conversion_cache (
+            content_hash VARCHAR(64) NOT NULL,
+            converter_version VARCHAR(255) NOT NULL,
+            pdf_s3_key TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (content_hash, converter_version)
+        )
+        """,
+    ]),
+    # Used by conversions.PostgresConversionLog. Every conversion, cached or not, has its
+    # own file_id; rows are keyed per user.
+    (4, "per-user conversion history", [
+        """
+        CREATE TABLE IF NOT EXISTS conversions (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            file_id VARCHAR(36) NOT NULL,
+            filename TEXT,
+            content_hash VARCHAR(64),
+            input_size BIGINT,
+            output_size BIGINT,
+            page_count INTEGER,
+            status VARCHAR(16) NOT NULL,
+            timings JSONB NOT NULL DEFAULT '{}'::jsonb,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            UNIQUE (user_id, file_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversions_user_created ON conversions (user_id, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_conversions_file_id ON conversions (file_id)",
+    ]),
+    # Used by jobs.PostgresJobQueue: the PDF optimization preset of a queued conversion.
+    (5, "conversion job optimization preset", [
+        "ALTER TABLE conversion_jobs ADD COLUMN IF NOT EXISTS optimize VARCHAR(16) NOT NULL DEFAULT 'none'",
+    ]),
+    # Used by jobs.PostgresJobQueue: page range and preview thumbnails of a queued conversion.
+    (6, "conversion job page range and previews", [
+        "ALTER TABLE conversion_jobs ADD COLUMN IF NOT EXISTS pages TEXT",
+        "ALTER TABLE conversion_jobs ADD COLUMN IF NOT EXISTS preview SMALLINT NOT NULL DEFAULT 0",
+    ]),
+    # Used by conversion_cache.PostgresConversionCache to prune expired entries without a sequential scan.
+    (7, "conversion cache expiry index", [
+        "CREATE INDEX IF NOT EXISTS idx_conversion_cache_created ON conversion_cache (created_at)",
+    ]),
+    # Used by jobs.PostgresJobQueue.requeue_stale to find jobs whose worker died.
+    (8, "running conversion jobs index", [
+        "CREATE INDEX IF NOT EXISTS idx_conversion_jobs_running ON conversion_jobs (started_at) WHERE status = 'running'",
+    ]),
+    # Used by conversions.PostgresConversionLog: who created each batch zip.
+    (9, "batch zip owners", [
+        """
+        CREATE TABLE IF NOT EXISTS conversion_batches (
+            batch_id VARCHAR(36) PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+    )
+    """)
+
+
+def schema_version(cursor) -> int:
+    """Highest applied migration version, 0 when none (or the table does not exist yet)."""
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def migrate(target: int | None = None) -> list[int]:
+    """
+    Applies pending migrations up to `target` (default: all), each in its own transaction.
+    Returns the versions applied by this call; raises on database errors.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Could not establish database connection for migrations.")
+    applied = []
+    try:
+        for version, description, statements in MIGRATIONS:
+            if target is not None and version > target:
+                break
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATIONS_LOCK_ID,))
+            _ensure_migrations_table(cursor)
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cursor.fetchone():
+                conn.commit()
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            conn.commit()
+            applied.append(version)
+            logger.info(f"Applied migration {version}: {description}")
+        return applied
+    except Error as e:
+        logger.error(f"Migration failed: {e}", exc_info=True)
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+
+def current_version() -> int:
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Could not establish database connection.")
+    try:
+        return schema_version(conn.cursor())
+    finally:
+        release_db_connection(conn)
+
+
+def handler(event, context):
+    """Lambda entry point for {"action": "migrate"} invocations made at deploy time."""
+    applied = migrate(event.get("target"))
+    return {"applied": applied, "version": current_version()}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ["--status"]:
+        print(f"Schema version {current_version()} (latest {LATEST_VERSION})")
+    else:
+        applied = migrate()
+        print(f"Applied migrations: {applied or 'none'}; schema version {current_version()}")
@@ -1,5 +1,10 @@
-from sqlalchemy import Column, Integer, String
-from database import Base
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import declarative_base
+
+# The app queries PostgreSQL with psycopg2 and creates tables in migrations.py;
+# these models describe the same schema for tooling and ad-hoc scripts.
+Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
@@ -8,3 +13,24 @@ class User(Base):
     username = Column(String(50), unique=True, index=True, nullable=False)
     email = Column(String(100), unique=True, index=True, nullable=False)
     password = Column(String(255), nullable=False)
+
+class Conversion(Base):
+    __tablename__ = "conversions"
+    __table_args__ = (
+        UniqueConstraint("user_id", "file_id"),
+        Index("idx_conversions_user_created", "user_id", "created_at", "id"),
+        Index("idx_conversions_file_id", "file_id"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    file_id = Column(String(36), nullable=False)
+    filename = Column(Text)
+    content_hash = Column(String(64))
+    input_size = Column(BigInteger)
+    output_size = Column(BigInteger)
+    page_count = Column(Integer)
+    status = Column(String(16), nullable=False)
+    timings = Column(JSONB, nullable=False, server_default="{}")
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
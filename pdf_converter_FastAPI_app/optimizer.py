@@ -0,0 +1,195 @@
+# optimizer.py
+import os
+import shutil
+import asyncio
+import logging
+import functools
+import subprocess
+from converter import ConversionError, _awatch_process
+from metrics import metrics
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Preset applied when /convert is called without ?optimize= ("none", "screen", "print" or "archive").
+PDF_OPTIMIZE_PRESET = os.getenv("PDF_OPTIMIZE_PRESET", "none")
+# Either tool may be missing; its steps are then skipped.
+GHOSTSCRIPT_PATH = os.getenv("GHOSTSCRIPT_PATH") or shutil.which("gs")
+QPDF_PATH = os.getenv("QPDF_PATH") or shutil.which("qpdf")
+PDF_OPTIMIZE_TIMEOUT = float(os.getenv("PDF_OPTIMIZE_TIMEOUT", "120"))
+# 0 = one optimization per CPU; Ghostscript is CPU-bound.
+PDF_OPTIMIZE_CONCURRENCY = int(os.getenv("PDF_OPTIMIZE_CONCURRENCY", "0"))
+
+NO_OPTIMIZATION = "none"
+
+
+class OptimizationPreset:
+    """
+    How far a PDF is rewritten. `image_dpi` is where images are downsampled to (None keeps
+    their resolution), `pdf_settings` the Ghostscript distiller defaults it starts from.
+    """
+    __slots__ = ("name", "pdf_settings", "image_dpi")
+
+    def __init__(self, name: str, pdf_settings: str, image_dpi: int | None):
+        self.name = name
+        self.pdf_settings = pdf_settings
+        self.image_dpi = image_dpi
+
+    def ghostscript_args(self) -> list[str]:
+        args = [f"-dPDFSETTINGS=/{self.pdf_settings}", "-dDetectDuplicateImages=true",
+                "-dCompressFonts=true", "-dSubsetFonts=true"]
+        if self.image_dpi:
+            # Bilevel images keep twice the resolution and are subsampled, so text in scans stays sharp.
+            for kind, dpi, method in (("Color", self.image_dpi, "Bicubic"), ("Gray", self.image_dpi, "Bicubic"),
+                                      ("Mono", self.image_dpi * 2, "Subsample")):
+                args += [f"-dDownsample{kind}Images=true", f"-d{kind}ImageDownsampleType=/{method}",
+                         f"-d{kind}ImageResolution={dpi}", f"-d{kind}ImageDownsampleThreshold=1.5"]
+        else:
+            # Lossless: JPEGs are copied as they are and nothing is downsampled.
+            args += ["-dPassThroughJPEGImages=true", "-dPassThroughJPXImages=true"]
+            for kind in ("Color", "Gray", "Mono"):
+                args.append(f"-dDownsample{kind}Images=false")
+            for kind in ("Color", "Gray"):
+                args += [f"-dAutoFilter{kind}Images=false", f"-d{kind}ImageFilter=/FlateEncode"]
+        return args
+
+
+PRESETS = {preset.name: preset for preset in (
+    OptimizationPreset("screen", "screen", 96),
+    OptimizationPreset("print", "printer", 300),
+    OptimizationPreset("archive", "prepress", None),
+)}
+
+
+def is_preset(name: str) -> bool:
+    return name == NO_OPTIMIZATION or name in PRESETS
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(path: str | None) -> str | None:
+    """`<tool> --version`, run once per process; None if the tool is not installed."""
+    if not path:
+        return None
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=30, check=True)
+        return result.stdout.split("\n")[0].split()[-1] if result.stdout.strip() else "unknown"
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not run '{path} --version': {e}")
+        return None
+
+
+# -------------------- Optimizer --------------------
+class PdfOptimizer:
+    """
+    Rewrites converted PDFs in place: Ghostscript recompresses and downsamples images and
+    merges duplicate fonts and objects, then qpdf packs objects into object streams and
+    linearizes the file for fast web view. A result larger than the input is discarded.
+    """
+
+    def __init__(self, ghostscript_path: str | None = GHOSTSCRIPT_PATH, qpdf_path: str | None = QPDF_PATH,
+                 concurrency: int = PDF_OPTIMIZE_CONCURRENCY):
+        self.ghostscript_path = ghostscript_path if tool_version(ghostscript_path) else None
+        self.qpdf_path = qpdf_path if tool_version(qpdf_path) else None
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self._slots = None
+        self._stats = {"optimized": 0, "kept_original": 0, "failures": 0, "bytes_in": 0, "bytes_saved": 0}
+        if not (self.ghostscript_path or self.qpdf_path):
+            logger.warning("Neither Ghostscript nor qpdf is installed; PDF optimization presets leave PDFs unchanged.")
+
+    def version(self, preset: str) -> str | None:
+        """Part of the conversion cache key: the preset and the tool versions that apply it."""
+        if preset == NO_OPTIMIZATION:
+            return None
+        return (f"optimize={preset} gs={tool_version(self.ghostscript_path)} "
+                f"qpdf={tool_version(self.qpdf_path)}")
+
+    def _steps(self, preset: OptimizationPreset) -> list[tuple[str, list[str]]]:
+        """(name, argv without the file names) for each step available here."""
+        steps = []
+        if self.ghostscript_path:
+            steps.append(("ghostscript", [self.ghostscript_path, "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER",
+                                          "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
+                                          *preset.ghostscript_args()]))
+        if self.qpdf_path:
+            steps.append(("qpdf", [self.qpdf_path, "--linearize", "--object-streams=generate",
+                                   "--compress-streams=y", "--recompress-flate", "--compression-level=9"]))
+        return steps
+
+    @staticmethod
+    def _command(step: str, argv: list[str], input_path: str, output_path: str) -> list[str]:
+        if step == "ghostscript":
+            return [*argv, f"-sOutputFile={output_path}", input_path]
+        return [*argv, input_path, output_path]
+
+    async def _run_step(self, step: str, argv: list[str], input_path: str, output_path: str) -> bool:
+        process = await asyncio.create_subprocess_exec(
+            *self._command(step, argv, input_path, output_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        try:
+            with metrics.span("pdf_optimize_seconds", step=step):
+                _, stderr = await _awatch_process(process, PDF_OPTIMIZE_TIMEOUT, f"{step} on '{input_path}'")
+        except ConversionError as e:
+            logger.warning(f"PDF optimization step {step} failed: {e}")
+            return False
+        # qpdf exits with 3 when it wrote the file but had warnings.
+        success_codes = (0, 3) if step == "qpdf" else (0,)
+        if process.returncode not in success_codes:
+            logger.warning(f"PDF optimization step {step} exited with {process.returncode}: "
+                           f"{stderr.decode(errors='replace').strip()[:500]}")
+            return False
+        return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+
+    async def aoptimize(self, pdf_path: str, preset: str) -> dict | None:
+        """
+        Applies `preset` to the PDF at `pdf_path`, replacing it if the result is smaller.
+        Returns the sizes, bytes saved and steps applied; None for NO_OPTIMIZATION.
+        Failures are logged and leave the PDF as it was.
+        """
+        if preset == NO_OPTIMIZATION:
+            return None
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        original_size = os.path.getsize(pdf_path)
+        stem = os.path.splitext(pdf_path)[0]
+        current, applied, temporaries = pdf_path, [], []
+        async with self._slots:
+            try:
+                for step, argv in self._steps(PRESETS[preset]):
+                    output_path = f"{stem}.{step}.pdf"
+                    temporaries.append(output_path)
+                    if await self._run_step(step, argv, current, output_path):
+                        current = output_path
+                        applied.append(step)
+                    else:
+                        self._stats["failures"] += 1
+                        metrics.increment("pdf_optimize_failures_total", step=step)
+                optimized_size = os.path.getsize(current)
+                if current != pdf_path and optimized_size <= original_size:
+                    os.replace(current, pdf_path)
+                    self._stats["optimized"] += 1
+                else:
+                    optimized_size = original_size
+                    applied = []
+                    self._stats["kept_original"] += 1
+            finally:
+                for path in temporaries:
+                    if os.path.exists(path):
+                        os.remove(path)
+        saved = original_size - optimized_size
+        self._stats["bytes_in"] += original_size
+        self._stats["bytes_saved"] += saved
+        metrics.increment("pdf_optimize_bytes_saved_total", saved, preset=preset)
+        logger.info(f"Optimized '{pdf_path}' with preset {preset} ({', '.join(applied) or 'unchanged'}): "
+                    f"{original_size} -> {optimized_size} bytes")
+        return {"preset": preset, "original_size": original_size, "optimized_size": optimized_size,
+                "bytes_saved": saved, "steps": applied, "linearized": "qpdf" in applied}
+
+    def stats(self) -> dict:
+        return {**self._stats, "ghostscript": tool_version(self.ghostscript_path),
+                "qpdf": tool_version(self.qpdf_path), "concurrency": self.concurrency,
+                "default_preset": PDF_OPTIMIZE_PRESET, "presets": sorted(PRESETS)}
@@ -0,0 +1,212 @@
+# previews.py
+import io
+import os
+import glob
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from converter import ConversionError, _awatch_process
+from optimizer import GHOSTSCRIPT_PATH, tool_version
+from metrics import metrics
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Thumbnails made while converting when /convert is called without ?preview=.
+PREVIEW_PAGES = int(os.getenv("PREVIEW_PAGES", "0"))
+# Highest page a thumbnail is made of, eagerly or on request.
+PREVIEW_MAX_PAGES = int(os.getenv("PREVIEW_MAX_PAGES", "5"))
+# "png" or "webp"; WebP needs Pillow.
+PREVIEW_FORMAT = os.getenv("PREVIEW_FORMAT", "png").lower()
+PREVIEW_WIDTH = int(os.getenv("PREVIEW_WIDTH", "240"))
+PREVIEW_TIMEOUT = float(os.getenv("PREVIEW_TIMEOUT", "30"))
+# pdftoppm (poppler) is preferred; Ghostscript is used without it.
+PDFTOPPM_PATH = os.getenv("PDFTOPPM_PATH") or shutil.which("pdftoppm")
+# In-process cache of thumbnail bytes, in front of S3.
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+PREVIEW_MAX_AGE = int(os.getenv("PREVIEW_MAX_AGE", "86400"))
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+def preview_key(file_id: str, page: int, image_format: str) -> str:
+    """Thumbnails are stored next to the PDF: converted_pdfs/<file_id>.preview-<page>.<format>."""
+    return f"converted_pdfs/{file_id}.preview-{page}.{image_format}"
+
+
+# -------------------- Rasterizer --------------------
+class PreviewRasterizer:
+    """
+    Renders the first pages of a PDF into small thumbnails with pdftoppm or Ghostscript.
+    Pillow, when installed, resizes them to exactly `width` pixels and encodes WebP.
+    """
+
+    def __init__(self, width: int = PREVIEW_WIDTH, image_format: str = PREVIEW_FORMAT,
+                 pdftoppm_path: str | None = PDFTOPPM_PATH, ghostscript_path: str | None = GHOSTSCRIPT_PATH):
+        self.width = width
+        self.pdftoppm_path = pdftoppm_path if pdftoppm_path and os.path.exists(pdftoppm_path) else None
+        self.ghostscript_path = ghostscript_path if tool_version(ghostscript_path) else None
+        self.image_format = image_format if image_format in MEDIA_TYPES else "png"
+        if self.image_format == "webp" and Image is None:
+            logger.warning("PREVIEW_FORMAT=webp needs Pillow; storing PNG previews.")
+            self.image_format = "png"
+        if not self.available:
+            logger.warning("Neither pdftoppm nor Ghostscript is installed; previews are not available.")
+
+    @property
+    def available(self) -> bool:
+        return bool(self.pdftoppm_path or self.ghostscript_path)
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.image_format]
+
+    def _command(self, pdf_path: str, first: int, last: int, prefix: str) -> tuple[str, list[str]]:
+        if self.pdftoppm_path:
+            return "pdftoppm", [self.pdftoppm_path, "-png", "-f", str(first), "-l", str(last),
+                                "-scale-to-x", str(self.width), "-scale-to-y", "-1", pdf_path, prefix]
+        # A Letter-wide page at this resolution is `width` pixels; Pillow evens out other sizes.
+        dpi = max(1, round(self.width * 72 / 612))
+        return "ghostscript", [self.ghostscript_path, "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER", "-sDEVICE=png16m",
+                               f"-dFirstPage={first}", f"-dLastPage={last}", f"-r{dpi}",
+                               "-dTextAlphaBits=4", "-dGraphicsAlphaBits=4", f"-sOutputFile={prefix}-%d.png", pdf_path]
+
+    def _encode(self, path: str) -> bytes:
+        if Image is None:
+            with open(path, "rb") as f:
+                return f.read()
+        with Image.open(path) as image:
+            if image.width != self.width:
+                image = image.resize((self.width, max(1, round(image.height * self.width / image.width))),
+                                     Image.LANCZOS)
+            output = io.BytesIO()
+            if self.image_format == "webp":
+                image.save(output, "WEBP", quality=75, method=4)
+            else:
+                image.save(output, "PNG", optimize=True)
+            return output.getvalue()
+
+    async def render(self, pdf_path: str, first: int, last: int) -> list[bytes]:
+        """Thumbnails of pages first..last; fewer when the document is shorter. ConversionError on failure."""
+        if not self.available:
+            raise ConversionError("No PDF rasterizer (pdftoppm or Ghostscript) is installed.")
+        work_dir = tempfile.mkdtemp(prefix="preview_")
+        try:
+            tool, command = self._command(pdf_path, first, last, os.path.join(work_dir, "page"))
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+            with metrics.span("preview_seconds", operation=tool):
+                _, stderr = await _awatch_process(process, PREVIEW_TIMEOUT, f"previews of '{pdf_path}'")
+            # Both tools fail on a first page past the end, so a short document only yields fewer files.
+            pages = glob.glob(os.path.join(work_dir, "page-*.png"))
+            if process.returncode != 0 and not pages:
+                message = stderr.decode(errors='replace').strip()[:500]
+                logger.warning(f"{tool} could not render previews of '{pdf_path}': {message}")
+                return []
+            # pdftoppm zero-pads the page numbers to the width of the page count.
+            pages.sort(key=lambda path: int(path.rsplit("-", 1)[1][:-4]))
+            with metrics.span("preview_seconds", operation="encode"):
+                return await asyncio.to_thread(lambda: [self._encode(path) for path in pages])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {"rasterizer": "pdftoppm" if self.pdftoppm_path else ("ghostscript" if self.ghostscript_path else None),
+                "format": self.image_format, "width": self.width, "pillow": Image is not None}
+
+
+# -------------------- Preview Cache --------------------
+class PreviewCache:
+    """
+    Per-process LRU of thumbnail bytes keyed by S3 key, bounded by total size, so dashboard
+    lists are answered from memory. Concurrent misses for one key share a single load.
+    """
+
+    def __init__(self, max_bytes: int = PREVIEW_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._counters = {"hits": 0, "misses": 0, "shared_loads": 0, "not_found": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> tuple[bytes, str] | None:
+        """(body, ETag) for a cached thumbnail, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, body: bytes) -> tuple[bytes, str]:
+        entry = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = entry
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return entry
+
+    async def get_or_load(self, key: str, load) -> tuple[bytes, str] | None:
+        """
+        The cached entry, or the result of `await load()` (thumbnail bytes or None), which is
+        then cached. While one request loads a key, others wait for its result.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            self._count("hits")
+            return entry
+        pending = self._loading.get(key)
+        if pending is not None:
+            self._count("shared_loads")
+            return await asyncio.shield(pending)
+        self._count("misses")
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            body = await load()
+            entry = self.put(key, body) if body is not None else None
+            if entry is None:
+                self._count("not_found")
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters see the error; nobody may be waiting, so mark it retrieved.
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters.update(entries=len(self._entries), bytes=self._size, max_bytes=self.max_bytes)
+        lookups = counters["hits"] + counters["misses"] + counters["shared_loads"]
+        counters["hit_ratio"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        return counters
@@ -0,0 +1,733 @@
+# renderers.py
+import os
+import re
+import zlib
+import codecs
+import functools
+import struct
+import logging
+from html.parser import HTMLParser
+from converter import ConverterBackend, ConversionError, InvalidPageRange, PageRange, _output_path_for
+
+try:
+    from PIL import Image, ImageOps, ImageSequence
+except ImportError:
+    Image = None
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Page size ("a4" or "letter"), font size and margins in points for text and HTML;
+# images get a page of their own size.
+RENDER_PAGE_SIZE = os.getenv("RENDER_PAGE_SIZE", "a4").lower()
+RENDER_FONT_SIZE = float(os.getenv("RENDER_FONT_SIZE", "10"))
+RENDER_MARGIN = float(os.getenv("RENDER_MARGIN", "54"))
+# Resolution assumed for images that do not record one (JFIF density, PNG pHYs, Pillow's dpi).
+IMAGE_DEFAULT_DPI = float(os.getenv("IMAGE_DEFAULT_DPI", "96"))
+# Part of the conversion cache key for rendered formats; bump it when the output changes.
+RENDERER_VERSION = "renderers-1"
+
+PAGE_SIZES = {"a4": (595.28, 841.89), "letter": (612.0, 792.0)}
+# PDF viewers reject pages larger than 200 inches.
+MAX_PAGE_POINTS = 14400
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class UnsupportedContent(ConversionError):
+    """Raised by a renderer for input it cannot draw faithfully; the caller falls back to LibreOffice."""
+
+
+# -------------------- PDF Writer --------------------
+class PdfWriter:
+    """
+    Writes a PDF object by object to a binary file, so only the cross-reference
+    offsets stay in memory. Object numbers come from reserve().
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.position = 0
+        # offsets[n] is the file position of object n; object 0 is the free-list head.
+        self.offsets = [None]
+        self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _emit(self, data: bytes):
+        self.f.write(data)
+        self.position += len(data)
+
+    def reserve(self) -> int:
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def write(self, number: int, body: str):
+        self.offsets[number] = self.position
+        self._emit(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+    def write_stream(self, number: int, entries: str, chunks, length: int):
+        """A stream object; `chunks` yields exactly `length` bytes in total."""
+        self.offsets[number] = self.position
+        self._emit(f"{number} 0 obj\n<< {entries} /Length {length} >>\nstream\n".encode("latin-1"))
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            self._emit(chunk)
+        if written != length:
+            raise ConversionError(f"PDF stream {number} has {written} bytes, expected {length}.")
+        self._emit(b"\nendstream\nendobj\n")
+
+    def add(self, body: str) -> int:
+        number = self.reserve()
+        self.write(number, body)
+        return number
+
+    def add_stream(self, entries: str, chunks, length: int) -> int:
+        number = self.reserve()
+        self.write_stream(number, entries, chunks, length)
+        return number
+
+    def finish(self, root: int, info: int | None = None):
+        xref = self.position
+        lines = [f"xref\n0 {len(self.offsets)}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{offset:010d} 00000 n \n" for offset in self.offsets[1:])
+        info_entry = f" /Info {info} 0 R" if info else ""
+        lines.append(f"trailer\n<< /Size {len(self.offsets)} /Root {root} 0 R{info_entry} >>\n"
+                     f"startxref\n{xref}\n%%EOF\n")
+        self._emit("".join(lines).encode("latin-1"))
+
+
+def pdf_string(text: str) -> str:
+    """A PDF literal string for document metadata; characters outside WinAnsi become '?'."""
+    encoded = text.encode("cp1252", errors="replace")
+    escaped = encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    return "(" + escaped.decode("latin-1") + ")"
+
+
+# Standard 14 fonts need no embedding; every viewer has them.
+FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Courier"}
+
+
+class PdfDocument:
+    """
+    Pages written one at a time through a PdfWriter; fonts are the standard 14, WinAnsi-encoded.
+    With a page_range, pages outside it are counted but not written.
+    """
+
+    def __init__(self, f, page_range: PageRange | None = None):
+        self.writer = PdfWriter(f)
+        self.pages = self.writer.reserve()
+        self.kids = []
+        self.page_range = page_range
+        self.page_count = 0
+        self._fonts = {}
+
+    def wants_page(self) -> bool:
+        """Whether the next page is written; renderers skip building pages that are not."""
+        return self.page_range is None or self.page_count + 1 in self.page_range
+
+    def skip_page(self):
+        self.page_count += 1
+
+    @property
+    def complete(self) -> bool:
+        """True once the last page of the range is written; the rest of the input can be skipped."""
+        return self.page_range is not None and self.page_count >= self.page_range.last
+
+    def _font(self, name: str) -> int:
+        if name not in self._fonts:
+            self._fonts[name] = self.writer.add(
+                f"<< /Type /Font /Subtype /Type1 /BaseFont /{FONTS[name]} /Encoding /WinAnsiEncoding >>")
+        return self._fonts[name]
+
+    def add_image(self, entries: str, chunks, length: int) -> int:
+        return self.writer.add_stream(f"/Type /XObject /Subtype /Image {entries}", chunks, length)
+
+    def add_page(self, width: float, height: float, content: bytes, fonts=(), images: dict | None = None):
+        if not self.wants_page():
+            self.skip_page()
+            return
+        self.page_count += 1
+        resources = ""
+        if fonts:
+            resources += "/Font << " + " ".join(f"/{name} {self._font(name)} 0 R" for name in sorted(fonts)) + " >> "
+        if images:
+            resources += "/XObject << " + " ".join(f"/{name} {ref} 0 R" for name, ref in images.items()) + " >> "
+        compressed = zlib.compress(content, 6)
+        contents = self.writer.add_stream("/Filter /FlateDecode", (compressed,), len(compressed))
+        self.kids.append(self.writer.add(
+            f"<< /Type /Page /Parent {self.pages} 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] "
+            f"/Resources << {resources}>> /Contents {contents} 0 R >>"))
+
+    def close(self, title: str | None = None):
+        if not self.kids:
+            raise InvalidPageRange(f"Page range {self.page_range} is past the last page ({self.page_count}).")
+        kids = " ".join(f"{kid} 0 R" for kid in self.kids)
+        self.writer.write(self.pages, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.kids)} >>")
+        title_entry = f" /Title {pdf_string(title)}" if title else ""
+        info = self.writer.add(f"<< /Producer (pdf_converter_app {RENDERER_VERSION}){title_entry} >>")
+        catalog = self.writer.add(f"<< /Type /Catalog /Pages {self.pages} 0 R >>")
+        self.writer.finish(catalog, info)
+
+
+# -------------------- Text Layout --------------------
+# Advance widths (1/1000 em) of printable ASCII from the Adobe AFM files; other
+# WinAnsi characters use the font's average width.
+_HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_HELVETICA_BOLD_WIDTHS = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+_WIDTHS = {"F1": (_HELVETICA_WIDTHS, 556), "F2": (_HELVETICA_BOLD_WIDTHS, 611)}
+
+
+@functools.lru_cache(maxsize=8192)
+def _text_units(text: str, font: str) -> int:
+    widths, default = _WIDTHS[font]
+    total = 0
+    for char in text:
+        code = ord(char) - 32
+        total += widths[code] if 0 <= code < len(widths) else default
+    return total
+
+
+def text_width(text: str, font: str, size: float) -> float:
+    if font not in _WIDTHS:
+        # Courier: every glyph is 600 units wide.
+        return len(text) * 600 * size / 1000
+    # Words repeat, so their widths are cached.
+    return _text_units(text, font) * size / 1000
+
+
+def _encode(text: str) -> bytes:
+    """Text as an escaped WinAnsi string operand; UnsupportedContent if a character has no WinAnsi code."""
+    try:
+        encoded = text.encode("cp1252")
+    except UnicodeEncodeError as e:
+        raise UnsupportedContent(f"Character {text[e.start]!r} is outside the standard PDF fonts.") from e
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class TextFlow:
+    """Lays out lines of text top to bottom, starting a new page whenever one is full."""
+
+    def __init__(self, document: PdfDocument, page_size: str = RENDER_PAGE_SIZE, margin: float = RENDER_MARGIN):
+        self.document = document
+        self.width, self.height = PAGE_SIZES.get(page_size, PAGE_SIZES["a4"])
+        self.margin = margin
+        self.ops = []
+        self.fonts = set()
+        self.y = self.height - margin
+        self.started = False
+
+    def page_break(self):
+        self.document.add_page(self.width, self.height, b"\n".join(self.ops), self.fonts)
+        self.ops, self.fonts = [], set()
+        self.y = self.height - self.margin
+        self.started = False
+
+    def space(self, points: float):
+        if self.started:
+            self.y -= points
+
+    def line(self, text: str, font: str, size: float, indent: float = 0):
+        leading = size * 1.25
+        if self.y - leading < self.margin and (self.started or self.ops):
+            self.page_break()
+        self.y -= leading
+        self.started = True
+        if text:
+            self.fonts.add(font)
+            self.ops.append(b"BT /%s %.2f Tf %.2f %.2f Td (%s) Tj ET" % (
+                font.encode(), size, self.margin + indent, self.y + size * 0.25, _encode(text)))
+
+    def rule(self):
+        self.space(4)
+        self.ops.append(b"0.5 w %.2f %.2f m %.2f %.2f l S" % (
+            self.margin, self.y, self.width - self.margin, self.y))
+        self.space(4)
+
+    def paragraph(self, text: str, font: str = "F1", size: float = RENDER_FONT_SIZE, indent: float = 0):
+        """Word-wrapped text; words wider than the line are broken."""
+        available = self.width - 2 * self.margin - indent
+        space = text_width(" ", font, size)
+        current, current_width = "", 0.0
+        for word in text.split(" "):
+            word_width = text_width(word, font, size)
+            if current and current_width + space + word_width <= available:
+                current, current_width = f"{current} {word}", current_width + space + word_width
+                continue
+            if current:
+                self.line(current, font, size, indent)
+            while word_width > available:
+                cut = max(1, int(len(word) * available / word_width))
+                while cut > 1 and text_width(word[:cut], font, size) > available:
+                    cut -= 1
+                self.line(word[:cut], font, size, indent)
+                word = word[cut:]
+                word_width = text_width(word, font, size)
+            current, current_width = word, word_width
+        self.line(current, font, size, indent)
+
+    def preformatted(self, text: str, size: float = RENDER_FONT_SIZE, indent: float = 0):
+        """One Courier line, hard-wrapped at the right margin."""
+        columns = max(1, int((self.width - 2 * self.margin - indent) / (0.6 * size)))
+        text = text.expandtabs(8)
+        while len(text) > columns:
+            self.line(text[:columns], "F3", size, indent)
+            text = text[columns:]
+        self.line(text, "F3", size, indent)
+
+    def close(self):
+        if self.ops or self.started or not self.document.page_count:
+            self.page_break()
+
+
+def text_encoding(head: bytes) -> str | None:
+    """Encoding for text starting with `head`, or None when the bytes do not look like text."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if not head or b"\0" in head:
+        return None
+    controls = sum(1 for byte in head if byte < 32 and byte not in b"\t\n\r\f")
+    if controls > len(head) // 100:
+        return None
+    try:
+        # Not final: head may end in the middle of a multi-byte character.
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def _open_text(path: str):
+    with open(path, "rb") as f:
+        head = f.read(64 * 1024)
+    encoding = text_encoding(head)
+    if encoding is None:
+        raise UnsupportedContent(f"'{os.path.basename(path)}' is not text.")
+    return open(path, encoding=encoding, errors="strict")
+
+
+class _Renderer(ConverterBackend):
+    """An in-process converter for formats that do not need LibreOffice."""
+
+    def accepts(self, input_path: str, input_format) -> bool:
+        return True
+
+    def version(self) -> str:
+        return RENDERER_VERSION
+
+    def convert(self, input_path: str, output_dir: str, page_range: PageRange | None = None) -> str:
+        output_path = _output_path_for(input_path, output_dir)
+        try:
+            with open(output_path, "wb") as f:
+                self.render(input_path, f, page_range)
+        except UnicodeDecodeError as e:
+            os.remove(output_path)
+            raise UnsupportedContent(f"'{os.path.basename(input_path)}' is not valid {e.encoding}.") from e
+        except BaseException:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        return output_path
+
+    def render(self, input_path: str, f, page_range: PageRange | None = None):
+        raise NotImplementedError
+
+
+# -------------------- Plain Text --------------------
+class TextRenderer(_Renderer):
+    """Plain text in Courier, long lines wrapped, form feeds starting a new page."""
+    name = "text"
+
+    def render(self, input_path: str, f, page_range: PageRange | None = None):
+        document = PdfDocument(f, page_range)
+        flow = TextFlow(document)
+        with _open_text(input_path) as source:
+            for line in source:
+                if document.complete:
+                    break
+                pages = line.rstrip("\r\n").split("\f")
+                for index, part in enumerate(pages):
+                    if index:
+                        flow.page_break()
+                    flow.preformatted(re.sub(r"[\x00-\x08\x0b-\x1f\x7f]", "", part))
+        flow.close()
+        document.close(os.path.basename(input_path))
+
+
+# -------------------- HTML --------------------
+_HEADING_SCALE = {"h1": 2.0, "h2": 1.6, "h3": 1.3, "h4": 1.1, "h5": 1.0, "h6": 1.0}
+_BLOCK_TAGS = {"p", "div", "section", "article", "header", "footer", "main", "nav", "aside", "blockquote",
+               "ul", "ol", "li", "dl", "dt", "dd", "pre", "table", "tr", "figure", "figcaption", "address",
+               "form", "fieldset", *_HEADING_SCALE}
+_INDENT_TAGS = {"ul", "ol", "blockquote", "dd"}
+_SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "object"}
+_VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "area", "base", "col", "embed", "source", "track", "wbr"}
+
+
+class _HtmlFlow(HTMLParser):
+    """
+    Turns HTML into a TextFlow as it is parsed: headings, paragraphs, lists, tables
+    (one row per line) and preformatted text. Styles, scripts and images are left out;
+    images are shown by their alt text.
+    """
+
+    def __init__(self, flow: TextFlow):
+        super().__init__(convert_charrefs=True)
+        self.flow = flow
+        self.open_tags = []
+        self.skipping = 0
+        self.buffer = []
+        self.title = []
+        self.in_title = False
+        self.list_counters = []
+
+    def _style(self) -> tuple[str, float, float, bool]:
+        font, size, preformatted = "F1", RENDER_FONT_SIZE, False
+        for tag in self.open_tags:
+            if tag in _HEADING_SCALE:
+                font, size = "F2", RENDER_FONT_SIZE * _HEADING_SCALE[tag]
+            elif tag == "dt":
+                font = "F2"
+            elif tag == "pre":
+                preformatted = True
+        indent = 18 * sum(1 for tag in self.open_tags if tag in _INDENT_TAGS)
+        return font, size, indent, preformatted
+
+    def flush(self):
+        text = "".join(self.buffer)
+        self.buffer = []
+        font, size, indent, preformatted = self._style()
+        if preformatted:
+            lines = text.split("\n")
+            if lines and not lines[0]:
+                lines = lines[1:]
+            for line in lines:
+                self.flow.preformatted(line, size, indent)
+            return
+        text = text.strip()
+        if text:
+            self.flow.paragraph(text, font, size, indent)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self.skipping += 1
+            return
+        if tag == "title":
+            self.in_title = True
+            return
+        if self.skipping:
+            return
+        if tag == "br":
+            if "pre" in self.open_tags:
+                self.buffer.append("\n")
+            else:
+                self.flush()
+        elif tag == "hr":
+            self.flush()
+            self.flow.rule()
+        elif tag == "img":
+            alt = dict(attrs).get("alt")
+            if alt:
+                self.buffer.append(f" [{alt}] ")
+        elif tag in ("td", "th") and self.buffer:
+            self.buffer.append("    ")
+        if tag in _VOID_TAGS:
+            return
+        if tag in _BLOCK_TAGS:
+            self.flush()
+            if tag in _HEADING_SCALE:
+                self.flow.space(RENDER_FONT_SIZE * _HEADING_SCALE[tag] * 0.6)
+            elif tag in ("p", "pre", "table", "ul", "ol", "blockquote"):
+                self.flow.space(RENDER_FONT_SIZE * 0.5)
+        if tag in ("ul", "ol"):
+            self.list_counters.append(0 if tag == "ol" else None)
+        elif tag == "li":
+            marker = "\u2022 "
+            if self.list_counters and self.list_counters[-1] is not None:
+                self.list_counters[-1] += 1
+                marker = f"{self.list_counters[-1]}. "
+            self.buffer.append(marker)
+        self.open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+            return
+        if tag == "title":
+            self.in_title = False
+            return
+        if self.skipping or tag not in self.open_tags:
+            return
+        if tag in _BLOCK_TAGS:
+            self.flush()
+        # Close everything opened inside it too; browsers do the same for unclosed tags.
+        while self.open_tags:
+            closed = self.open_tags.pop()
+            if closed in ("ul", "ol") and self.list_counters:
+                self.list_counters.pop()
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title.append(data)
+        elif not self.skipping:
+            self.buffer.append(data if "pre" in self.open_tags else re.sub(r"\s+", " ", data))
+
+
+class HtmlRenderer(_Renderer):
+    """HTML as flowing text: headings, paragraphs, lists and tables, without CSS or images."""
+    name = "html"
+
+    def render(self, input_path: str, f, page_range: PageRange | None = None):
+        document = PdfDocument(f, page_range)
+        flow = TextFlow(document)
+        parser = _HtmlFlow(flow)
+        with _open_text(input_path) as source:
+            while not document.complete and (chunk := source.read(64 * 1024)):
+                parser.feed(chunk)
+        parser.close()
+        parser.flush()
+        flow.close()
+        title = re.sub(r"\s+", " ", "".join(parser.title)).strip()
+        document.close(title or os.path.basename(input_path))
+
+
+# -------------------- Images --------------------
+def _file_chunks(path: str, ranges: list[tuple[int, int]]):
+    """Yields the bytes of (offset, length) ranges of a file, in pieces of at most STREAM_CHUNK_SIZE."""
+    with open(path, "rb") as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            while length > 0:
+                chunk = f.read(min(length, STREAM_CHUNK_SIZE))
+                if not chunk:
+                    return
+                length -= len(chunk)
+                yield chunk
+
+
+def _exif_orientation(tiff: bytes) -> int:
+    """The Orientation tag (1-8) from the TIFF structure of an Exif block; 1 when absent."""
+    try:
+        endian = "<" if tiff[:2] == b"II" else ">"
+        ifd = struct.unpack(endian + "I", tiff[4:8])[0]
+        count = struct.unpack(endian + "H", tiff[ifd:ifd + 2])[0]
+        for index in range(count):
+            entry = tiff[ifd + 2 + 12 * index:ifd + 14 + 12 * index]
+            if struct.unpack(endian + "H", entry[:2])[0] == 0x0112:
+                value = struct.unpack(endian + "H", entry[8:10])[0]
+                return value if 1 <= value <= 8 else 1
+    except struct.error:
+        pass
+    return 1
+
+
+def jpeg_info(path: str) -> dict | None:
+    """Size, components, density and orientation from a JPEG's headers; None if it cannot be embedded as is."""
+    info = {"dpi": None, "orientation": 1, "adobe": False}
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            byte = f.read(1)
+            if not byte:
+                return None
+            if byte != b"\xff":
+                continue
+            marker = f.read(1)
+            while marker == b"\xff":
+                marker = f.read(1)
+            if not marker:
+                return None
+            code = marker[0]
+            if code == 0xD8 or code == 0x01 or 0xD0 <= code <= 0xD7:
+                continue
+            if code == 0xDA:
+                # Scan data before any frame header.
+                return None
+            length = struct.unpack(">H", f.read(2))[0]
+            if code in (0xE0, 0xE1, 0xEE) or (0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC)):
+                payload = f.read(length - 2)
+            else:
+                f.seek(length - 2, os.SEEK_CUR)
+                continue
+            if code == 0xE0 and payload[:5] == b"JFIF\0" and len(payload) >= 12:
+                units, density = payload[7], struct.unpack(">H", payload[8:10])[0]
+                if density and units in (1, 2):
+                    info["dpi"] = density if units == 1 else density * 2.54
+            elif code == 0xE1 and payload[:6] == b"Exif\0\0":
+                info["orientation"] = _exif_orientation(payload[6:])
+            elif code == 0xEE and payload[:5] == b"Adobe":
+                info["adobe"] = True
+            elif 0xC0 <= code <= 0xCF:
+                precision = payload[0]
+                info["height"], info["width"] = struct.unpack(">HH", payload[1:5])
+                info["components"] = payload[5]
+                # DCTDecode handles 8-bit baseline and progressive JPEGs with 1, 3 or 4 components.
+                if precision != 8 or info["components"] not in (1, 3, 4) or not info["width"] or not info["height"]:
+                    return None
+                return info
+
+
+def png_info(path: str) -> dict | None:
+    """IHDR, palette, density and IDAT ranges of a PNG; None unless it can be embedded without decoding."""
+    info = {"dpi": None, "palette": None, "idat": []}
+    with open(path, "rb") as f:
+        if f.read(8) != b"\x89PNG\r\n\x1a\n":
+            return None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            length, kind = struct.unpack(">I4s", header)
+            if kind == b"IDAT":
+                info["idat"].append((f.tell(), length))
+                f.seek(length + 4, os.SEEK_CUR)
+                continue
+            if kind == b"IEND":
+                break
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)
+            if kind == b"IHDR":
+                (info["width"], info["height"], info["depth"], info["color_type"],
+                 _, _, interlace) = struct.unpack(">IIBBBBB", data)
+                # Alpha channels and Adam7 interlacing need decoding; PDF's PNG predictors cover the rest.
+                if info["color_type"] not in (0, 2, 3) or info["depth"] > 8 or interlace:
+                    return None
+            elif kind == b"PLTE":
+                info["palette"] = data
+            elif kind == b"tRNS":
+                return None
+            elif kind == b"pHYs" and len(data) == 9:
+                x_ppm, _, unit = struct.unpack(">IIB", data)
+                if unit == 1 and x_ppm:
+                    info["dpi"] = x_ppm * 0.0254
+    if "width" not in info or not info["idat"] or (info["color_type"] == 3 and not info["palette"]):
+        return None
+    return info
+
+
+# Placement of the image's unit square per Exif orientation, for a page of (width, height).
+_ORIENTATION_MATRICES = {
+    1: lambda w, h: (w, 0, 0, h, 0, 0),
+    2: lambda w, h: (-w, 0, 0, h, w, 0),
+    3: lambda w, h: (-w, 0, 0, -h, w, h),
+    4: lambda w, h: (w, 0, 0, -h, 0, h),
+    5: lambda w, h: (0, -h, -w, 0, w, h),
+    6: lambda w, h: (0, -h, w, 0, 0, h),
+    7: lambda w, h: (0, h, w, 0, 0, 0),
+    8: lambda w, h: (0, h, -w, 0, w, 0),
+}
+
+
+def _page_size(width: int, height: int, dpi: float | None) -> tuple[float, float]:
+    if not dpi or not 10 <= dpi <= 2400:
+        dpi = IMAGE_DEFAULT_DPI
+    scale = 72 / dpi
+    scale = min(scale, MAX_PAGE_POINTS / max(width, height))
+    return width * scale, height * scale
+
+
+class ImageRenderer(_Renderer):
+    """
+    One page per image (or frame), sized from the image's resolution. JPEGs and
+    PNGs without transparency are embedded as they are, without decoding; other
+    images need Pillow, and without it they go to LibreOffice.
+    """
+    name = "image"
+
+    def accepts(self, input_path: str, input_format) -> bool:
+        if Image is not None:
+            return True
+        if input_format.name == "jpeg":
+            return jpeg_info(input_path) is not None
+        if input_format.name == "png":
+            return png_info(input_path) is not None
+        return False
+
+    def _place(self, document: PdfDocument, image: int, width: int, height: int, dpi, orientation: int = 1):
+        if orientation >= 5:
+            width, height = height, width
+        page_width, page_height = _page_size(width, height, dpi)
+        matrix = " ".join(f"{value:.4f}" for value in _ORIENTATION_MATRICES[orientation](page_width, page_height))
+        document.add_page(page_width, page_height, f"q {matrix} cm /Im0 Do Q".encode(), images={"Im0": image})
+
+    def render(self, input_path: str, f, page_range: PageRange | None = None):
+        document = PdfDocument(f, page_range)
+        jpeg = jpeg_info(input_path)
+        png = None if jpeg else png_info(input_path)
+        if (jpeg or png) and not document.wants_page():
+            document.skip_page()
+        elif jpeg:
+            color_space = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}[jpeg["components"]]
+            # Adobe CMYK JPEGs store inverted values.
+            decode = " /Decode [1 0 1 0 1 0 1 0]" if jpeg["components"] == 4 and jpeg["adobe"] else ""
+            size = os.path.getsize(input_path)
+            image = document.add_image(
+                f"/Width {jpeg['width']} /Height {jpeg['height']} /ColorSpace {color_space} "
+                f"/BitsPerComponent 8 /Filter /DCTDecode{decode}",
+                _file_chunks(input_path, [(0, size)]), size)
+            self._place(document, image, jpeg["width"], jpeg["height"], jpeg["dpi"], jpeg["orientation"])
+        elif png:
+            colors = 3 if png["color_type"] == 2 else 1
+            if png["color_type"] == 3:
+                entries = len(png["palette"]) // 3
+                color_space = f"[/Indexed /DeviceRGB {entries - 1} <{png['palette'][:entries * 3].hex()}>]"
+            else:
+                color_space = "/DeviceRGB" if colors == 3 else "/DeviceGray"
+            image = document.add_image(
+                f"/Width {png['width']} /Height {png['height']} /ColorSpace {color_space} "
+                f"/BitsPerComponent {png['depth']} /Filter /FlateDecode /DecodeParms << /Predictor 15 "
+                f"/Colors {colors} /BitsPerComponent {png['depth']} /Columns {png['width']} >>",
+                _file_chunks(input_path, png["idat"]), sum(length for _, length in png["idat"]))
+            self._place(document, image, png["width"], png["height"], png["dpi"])
+        elif Image is not None:
+            self._render_decoded(document, input_path)
+        else:
+            raise UnsupportedContent(f"'{os.path.basename(input_path)}' needs Pillow to be rendered in-process.")
+        document.close(os.path.basename(input_path))
+
+    def _render_decoded(self, document: PdfDocument, input_path: str):
+        """Any image Pillow opens: every frame flattened onto white and stored losslessly."""
+        try:
+            source = Image.open(input_path)
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ConversionError(f"Could not read image '{os.path.basename(input_path)}': {e}") from e
+        with source:
+            dpi = source.info.get("dpi", (None,))[0]
+            for frame in ImageSequence.Iterator(source):
+                if document.complete:
+                    break
+                if not document.wants_page():
+                    document.skip_page()
+                    continue
+                frame = ImageOps.exif_transpose(frame)
+                if frame.mode in ("1", "L", "I;16", "I", "F"):
+                    frame, color_space = frame.convert("L"), "/DeviceGray"
+                else:
+                    rgba = frame.convert("RGBA")
+                    frame = Image.new("RGB", rgba.size, "white")
+                    frame.paste(rgba, mask=rgba.getchannel("A"))
+                    color_space = "/DeviceRGB"
+                data = zlib.compress(frame.tobytes(), 6)
+                image = document.add_image(
+                    f"/Width {frame.width} /Height {frame.height} /ColorSpace {color_space} "
+                    f"/BitsPerComponent 8 /Filter /FlateDecode", (data,), len(data))
+                self._place(document, image, frame.width, frame.height, dpi)
@@ -0,0 +1,169 @@
+# sessions.py
+import os
+import json
+import time
+import logging
+import secrets
+import threading
+from jose import jwt, JWTError
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+# Signing keys as "kid:secret" pairs separated by commas. The first key signs new sessions;
+# all listed keys are accepted, so rotating is: prepend the new key, deploy, drop the old
+# one after SESSION_TTL. SESSION_KEYS_FILE (same format, e.g. on EFS) overrides the env var
+# and is re-read every SESSION_KEYS_REFRESH_INTERVAL seconds, so keys rotate without a deploy.
+SESSION_SIGNING_KEYS = os.getenv("SESSION_SIGNING_KEYS", "")
+SESSION_KEYS_FILE = os.getenv("SESSION_KEYS_FILE")
+SESSION_KEYS_REFRESH_INTERVAL = float(os.getenv("SESSION_KEYS_REFRESH_INTERVAL", "300"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_COOKIE_NAME = os.getenv("SESSION_COOKIE_NAME", "session")
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "true").lower() == "true"
+SESSION_ALGORITHM = "HS256"
+
+
+def _parse_keys(spec: str) -> list[tuple[str, str]]:
+    keys = []
+    for entry in spec.replace("\n", ",").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kid, sep, secret = entry.partition(":")
+        if not sep or not kid or not secret:
+            raise ValueError("Session keys must be 'kid:secret' pairs.")
+        keys.append((kid, secret))
+    return keys
+
+
+class KeyRing:
+    """
+    Signing keys held in memory; token validation never touches the disk or network.
+    When backed by a file the keys are loaded on first use and reloaded at most every
+    refresh_interval seconds; a failed reload keeps the previous keys.
+    """
+
+    def __init__(self, spec: str = SESSION_SIGNING_KEYS, path: str | None = SESSION_KEYS_FILE,
+                 refresh_interval: float = SESSION_KEYS_REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._keys = _parse_keys(spec) if spec and not path else []
+
+    def _reload(self):
+        try:
+            with open(self.path) as f:
+                keys = _parse_keys(f.read())
+            if keys:
+                if [kid for kid, _ in keys] != [kid for kid, _ in self._keys]:
+                    logger.info(f"Loaded session signing keys: {[kid for kid, _ in keys]}")
+                self._keys = keys
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load session signing keys from {self.path}: {e}")
+        self._loaded_at = time.monotonic()
+
+    def _current(self) -> list[tuple[str, str]]:
+        if self.path and time.monotonic() - self._loaded_at >= self.refresh_interval:
+            with self._lock:
+                if time.monotonic() - self._loaded_at >= self.refresh_interval:
+                    self._reload()
+        if not self._keys:
+            with self._lock:
+                if not self._keys:
+                    # Sessions then only validate on the process that issued them.
+                    logger.warning("No session signing keys configured; using a random per-process key.")
+                    self._keys = [("ephemeral", secrets.token_urlsafe(32))]
+        return self._keys
+
+    def signing_key(self) -> tuple[str, str]:
+        return self._current()[0]
+
+    def verification_key(self, kid: str) -> str | None:
+        for key_id, secret in self._current():
+            if key_id == kid:
+                return secret
+        return None
+
+
+key_ring = KeyRing()
+
+
+def issue_session(username: str, ttl: int = SESSION_TTL) -> str:
+    """Returns a signed session token for `username`."""
+    kid, secret = key_ring.signing_key()
+    now = int(time.time())
+    claims = {"sub": username, "iat": now, "exp": now + ttl}
+    return jwt.encode(claims, secret, algorithm=SESSION_ALGORITHM, headers={"kid": kid})
+
+
+def session_username(token: str | None) -> str | None:
+    """Returns the username of a valid, unexpired session token, None otherwise."""
+    if not token:
+        return None
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        secret = key_ring.verification_key(kid) if kid else None
+        if secret is None:
+            return None
+        claims = jwt.decode(token, secret, algorithms=[SESSION_ALGORITHM])
+        return claims.get("sub")
+    except JWTError:
+        return None
+
+
+# -------------------- Authentication Middleware --------------------
+def path_matches(path: str, prefixes: tuple[str, ...]) -> bool:
+    """Prefixes match whole path segments: "/convert" matches /convert and /convert/batch, not /converter."""
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in prefixes)
+
+
+class SessionAuthMiddleware:
+    """
+    Requires a valid session cookie for every path except the public ones (exact
+    `public_paths`, or under `public_prefixes`) and stores the username in
+    request.state.username. Runs before the body is read, so anonymous uploads are
+    refused without being received. Page routes redirect to the login page; API routes
+    get a 401 JSON response.
+    """
+
+    def __init__(self, app, public_paths: tuple[str, ...] = (), public_prefixes: tuple[str, ...] = (),
+                 page_prefixes: tuple[str, ...] = (), login_url: str = "/"):
+        self.app = app
+        self.public_paths = frozenset(public_paths)
+        self.public_prefixes = public_prefixes
+        self.page_prefixes = page_prefixes
+        self.login_url = login_url
+
+    def is_public(self, path: str) -> bool:
+        return path in self.public_paths or path_matches(path, self.public_prefixes)
+
+    def _cookie(self, scope) -> str | None:
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                for part in value.decode("latin-1").split(";"):
+                    key, _, token = part.strip().partition("=")
+                    if key == SESSION_COOKIE_NAME:
+                        return token
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.is_public(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        username = session_username(self._cookie(scope))
+        if username:
+            scope.setdefault("state", {})["username"] = username
+            await self.app(scope, receive, send)
+            return
+        if path_matches(scope["path"], self.page_prefixes):
+            headers = [(b"location", self.login_url.encode()), (b"content-length", b"0")]
+            await send({"type": "http.response.start", "status": 303, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        body = json.dumps({"status": "failed", "message": "Authentication required."}).encode()
+        await send({"type": "http.response.start", "status": 401,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,257 @@
+# streaming.py
+import os
+import re
+import json
+import asyncio
+import datetime
+import logging
+import functools
+from email.utils import format_datetime, parsedate_to_datetime
+from collections import deque
+
+# -------------------- Logging --------------------
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# -------------------- Configuration --------------------
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(50 * 1024 * 1024)))
+# S3 requires at least 5 MiB for every part except the last one.
+S3_MULTIPART_PART_SIZE = max(int(os.getenv("S3_MULTIPART_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+S3_MULTIPART_MAX_IN_FLIGHT = int(os.getenv("S3_MULTIPART_MAX_IN_FLIGHT", "2"))
+# Bytes read from S3 per chunk when /download streams instead of redirecting.
+DOWNLOAD_STREAM_CHUNK_SIZE = int(os.getenv("DOWNLOAD_STREAM_CHUNK_SIZE", str(256 * 1024)))
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_SIZE."""
+
+
+# -------------------- S3 Streaming Upload --------------------
+class S3StreamingUpload:
+    """
+    Uploads a stream of chunks to S3 while it is still being received.
+    Chunks are buffered up to one part; full parts go out as a multipart upload with at most
+    max_in_flight parts in the air, so memory stays around part_size * (max_in_flight + 1).
+    Uploads that never fill a part are sent with a single put_object on complete().
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, executor,
+                 part_size: int = S3_MULTIPART_PART_SIZE, max_in_flight: int = S3_MULTIPART_MAX_IN_FLIGHT):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.executor = executor
+        self.part_size = part_size
+        self.max_in_flight = max_in_flight
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self._in_flight = deque()
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _upload_part(self, part_number: int, body: bytes) -> dict:
+        response = await self._call(self.s3_client.upload_part, Bucket=self.bucket, Key=self.key,
+                                    UploadId=self._upload_id, PartNumber=part_number, Body=body)
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    async def _flush_part(self):
+        if self._upload_id is None:
+            response = await self._call(self.s3_client.create_multipart_upload, Bucket=self.bucket, Key=self.key)
+            self._upload_id = response["UploadId"]
+        while len(self._in_flight) >= self.max_in_flight:
+            self._parts.append(await self._in_flight.popleft())
+        body = bytes(self._buffer)
+        self._buffer.clear()
+        part_number = len(self._parts) + len(self._in_flight) + 1
+        self._in_flight.append(asyncio.ensure_future(self._upload_part(part_number, body)))
+
+    async def write(self, chunk: bytes):
+        self._buffer.extend(chunk)
+        self.bytes_written += len(chunk)
+        if len(self._buffer) >= self.part_size:
+            await self._flush_part()
+
+    async def complete(self):
+        if self._upload_id is None:
+            await self._call(self.s3_client.put_object, Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+            self._buffer.clear()
+            return
+        if self._buffer:
+            await self._flush_part()
+        while self._in_flight:
+            self._parts.append(await self._in_flight.popleft())
+        await self._call(self.s3_client.complete_multipart_upload, Bucket=self.bucket, Key=self.key,
+                         UploadId=self._upload_id, MultipartUpload={"Parts": self._parts})
+
+    async def abort(self):
+        self._buffer.clear()
+        while self._in_flight:
+            task = self._in_flight.popleft()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self._upload_id is not None:
+            try:
+                await self._call(self.s3_client.abort_multipart_upload, Bucket=self.bucket, Key=self.key,
+                                 UploadId=self._upload_id)
+            except Exception as e:
+                logger.error(f"Failed to abort multipart upload for s3://{self.bucket}/{self.key}: {e}")
+            self._upload_id = None
+
+
+# -------------------- S3 Streaming Download --------------------
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def single_byte_range(header: str | None) -> str | None:
+    """
+    Returns a Range header S3 accepts ("bytes=a-b", "bytes=a-" or "bytes=-n"), or None
+    for a missing, malformed or multi-range header, which is answered with the full
+    object as RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _BYTE_RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.groups()
+    if start and end and int(end) < int(start):
+        return None
+    return f"bytes={start}-{end}"
+
+
+def http_date(value) -> str:
+    # botocore returns dateutil's tzutc(), which format_datetime(usegmt=True) rejects.
+    return format_datetime(value.astimezone(datetime.timezone.utc), usegmt=True)
+
+
+def parse_http_date(value: str | None):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class S3StreamingDownload:
+    """
+    Reads an S3 object, or one byte range of it, in chunk_size pieces on the given
+    executor, so memory per download stays around one chunk whatever the file size.
+    Range and conditional headers are passed through to GetObject, so S3 does the
+    matching (304 / 412 / 416 surface as botocore ClientErrors from open()).
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, executor, chunk_size: int = DOWNLOAD_STREAM_CHUNK_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.bytes_sent = 0
+        self._body = None
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def open(self, byte_range: str | None = None, if_none_match: str | None = None,
+                   if_modified_since=None) -> dict:
+        """Issues the GetObject call and returns its metadata (ContentLength, ContentRange, ETag, ...)."""
+        params = {"Bucket": self.bucket, "Key": self.key}
+        if byte_range:
+            params["Range"] = byte_range
+        if if_none_match:
+            params["IfNoneMatch"] = if_none_match
+        elif if_modified_since is not None:
+            params["IfModifiedSince"] = if_modified_since
+        response = await self._call(self.s3_client.get_object, **params)
+        self._body = response.pop("Body")
+        return response
+
+    async def __aiter__(self):
+        try:
+            while True:
+                chunk = await self._call(self._body.read, self.chunk_size)
+                if not chunk:
+                    break
+                self.bytes_sent += len(chunk)
+                yield chunk
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._body is not None:
+            body, self._body = self._body, None
+            await self._call(body.close)
+
+
+# -------------------- Request Size Limit --------------------
+class MaxBodySizeMiddleware:
+    """
+    Rejects uploads larger than the limit for their path with 413 before they are buffered:
+    immediately when Content-Length is too large, otherwise as soon as the streamed
+    body crosses the limit. `limits` maps path prefixes to byte limits; the longest
+    matching prefix wins.
+    """
+
+    def __init__(self, app, limits: dict[str, int] | None = None):
+        self.app = app
+        self.limits = sorted((limits or {"/convert": MAX_UPLOAD_SIZE}).items(), key=lambda item: -len(item[0]))
+
+    def _limit_for(self, path: str) -> int | None:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def _reject(self, send, max_size: int):
+        body = json.dumps({
+            "status": "failed",
+            "message": f"File exceeds the maximum upload size of {max_size // (1024 * 1024)} MB."
+        }).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        max_size = self._limit_for(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if max_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_size:
+            logger.warning(f"Rejected upload with Content-Length {content_length.decode()} (limit {max_size})")
+            await self._reject(send, max_size)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    exceeded = True
+                    raise UploadTooLarge(f"Request body exceeded {max_size} bytes.")
+            return message
+
+        async def guarded_send(message):
+            # The app turns the aborted body parse into an error response; replace it with 413.
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded:
+            logger.warning(f"Rejected streamed upload after {received} bytes (limit {max_size})")
+            await self._reject(send, max_size)
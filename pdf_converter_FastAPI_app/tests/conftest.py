@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+# The app's modules import each other by name (as main.py does), so tests run with the
+# app directory on the path, wherever pytest is started from.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,111 @@
+# tests/test_conversions.py
+import stat
+import pytest
+import conversions
+from conversions import InMemoryConversionLog, NullConversionLog, count_pdf_pages, decode_cursor, encode_cursor
+from renderers import TextRenderer
+
+PAGES = 5
+
+
+@pytest.fixture
+def text_pdf(tmp_path):
+    source = tmp_path / "pages.txt"
+    source.write_text("\f".join(f"page {n}" for n in range(1, PAGES + 1)))
+    return TextRenderer().convert(str(source), str(tmp_path))
+
+
+def test_counts_pages_across_chunk_boundaries(monkeypatch, text_pdf):
+    assert count_pdf_pages(text_pdf, qpdf_path=None) == PAGES
+    # Small chunks cut "/Type /Page" in every possible place.
+    for chunk_size in (7, 64, 100, 1000):
+        monkeypatch.setattr(conversions, "PAGE_COUNT_CHUNK_SIZE", chunk_size)
+        assert count_pdf_pages(text_pdf, qpdf_path=None) == PAGES, chunk_size
+
+
+def test_pages_in_object_streams_are_counted_by_qpdf(tmp_path):
+    # What qpdf --object-streams=generate leaves: no "/Type /Page" outside compressed streams.
+    packed = tmp_path / "packed.pdf"
+    packed.write_bytes(b"%PDF-1.5\n1 0 obj<</Type /ObjStm /N 4 /First 20 /Filter /FlateDecode>>stream\nx\x9c\x03\x00"
+                       b"\nendstream endobj\n%%EOF\n")
+    qpdf = tmp_path / "qpdf"
+    qpdf.write_text('#!/bin/sh\n[ "$1" = "--show-npages" ] && echo 12\n')
+    qpdf.chmod(qpdf.stat().st_mode | stat.S_IEXEC)
+
+    assert count_pdf_pages(str(packed), qpdf_path=str(qpdf)) == 12
+    assert count_pdf_pages(str(packed), qpdf_path=None) is None
+
+
+def test_unreadable_pdf_has_no_page_count(tmp_path):
+    assert count_pdf_pages(str(tmp_path / "missing.pdf")) is None
+    empty = tmp_path / "empty.pdf"
+    empty.write_bytes(b"")
+    assert count_pdf_pages(str(empty), qpdf_path=None) is None
+
+
+def _history(rows: int, same_second: bool = False) -> InMemoryConversionLog:
+    """A history as another instance sees it: rows written, nothing remembered in this process."""
+    log = InMemoryConversionLog()
+    records = [{"file_id": f"file-{n}", "username": "alice", "filename": f"doc_{n}.docx", "status": "completed",
+                "created_at": 1000.0 if same_second else 1000.0 + n} for n in range(rows)]
+    log.flush(records + [{"file_id": "other", "username": "bob", "status": "completed", "created_at": 1000.0}])
+    return log
+
+
+@pytest.mark.parametrize("same_second", [False, True])
+def test_keyset_pages_cover_the_history_once_newest_first(same_second):
+    log = _history(23, same_second)
+    seen, cursor, pages = [], None, 0
+    while True:
+        items, cursor = log.list_for_user("alice", 5, cursor)
+        seen += [item["file_id"] for item in items]
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 5
+    assert sorted(seen) == sorted(f"file-{n}" for n in range(23))
+    assert len(set(seen)) == len(seen)
+    if not same_second:
+        assert seen == [f"file-{n}" for n in reversed(range(23))]
+
+
+def test_last_full_page_has_no_next_cursor():
+    log = _history(10)
+    items, cursor = log.list_for_user("alice", 5)
+    items, cursor = log.list_for_user("alice", 5, cursor)
+    assert len(items) == 5 and cursor is None
+
+
+def test_cursors_round_trip_and_reject_garbage():
+    assert decode_cursor(encode_cursor(1234.5678, 42)) == (1234.5678, "42")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_owner_is_served_when_the_history_has_no_row():
+    log = _history(1)
+
+    assert log.owns("alice", "file-0")
+    assert not log.owns("bob", "file-0")
+    # Never written (e.g. a dropped batch): served, and counted.
+    assert log.owns("alice", "lost-file")
+    assert log.stats()["owner_unknown"] == 1
+
+
+def test_records_not_written_yet_are_checked_in_memory():
+    log = InMemoryConversionLog(flush_interval=60)
+    log.record("pending", "alice")
+
+    assert log.owns("alice", "pending")
+    assert not log.owns("bob", "pending")
+    assert log.stats()["owner_lookups"] == 0
+
+
+def test_history_without_storage_refuses_only_files_it_saw_converted_for_someone_else():
+    log = NullConversionLog()
+    log.record("mine", "alice")
+
+    assert log.owns("alice", "mine")
+    assert not log.owns("bob", "mine")
+    assert log.owns("alice", "converted-on-another-instance")
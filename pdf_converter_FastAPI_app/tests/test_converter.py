@@ -0,0 +1,212 @@
+# tests/test_converter.py
+import os
+import asyncio
+import threading
+import pytest
+from converter import (ConversionError, ConversionTimeout, ConverterBackend, ConverterBusy, ConverterPool,
+                       ConverterSupervisor, FakeInstance, ProfilePool, SupervisedBackend)
+from main import _converter_busy_response
+
+CONCURRENCY = 3
+JOB_SECONDS = 0.2
+
+
+class ProfiledFakeBackend(ConverterBackend):
+    """
+    Checks out a profile per conversion the way LibreOfficeCLIBackend does, but converts
+    with a FakeInstance. Records which profiles were held at the same time.
+    """
+    name = "fake"
+
+    def __init__(self, profiles: ProfilePool, delay: float = JOB_SECONDS):
+        self.profiles = profiles
+        self.instance = FakeInstance(0, delay=delay)
+        self.in_use = set()
+        self.overlaps = []
+
+    async def aconvert(self, input_path, output_dir, page_range=None):
+        async with self.profiles.aprofile() as profile_dir:
+            assert profile_dir not in self.in_use
+            self.in_use.add(profile_dir)
+            self.overlaps.append(frozenset(self.in_use))
+            try:
+                return await asyncio.to_thread(self.instance.convert, input_path, output_dir, page_range)
+            finally:
+                self.in_use.discard(profile_dir)
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    pool = ProfilePool(CONCURRENCY, root=str(tmp_path / "profiles"))
+    # Marked as initialized, so no checkout tries to start LibreOffice.
+    for index in range(CONCURRENCY):
+        profile_dir = tmp_path / "profiles" / f"profile_{index}"
+        profile_dir.mkdir(parents=True)
+        (profile_dir / ProfilePool.MARKER).touch()
+    return pool
+
+
+def _inputs(tmp_path, count: int) -> list[str]:
+    paths = []
+    for index in range(count):
+        path = tmp_path / f"doc_{index}.docx"
+        path.write_bytes(b"not really a document")
+        paths.append(str(path))
+    return paths
+
+
+def test_concurrent_jobs_get_distinct_profiles(tmp_path, profiles):
+    engine = ProfiledFakeBackend(profiles)
+    backend = SupervisedBackend(engine, ConverterSupervisor(CONCURRENCY, max_queue=10, queue_timeout=10))
+    inputs = _inputs(tmp_path, CONCURRENCY * 2)
+
+    async def run():
+        return await asyncio.gather(*(backend.aconvert(path, str(tmp_path)) for path in inputs))
+
+    outputs = asyncio.run(run())
+
+    assert all(os.path.exists(path) for path in outputs)
+    assert max(len(held) for held in engine.overlaps) == CONCURRENCY
+    assert profiles.stats()["checkouts"] == len(inputs)
+    assert profiles.stats()["free"] == CONCURRENCY
+
+
+def test_batches_take_one_slot_per_document(tmp_path, profiles):
+    engine = ProfiledFakeBackend(profiles)
+    backend = SupervisedBackend(engine, ConverterSupervisor(CONCURRENCY - 1, max_queue=2, queue_timeout=10))
+    inputs = _inputs(tmp_path, CONCURRENCY * 2)
+
+    for wait in (True, False):
+        engine.overlaps.clear()
+        outputs = asyncio.run(backend.aconvert_many(inputs, str(tmp_path), wait=wait))
+        assert all(isinstance(output, (str, ConverterBusy)) for output in outputs.values())
+        assert max(len(held) for held in engine.overlaps) == CONCURRENCY - 1
+
+
+def _admit(tmp_path, profiles, max_queue: int, queue_timeout: float, jobs: int) -> list:
+    supervisor = ConverterSupervisor(1, max_queue=max_queue, queue_timeout=queue_timeout)
+    backend = SupervisedBackend(ProfiledFakeBackend(profiles), supervisor)
+
+    async def run():
+        tasks = []
+        for path in _inputs(tmp_path, jobs):
+            tasks.append(asyncio.ensure_future(backend.aconvert(path, str(tmp_path))))
+            # Each job reaches the supervisor before the next one arrives.
+            await asyncio.sleep(0.01)
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_full_queue_is_rejected_with_429(tmp_path, profiles):
+    results = _admit(tmp_path, profiles, max_queue=1, queue_timeout=10, jobs=3)
+
+    assert isinstance(results[0], str) and isinstance(results[1], str)
+    busy = results[2]
+    assert isinstance(busy, ConverterBusy) and busy.reason == "queue_full"
+    response = _converter_busy_response(busy)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_queue_timeout_is_rejected_with_503(tmp_path, profiles):
+    results = _admit(tmp_path, profiles, max_queue=5, queue_timeout=JOB_SECONDS / 4, jobs=2)
+
+    assert isinstance(results[0], str)
+    busy = results[1]
+    assert isinstance(busy, ConverterBusy) and busy.reason == "queue_timeout"
+    response = _converter_busy_response(busy)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+class CrashingInstance(FakeInstance):
+    """Dies in the middle of its first conversion, the way soffice.bin does on a bad document."""
+
+    def convert(self, input_path, output_dir, page_range=None):
+        if self.jobs_done == 0 and not getattr(self, "crashed", False):
+            self.crashed = True
+            self.alive = False
+            raise RuntimeError("Binary URP bridge disposed during call")
+        return super().convert(input_path, output_dir, page_range)
+
+
+class Factory:
+    """Builds instances for a ConverterPool and keeps every one it built."""
+
+    def __init__(self, instance_class=FakeInstance, delay: float = 0):
+        self.instance_class = instance_class
+        self.delay = delay
+        self.built = []
+
+    def __call__(self, index: int):
+        instance = self.instance_class(index, delay=self.delay)
+        self.built.append(instance)
+        return instance
+
+
+def test_pool_starts_instances_lazily_and_restarts_dead_ones(tmp_path):
+    factory = Factory()
+    pool = ConverterPool(factory, size=1, max_jobs_per_instance=100, job_timeout=5, checkout_timeout=1)
+    assert not factory.built[0].is_alive()
+
+    pool.convert(_inputs(tmp_path, 1)[0], str(tmp_path))
+    assert factory.built[0].is_alive()
+
+    # Dies while idle; the next checkout starts it again.
+    factory.built[0].alive = False
+    assert os.path.exists(pool.convert(_inputs(tmp_path, 1)[0], str(tmp_path)))
+    assert factory.built[0].is_alive()
+    assert pool.stats()["restarts"] == 1 and pool.stats()["jobs"] == 2
+
+
+def test_pool_recycles_instances_after_max_jobs(tmp_path):
+    factory = Factory()
+    pool = ConverterPool(factory, size=1, max_jobs_per_instance=2, job_timeout=5, checkout_timeout=1)
+    for path in _inputs(tmp_path, 5):
+        pool.convert(path, str(tmp_path))
+
+    assert pool.stats()["recycles"] == 2
+    assert len(factory.built) == 3
+    assert not factory.built[0].is_alive() and not factory.built[1].is_alive()
+
+
+def test_pool_checkout_times_out_when_every_instance_is_busy(tmp_path):
+    pool = ConverterPool(Factory(delay=0.5), size=1, max_jobs_per_instance=100, job_timeout=5, checkout_timeout=0.1)
+    first, second = _inputs(tmp_path, 2)
+    busy = threading.Thread(target=pool.convert, args=(first, str(tmp_path)))
+    busy.start()
+    try:
+        with pytest.raises(ConversionTimeout, match="No converter instance became free"):
+            pool.convert(second, str(tmp_path))
+    finally:
+        busy.join()
+    assert pool.stats()["idle"] == 1
+
+
+def test_pool_recovers_from_a_crash_during_conversion(tmp_path):
+    factory = Factory(CrashingInstance)
+    pool = ConverterPool(factory, size=1, max_jobs_per_instance=100, job_timeout=5, checkout_timeout=1)
+    first, second = _inputs(tmp_path, 2)
+
+    with pytest.raises(ConversionError, match="URP bridge disposed"):
+        pool.convert(first, str(tmp_path))
+    assert pool.stats()["failures"] == 1 and pool.stats()["restarts"] == 1
+
+    assert os.path.exists(pool.convert(second, str(tmp_path)))
+    assert pool.stats()["idle"] == 1
+
+
+def test_pool_replaces_an_instance_that_runs_past_the_job_timeout(tmp_path):
+    factory = Factory(delay=0.5)
+    pool = ConverterPool(factory, size=1, max_jobs_per_instance=100, job_timeout=0.1, checkout_timeout=1,
+                         max_rss_mb=0)
+    first, second = _inputs(tmp_path, 2)
+
+    with pytest.raises(ConversionTimeout):
+        pool.convert(first, str(tmp_path))
+    assert pool.stats()["timeouts"] == 1
+    assert len(factory.built) == 2 and not factory.built[0].is_alive()
+
+    factory.built[1].delay = 0
+    assert os.path.exists(pool.convert(second, str(tmp_path)))
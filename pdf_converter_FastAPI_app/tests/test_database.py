@@ -0,0 +1,134 @@
+# tests/test_database.py
+import functools
+from types import SimpleNamespace
+import pytest
+import database
+from psycopg2 import extensions
+from utils import hash_password
+
+PASSWORD = "Old#Passw0rd"
+NEW_PASSWORD = "New#Passw0rd"
+
+
+class FakeCursor:
+    """Answers the statements database.py sends for logins and password updates."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.users = connection.users
+        self.statements = []
+        self._row = None
+
+    def execute(self, query, vars=None):
+        self.statements.append(query)
+        if not self.connection.autocommit:
+            self.connection.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        if "verify_user_password" in query or query.startswith("SELECT password FROM users"):
+            user = self.users.get(vars[0])
+            self._row = (user["password"],) if user else None
+        elif "UPDATE users SET password" in query:
+            new_hash, match = vars[0], vars[1]
+            user = next((u for u in self.users.values() if u["email"] == match), None) or self.users.get(match)
+            if user:
+                user["password"] = new_hash
+            self._row = (user["email"], user["username"]) if user else None
+        else:
+            raise AssertionError(f"unexpected statement: {query}")
+
+    def fetchone(self):
+        return self._row
+
+
+class FakeConnection:
+    """Keeps the transaction status the way libpq reports it, so ConnectionPool.putconn sees it."""
+
+    def __init__(self, users: dict):
+        self.users = users
+        self.prepared_statements = set()
+        self.cursors = []
+        self.closed = 0
+        self.autocommit = False
+        self.info = SimpleNamespace(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        cursor = CountingFakeCursor(self)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+# The same round-trip counting that CountingCursor and AppConnection use.
+class CountingFakeCursor(database.RoundTripCountingCursor, FakeCursor):
+    pass
+
+
+class CountingFakeConnection(database.RoundTripCountingConnection, FakeConnection):
+    pass
+
+
+class FakeThreadedPool:
+    """Stands in for psycopg2's ThreadedConnectionPool under the real ConnectionPool."""
+
+    def __init__(self, minconn, maxconn, connection=None, **kwargs):
+        self.connection = connection
+
+    def getconn(self):
+        return self.connection
+
+    def putconn(self, conn, close=False):
+        assert not close
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    users = {"alice": {"username": "alice", "email": "alice@example.com", "password": hash_password(PASSWORD)}}
+    conn = CountingFakeConnection(users)
+    # Checkout and release go through the real ConnectionPool, including its rollback of open transactions.
+    monkeypatch.setattr(database.pg_pool, "ThreadedConnectionPool", functools.partial(FakeThreadedPool, connection=conn))
+    monkeypatch.setattr(database, "DB_POOL_ENABLED", True)
+    monkeypatch.setattr(database, "_pool", None)
+    return conn
+
+
+def round_trips(func, *args):
+    before = database.db_round_trip_count()
+    result = func(*args)
+    return result, database.db_round_trip_count() - before
+
+
+def test_login_is_one_round_trip(connection):
+    # The first login on a connection sends PREPARE and EXECUTE together.
+    assert round_trips(database.verify_user, "alice", PASSWORD) == (True, 1)
+    assert connection.cursors[0].statements[0].startswith("PREPARE verify_user_password")
+    assert round_trips(database.verify_user, "alice", PASSWORD) == (True, 1)
+    assert connection.cursors[1].statements == ["EXECUTE verify_user_password (%s)"]
+
+
+def test_failed_login_is_one_round_trip(connection):
+    assert round_trips(database.verify_user, "alice", "Wrong#Passw0rd") == (False, 1)
+    assert round_trips(database.verify_user, "mallory", PASSWORD) == (False, 1)
+
+
+def test_password_reset_is_one_statement_and_a_commit(connection):
+    (success, _, username), count = round_trips(database.update_user_password, "alice@example.com", NEW_PASSWORD)
+    assert success and username == "alice" and count == 2
+    assert len(connection.cursors[0].statements) == 1
+    assert round_trips(database.verify_user, "alice", NEW_PASSWORD) == (True, 1)
+
+
+def test_password_reset_for_unknown_user(connection):
+    (success, _, username), count = round_trips(database.update_user_password, "nobody@example.com", NEW_PASSWORD)
+    assert not success and username is None and count == 2
+
+
+def test_connections_go_back_to_the_pool_without_a_transaction(connection):
+    database.verify_user("alice", PASSWORD)
+    database.update_user_password("alice@example.com", NEW_PASSWORD)
+
+    assert connection.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    assert not connection.autocommit
@@ -0,0 +1,96 @@
+# tests/test_formats.py
+import time
+import asyncio
+from converter import (ConverterBusy, ConverterPool, ConverterSupervisor, FakeInstance, PooledBackend,
+                       SupervisedBackend)
+from formats import FORMATS, FormatRouter
+from renderers import RENDERER_VERSION, UnsupportedContent
+
+RENDER_SECONDS = 0.2
+
+
+class SlowRenderer:
+    """Renders text slowly and remembers how many renders overlapped."""
+    name = "text"
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    def accepts(self, input_path, fmt):
+        return True
+
+    def version(self):
+        return RENDERER_VERSION
+
+    def convert(self, input_path, output_dir, page_range=None):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(RENDER_SECONDS)
+            return FakeInstance(0).convert(input_path, output_dir, page_range)
+        finally:
+            self.running -= 1
+
+
+class RefusingRenderer(SlowRenderer):
+    """Meets content it cannot draw, the way TextRenderer does with text outside Windows-1252."""
+
+    def convert(self, input_path, output_dir, page_range=None):
+        raise UnsupportedContent("needs a font we do not embed")
+
+
+def _router(max_concurrency: int = 2, max_queue: int = 2, renderer=None) -> tuple[FormatRouter, SlowRenderer]:
+    renderer = renderer or SlowRenderer()
+    office = SupervisedBackend(PooledBackend(ConverterPool(FakeInstance), name="fake"), ConverterSupervisor(1))
+    return FormatRouter(office, [renderer], ConverterSupervisor(max_concurrency, max_queue, queue_timeout=10)), renderer
+
+
+def _inputs(tmp_path, count: int) -> list[str]:
+    paths = []
+    for index in range(count):
+        path = tmp_path / f"notes_{index}.txt"
+        path.write_text("some notes")
+        paths.append(str(path))
+    return paths
+
+
+def test_renders_are_admitted_like_office_conversions(tmp_path):
+    router, renderer = _router(max_concurrency=2, max_queue=1)
+
+    async def run():
+        tasks = []
+        for path in _inputs(tmp_path, 4):
+            tasks.append(asyncio.ensure_future(router.aconvert(path, str(tmp_path), input_format=FORMATS["txt"])))
+            # Each render reaches the supervisor before the next one arrives.
+            await asyncio.sleep(0.02)
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert renderer.peak == 2
+    assert sum(isinstance(result, str) for result in results) == 3
+    assert [result.reason for result in results if isinstance(result, ConverterBusy)] == ["queue_full"]
+    assert router.stats()["render_admission"]["rejected_queue_full"] == 1
+
+
+def test_batches_wait_for_render_slots(tmp_path):
+    router, renderer = _router(max_concurrency=2, max_queue=0)
+
+    outputs = asyncio.run(router.aconvert_many(_inputs(tmp_path, 5), str(tmp_path), wait=True))
+
+    assert all(isinstance(output, str) for output in outputs.values())
+    assert renderer.peak == 2
+
+
+def test_version_is_the_engine_that_produced_the_output(tmp_path):
+    rendered, fallen_back = _inputs(tmp_path, 2)
+    router, _ = _router()
+    output = asyncio.run(router.aconvert(rendered, str(tmp_path), input_format=FORMATS["txt"]))
+    assert router.version(FORMATS["txt"], output) == RENDERER_VERSION
+
+    router, _ = _router(renderer=RefusingRenderer())
+    output = asyncio.run(router.aconvert(fallen_back, str(tmp_path), input_format=FORMATS["txt"]))
+    assert router.version(FORMATS["txt"], output) == router.office.version() != RENDERER_VERSION
+    # Before converting, only the format is known.
+    assert router.version(FORMATS["txt"]) == RENDERER_VERSION
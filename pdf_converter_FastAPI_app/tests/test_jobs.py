@@ -0,0 +1,75 @@
+# tests/test_jobs.py
+import asyncio
+import pytest
+import jobs
+from jobs import JOB_COMPLETED, JOB_QUEUED, InMemoryJobQueue, new_job, worker_loop
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.05)
+
+
+class RequeueCountingQueue(InMemoryJobQueue):
+    def __init__(self):
+        super().__init__()
+        self.requeue_calls = []
+
+    def requeue_stale(self, older_than: float) -> int:
+        self.requeue_calls.append(older_than)
+        return 0
+
+
+def _enqueue(job_queue, count: int) -> list[str]:
+    file_ids = []
+    for index in range(count):
+        job = new_job(f"job-{index}", f"doc_{index}.docx", f"uploads/job-{index}.docx")
+        job_queue.enqueue(job)
+        file_ids.append(job["file_id"])
+    return file_ids
+
+
+def test_stop_waits_for_running_jobs_and_starts_no_new_ones():
+    job_queue = InMemoryJobQueue()
+    file_ids = _enqueue(job_queue, 3)
+    started = []
+
+    async def process_job(job):
+        started.append(job["file_id"])
+        await asyncio.sleep(0.3)
+        return {"convert": 0.3}
+
+    async def run():
+        stop_event = asyncio.Event()
+        worker = asyncio.create_task(worker_loop(job_queue, process_job, concurrency=2, stop_event=stop_event))
+        while len(started) < 2:
+            await asyncio.sleep(0.01)
+        stop_event.set()
+        await worker
+
+    asyncio.run(run())
+
+    assert started == file_ids[:2]
+    assert [job_queue.get(file_id)["status"] for file_id in file_ids] == [JOB_COMPLETED, JOB_COMPLETED, JOB_QUEUED]
+
+
+def test_worker_requeues_stale_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_REQUEUE_INTERVAL", 0.1)
+    job_queue = RequeueCountingQueue()
+
+    async def run():
+        stop_event = asyncio.Event()
+        worker = asyncio.create_task(worker_loop(job_queue, None, stop_event=stop_event))
+        await asyncio.sleep(0.35)
+        stop_event.set()
+        await worker
+
+    asyncio.run(run())
+
+    assert len(job_queue.requeue_calls) >= 2
+    assert set(job_queue.requeue_calls) == {jobs.JOB_STALE_AFTER}
+
+
+def test_worker_stops_before_the_executors_are_shut_down():
+    import main
+    assert main.app.router.on_shutdown[0] is main.stop_conversion_worker
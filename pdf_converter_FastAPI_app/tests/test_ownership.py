@@ -0,0 +1,88 @@
+# tests/test_ownership.py
+import os
+import sys
+import asyncio
+import threading
+import boto3
+import httpx
+import pytest
+from botocore.config import Config as BotoConfig
+
+import main
+import sessions
+from conversions import InMemoryConversionLog
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import local_s3  # noqa: E402
+
+BUCKET = "ownership-test"
+NOT_FOUND = {"error": "File not found. It may have been deleted or never existed."}
+
+
+@pytest.fixture(scope="module")
+def s3():
+    server = local_s3.serve("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = boto3.client("s3", endpoint_url=f"http://127.0.0.1:{server.server_port}", region_name="us-east-1",
+                          aws_access_key_id="test", aws_secret_access_key="test",
+                          config=BotoConfig(s3={"addressing_style": "path"}))
+    client.create_bucket(Bucket=BUCKET)
+    yield client
+    server.shutdown()
+
+
+@pytest.fixture
+def app(monkeypatch, s3):
+    monkeypatch.setattr(main, "s3_client", s3)
+    monkeypatch.setattr(main, "S3_BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(main, "conversion_log", InMemoryConversionLog())
+    return main.app
+
+
+def _client(transport, username: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=transport, base_url="http://test",
+                             cookies={sessions.SESSION_COOKIE_NAME: sessions.issue_session(username)})
+
+
+def _run(app, scenario):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with _client(transport, "alice") as alice, _client(transport, "bob") as bob:
+            return await scenario(alice, bob)
+
+    return asyncio.run(run())
+
+
+def test_downloads_and_job_status_are_served_only_to_the_owner(app):
+    async def scenario(alice, bob):
+        response = await alice.post("/convert", files={"file": ("notes.txt", b"alice's notes")})
+        file_id = response.json()["file_id"]
+        results = {}
+        for path in (f"/download/{file_id}", f"/download/{file_id}?mode=stream", f"/jobs/{file_id}"):
+            results[path] = (await alice.get(path), await bob.get(path))
+        return file_id, results
+
+    file_id, results = _run(app, scenario)
+
+    assert results[f"/download/{file_id}"][0].status_code == 303
+    assert results[f"/download/{file_id}?mode=stream"][0].status_code == 200
+    for path, (_, other) in results.items():
+        assert other.status_code == 404, path
+    assert results[f"/download/{file_id}"][1].json() == NOT_FOUND
+
+
+def test_batch_zip_is_served_only_to_its_creator(app):
+    async def scenario(alice, bob):
+        files = [("files", ("a.txt", b"first")), ("files", ("b.txt", b"second"))]
+        batch = (await alice.post("/convert/batch?zip_output=true", files=files)).json()
+        path = f"/download/batch/{batch['batch_id']}"
+        return batch, [(await alice.get(url), await bob.get(url)) for url in (path, f"{path}?mode=stream")]
+
+    batch, results = _run(app, scenario)
+
+    assert batch["status"] == "completed" and batch["zip_download"].endswith(batch["batch_id"])
+    (redirect, other_redirect), (stream, other_stream) = results
+    assert redirect.status_code == 303
+    assert stream.status_code == 200 and stream.content.startswith(b"PK")
+    assert other_redirect.status_code == other_stream.status_code == 404
+    assert other_stream.json() == NOT_FOUND
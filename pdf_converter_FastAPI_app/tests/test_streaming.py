@@ -0,0 +1,80 @@
+# tests/test_streaming.py
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streaming import S3StreamingUpload
+
+PART_SIZE = 64 * 1024
+MAX_IN_FLIGHT = 2
+CHUNK_SIZE = 16 * 1024
+
+
+class SlowS3Client:
+    """
+    Keeps every part it receives. Odd parts take longer than even ones, so parts finish
+    out of order the way concurrent uploads to S3 do.
+    """
+
+    def __init__(self):
+        self.parts = {}
+        self.completed = None
+        self.acknowledged_bytes = 0
+        self._lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        time.sleep(0.02 if PartNumber % 2 else 0.005)
+        with self._lock:
+            self.parts[PartNumber] = Body
+            self.acknowledged_bytes += len(Body)
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload["Parts"]
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        raise AssertionError("upload was aborted")
+
+    def put_object(self, Bucket, Key, Body):
+        raise AssertionError("a multi-part upload must not fall back to put_object")
+
+
+def _upload(data: bytes) -> tuple[SlowS3Client, int]:
+    """Streams `data` in chunks; returns the client and the peak of bytes received but not yet in S3."""
+    client = SlowS3Client()
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            upload = S3StreamingUpload(client, "bucket", "uploads/big.docx", executor,
+                                       part_size=PART_SIZE, max_in_flight=MAX_IN_FLIGHT)
+            peak = 0
+            for offset in range(0, len(data), CHUNK_SIZE):
+                await upload.write(data[offset:offset + CHUNK_SIZE])
+                peak = max(peak, upload.bytes_written - client.acknowledged_bytes)
+            await upload.complete()
+            return peak
+
+    return client, asyncio.run(run())
+
+
+def test_buffered_bytes_stay_bounded():
+    data = os.urandom(PART_SIZE * (MAX_IN_FLIGHT + 1) * 4 + 1234)
+    client, peak = _upload(data)
+
+    assert peak <= PART_SIZE * (MAX_IN_FLIGHT + 1)
+    assert len(client.parts) == len(data) // PART_SIZE + 1
+
+
+def test_parts_are_completed_in_order():
+    data = os.urandom(PART_SIZE * (MAX_IN_FLIGHT + 1) * 3 + 99)
+    client, _ = _upload(data)
+
+    numbers = [part["PartNumber"] for part in client.completed]
+    assert numbers == list(range(1, len(client.parts) + 1))
+    assert [part["ETag"] for part in client.completed] == [f'"etag-{n}"' for n in numbers]
+    assert b"".join(client.parts[n] for n in numbers) == data
@@ -1,11 +1,78 @@
+import os
+import time
+import asyncio
+import functools
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# PBKDF2 work factor. Changing it makes existing hashes "need update", and they are
+# rehashed transparently on the next successful login (see database.verify_user).
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+# Password hashes/verifications allowed to run at once in this process; the rest wait.
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", str(os.cpu_count() or 1)))
+# Threads for auth calls (database lookup + hashing). hashlib's PBKDF2 releases the GIL,
+# so threads hash in parallel; the extra threads cover time spent waiting on the database.
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", str(PASSWORD_HASH_MAX_CONCURRENCY * 2)))
+
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    # Hashes with any other round count are flagged by needs_update / verify_and_update.
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__max_rounds=PASSWORD_HASH_ROUNDS,
+)
+
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_CONCURRENCY)
+_hash_stats_lock = threading.Lock()
+_hash_stats = {"operations": 0, "hash_seconds": 0.0, "wait_seconds": 0.0}
+auth_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+
+@contextlib.contextmanager
+def _hash_slot():
+    """Waits for one of the PASSWORD_HASH_MAX_CONCURRENCY slots and times the work done in it."""
+    requested = time.perf_counter()
+    with _hash_slots:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            with _hash_stats_lock:
+                _hash_stats["operations"] += 1
+                _hash_stats["hash_seconds"] += finished - started
+                _hash_stats["wait_seconds"] += started - requested
+
+def hash_stats() -> dict:
+    """Password hash/verify operations so far, with total time spent hashing and waiting for a slot."""
+    with _hash_stats_lock:
+        stats = dict(_hash_stats)
+    stats["hash_seconds"] = round(stats["hash_seconds"], 3)
+    stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+    stats["avg_hash_ms"] = round(stats["hash_seconds"] * 1000 / stats["operations"], 2) if stats["operations"] else 0.0
+    return stats
 
 def hash_password(password: str) -> str:
     """Hash a plaintext password."""
-    return pwd_context.hash(password)
+    with _hash_slot():
+        return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plaintext password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    with _hash_slot():
+        return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Verify a plaintext password; on success also return a new hash if the stored one
+    uses an outdated work factor (None otherwise).
+    """
+    with _hash_slot():
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def run_auth(func, *args, **kwargs):
+    """Runs a blocking auth call (database + password hashing) on the auth thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(auth_executor, functools.partial(func, *args, **kwargs))
@@ -14,6 +14,12 @@ variable "source_code_hash_layer" {
   type = string
 }
 
+variable "session_signing_keys" {
+  description = "Comma-separated kid:secret pairs used to sign session cookies (set TF_VAR_session_signing_keys)."
+  type        = string
+  sensitive   = true
+}
+
 variable "region" {
   type = string
   default = "us-east-1"